@@ -67,71 +67,146 @@ ipcMain.on("display-files", (event, path) => {
   });
 });
 
-ipcMain.on(
-  "start-benchmark",
-  (
-    event,
-    selectedModel,
-    selectedStrategy,
-    selectedPath,
-    lines
-  ) => {
-    let options = {
-      mode: "text",
-      pythonPath: process.env.PYTHON_PATH,
-      pythonOptions: ["-u"],
-      scriptPath: "./scripts",
-      args: [
-        JSON.stringify({
-          selectedModel,
-          selectedStrategy,
-          selectedPath,
-          lines,
-        }),
-      ],
-    };
-
-    let pyshell = new PythonShell("Combination.py", options);
-
-    pyshell.on("message", function (message) {
-      console.log("PYTHON OUTPUT---------------------------\n", message);
-      event.sender.send("benchmark-data", message);
-    });
-
-    pyshell.end(function (err, code, signal) {
-      if (err) throw err;
-      console.log("The exit code was: " + code);
-      console.log("The exit signal was: " + signal);
-      console.log("finished");
-    });
+// A single resident Python worker serves every benchmark and query
+// request, so models and vector stores stay loaded between requests
+let worker = null;
+let nextRequestId = 0;
+const pendingRequests = new Map();
+
+function getWorker() {
+  if (worker !== null) {
+    return worker;
   }
-);
-
-ipcMain.on("generate-query", (event, path, source, index) => {
   let options = {
-    mode: "text",
-    pythonPath:process.env.PYTHON_PATH,
+    mode: "json",
+    pythonPath: process.env.PYTHON_PATH,
     pythonOptions: ["-u"],
     scriptPath: "./scripts",
-    args: [JSON.stringify({ path, source, index })],
   };
 
-  let pyshell = new PythonShell("QueryGeneration.py", options);
+  worker = new PythonShell("Worker.py", options);
 
-  pyshell.on("message", function (message) {
-    console.log(
-      "||||||||____||||||  PYTHON QUERY---------------------------\n",
-      message
-    );
-    event.sender.send("query", message);
+  worker.on("message", function (response) {
+    let request = pendingRequests.get(response.id);
+    // Progress events come every half second, so they are not logged
+    if (request !== undefined && response.ok && response.progress !== undefined) {
+      request.onProgress(response.progress);
+      return;
+    }
+    console.log("PYTHON WORKER---------------------------\n", response);
+    if (request === undefined) {
+      return;
+    }
+    if (response.ok && response.done === false) {
+      request.onPartial(response.result);
+      return;
+    }
+    pendingRequests.delete(response.id);
+    if (!response.ok) {
+      console.log("Worker request failed: " + response.error);
+      request.onError(response.error);
+      return;
+    }
+    request.onResult(response.result);
   });
 
-  pyshell.end(function (err, code, signal) {
-    if (err) {
-      throw err;
-    }
+  worker.on("stderr", function (line) {
+    console.log(line);
+  });
+
+  worker.end(function (err, code, signal) {
+    if (err) console.log(err);
     console.log("The exit code was: " + code);
     console.log("The exit signal was: " + signal);
-    console.log("finished");
+    console.log("worker finished");
+    worker = null;
+    pendingRequests.forEach((request) => request.onError("Worker exited"));
+    pendingRequests.clear();
   });
+
+  return worker;
+}
+
+function sendToWorker(
+  type,
+  data,
+  onResult,
+  onError,
+  onPartial = () => {},
+  onProgress = () => {}
+) {
+  let id = nextRequestId++;
+  pendingRequests.set(id, { onResult, onError, onPartial, onProgress });
+  getWorker().send({ id, type, data });
+}
+
+app.on("before-quit", () => {
+  if (worker !== null) {
+    worker.send({ id: nextRequestId++, type: "shutdown" });
+  }
+});
+
+// The request holds the form's settings, where models, strategies, stores
+// and chunkings may be lists (see Combination.is_matrix)
+ipcMain.on("start-benchmark", (event, request) => {
+  // With lists, each combination's report is streamed as its own row as
+  // soon as it is done
+  let streamed = false;
+  sendToWorker(
+    "start-benchmark",
+    request,
+    (reports) => {
+      if (!streamed) {
+        event.sender.send("benchmark-data", JSON.stringify(reports));
+      }
+      event.sender.send("benchmark-done");
+    },
+    // The renderer re-enables the form and shows the error
+    (error) => event.sender.send("benchmark-error", error),
+    (reports) => {
+      streamed = true;
+      event.sender.send("benchmark-data", JSON.stringify(reports));
+    },
+    // Live stage, throughput, ETA and memory of the running benchmark
+    (progress) => {
+      event.sender.send("benchmark-progress", JSON.stringify(progress));
+    }
+  );
+});
+
+ipcMain.on("generate-query", (event, path, source, index) => {
+  sendToWorker(
+    "generate-query",
+    { path, source, index },
+    (result) => {
+      console.log(
+        "||||||||____||||||  PYTHON QUERY---------------------------\n",
+        result
+      );
+      event.sender.send("query", JSON.stringify(result));
+    },
+    (error) =>
+      event.sender.send(
+        "query",
+        JSON.stringify(["Oops! Check Error Dialog", index])
+      )
+  );
+});
+
+// Generates the queries of several lines at once; each query is sent on
+// the "query" channel as soon as it is ready, as for a single line
+ipcMain.on("generate-queries", (event, path, sources, indices) => {
+  sendToWorker(
+    "generate-queries",
+    { path, sources, indices },
+    (results) => console.log("Generated " + results.length + " queries"),
+    (error) =>
+      indices.forEach((index) =>
+        event.sender.send(
+          "query",
+          JSON.stringify(["Oops! Check Error Dialog", index])
+        )
+      ),
+    (result) => event.sender.send("query", JSON.stringify(result))
+  );
 });
@@ -15,31 +15,35 @@ contextBridge.exposeInMainWorld("electron", {
   removeDirectoryFilesListener: () => {
     ipcRenderer.removeAllListeners("directory-files");
   },
-  startBenchmark: (
-    selectedModel,
-    selectedStrategy,
-    query,
-    selectedPath,
-    selectedSource,
-    lines
-  ) =>
-    ipcRenderer.send(
-      "start-benchmark",
-      selectedModel,
-      selectedStrategy,
-      query,
-      selectedPath,
-      selectedSource,
-      lines
-    ),
+  startBenchmark: (request) => ipcRenderer.send("start-benchmark", request),
+  onBenchmarkDone: (callback) => {
+    ipcRenderer.on("benchmark-done", (event) => callback());
+  },
+  removeBenchmarkDoneListener: () => {
+    ipcRenderer.removeAllListeners("benchmark-done");
+  },
   onBenchmarkData: (callback) => {
     ipcRenderer.on("benchmark-data", (event, message) => callback(message));
   },
   removeBenchmarkDataListener: () => {
     ipcRenderer.removeAllListeners("benchmark-data");
   },
+  onBenchmarkError: (callback) => {
+    ipcRenderer.on("benchmark-error", (event, error) => callback(error));
+  },
+  removeBenchmarkErrorListener: () => {
+    ipcRenderer.removeAllListeners("benchmark-error");
+  },
+  onBenchmarkProgress: (callback) => {
+    ipcRenderer.on("benchmark-progress", (event, message) => callback(message));
+  },
+  removeBenchmarkProgressListener: () => {
+    ipcRenderer.removeAllListeners("benchmark-progress");
+  },
   generateQuery: (path, source, index) =>
     ipcRenderer.send("generate-query", path, source, index),
+  generateQueries: (path, sources, indices) =>
+    ipcRenderer.send("generate-queries", path, sources, indices),
   onQuery: (callback) => {
     ipcRenderer.on("query", (event, message) => callback(message));
   },
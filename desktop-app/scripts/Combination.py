@@ -1,11 +1,17 @@
-from vectorstores.Chroma import Chroma
-from embeddings.HuggingFaceEmbedding import HuggingFaceEmbedding
+from embeddings.base import BaseEmbedding
+from vectorstores.base import BaseVectorstore
+from vectorstores.progress import Progress, progress_context, set_sink
+from vectorstores.timing import StageTimer
+import importlib
+import itertools
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import statistics
+import numpy as np
 import os
 import sys
-from tabulate import tabulate
-from tqdm import tqdm
+import time
 
 sys.path.append('..')
 # Import the embeding model and database class
@@ -13,17 +19,47 @@ sys.path.append('..')
 # from vectorstores.Milvus import Milvus
 
 
+# The vector stores selectable by name, imported only when selected so
+# that e.g. pymilvus is not needed to benchmark the other stores
+VECTORSTORES = {'Chroma': 'vectorstores.Chroma',
+                'Milvus': 'vectorstores.Milvus',
+                'Numpy': 'vectorstores.Numpy'}
+
+
+def get_vectorstore_class(name: str):
+    """
+    Retrieves the vector store class registered under the given name.
+
+    Args:
+        name (str): The name of the vector store.
+
+    Returns:
+        type: The BaseVectorstore subclass.
+
+    Raises:
+        ValueError: If no vector store is registered under the name.
+    """
+    if name not in VECTORSTORES:
+        error_msg = f"{name} vector store is not supported"
+        raise ValueError(error_msg)
+    return getattr(importlib.import_module(VECTORSTORES[name]), name)
+
+
 class Combination(object):
 
+    QUERY_BATCH_SIZE = 256
+
     def __init__(self,
                  db_model,
                  queries_path: str,
-                 queries_map: dict
+                 query_pairs: list[tuple[str, list[str]]],
+                 query_batch_size: int = QUERY_BATCH_SIZE
                  ) -> None:
 
         self.db_model = db_model
         self.queries_path = queries_path
-        self.queries_map = queries_map
+        self.query_pairs = query_pairs
+        self.query_batch_size = query_batch_size
 
     def get_query_source_map(self) -> dict[str, list[str]]:
         """
@@ -114,24 +150,63 @@ class Combination(object):
             Exception: If the number of unique sources is more than the 
                        provided number of matches.
         """
-        # Retrieve the output sources associated with the query
-        output_sources = self.get_sources(query=query)
+        # Search only as deep as needed to reach the matches
+        k = self.db_model.rank_sources(query_texts=[query],
+                                       sources=[sources],
+                                       matches=matches)[0]
 
-        # Create a set of the given sources to check for matches
-        given_sources = set(sources)
+        # Raise an exception if the number of unique sources is more than the number of matches
+        if k == -1:
+            raise Exception(
+                f"Number of unique sources doesn't match the number of matches: {query}")
+        return int(k)
+
+    def get_all_k(self,
+                  queries: list[str],
+                  sources: list[list[str]],
+                  matches: int
+                  ) -> np.ndarray:
+        """
+        Retrieves the values of 'k' for many queries, searching them in batches.
 
-        # Iterate over the output sources and check for matches
-        for idx, src in enumerate(output_sources):
-            if src in given_sources:
-                matches -= 1
+        Args:
+            queries (list): The queries to be executed.
+            sources (list): For each query, the source filenames to match against.
+            matches (int): The desired number of filename matches.
 
-                # If the desired number of matches is reached, return the value of 'k'
-                if matches == 0:
-                    return idx + 1
+        Returns:
+            np.ndarray: The value of 'k' of each query.
+
+        Raises:
+            Exception: If the number of unique sources is more than the 
+                       provided number of matches.
+        """
+        db = self.db_model
+        all_k = np.empty(len(queries), dtype=np.int64)
+
+        # Initialize a progress bar to track the values of 'k'
+        from tqdm import tqdm
+        with tqdm(total=len(queries),
+                  desc="Getting the values of k: ",
+                  ncols=100) as pbar_k, Progress('query', total=len(queries)) as progress:
+            for start in range(0, len(queries), self.query_batch_size):
+                batch = queries[start:start + self.query_batch_size]
+
+                # Search the whole batch of queries at once, only as deep
+                # as each query needs to reach its matches
+                all_k[start:start + len(batch)] = db.rank_sources(
+                    query_texts=batch,
+                    sources=sources[start:start + len(batch)],
+                    matches=matches)
+                pbar_k.update(len(batch))
+                progress.update(len(batch))
 
         # Raise an exception if the number of unique sources is more than the number of matches
-        raise Exception(
-            f"Number of unique sources doesn't match the number of matches: {query}")
+        missing = np.flatnonzero(all_k == -1)
+        if len(missing) > 0:
+            raise Exception(
+                f"Number of unique sources doesn't match the number of matches: {queries[missing[0]]}")
+        return all_k
 
     def get_report(self,
                    matches: int
@@ -149,24 +224,41 @@ class Combination(object):
                 - 'Strategy': The strategy used by the database model.
                 - 'Average k': The average value of 'k'.
                 - 'Sigma': The standard deviation of the values of 'k'.
+                - 'Chunk Size' and 'Chunk Overlap': The chunking of the data.
+                - 'Truncated': The number of queries whose source ranks
+                  deeper than the store can search, counted with a
+                  censored 'k' (see `rank_sources`), when there are any.
+                - 'Ingest chunks/s' and 'Build s': The ingest throughput
+                  and duration of the last `add_data` call, when data was added.
+                - 'Reused index': True instead, when that call found the
+                  index already up to date, e.g. built by another strategy.
+                - 'Duplicate chunks': The number of chunks of that call
+                  already stored under another file, and not embedded again.
+                - 'Skipped files': The number of files of that call without
+                  a loader for their extension, or that no encoding
+                  decodes, which were not indexed.
+                - 'Index bytes': The size of the persisted index, when
+                  the store knows it.
+                - '<Stage> s' and '<Stage> items/s': The time and throughput
+                  of each timed stage, e.g. 'Embed s' and 'Embed items/s'.
+                - 'Query p50 ms', 'Query p95 ms' and 'Query p99 ms': The
+                  percentiles of the latency of a query embedded and
+                  searched on its own, over a sample of the queries.
+                - 'Query cost p50 ms', 'Query cost p95 ms' and 'Query cost
+                  p99 ms': The percentiles of the work spent on each query,
+                  its share of the batched embedding and searches (see
+                  `rank_sources`).
         """
-        all_k = []
-
         # Retrieve the mapping of queries to sources
         # query_srcs_map = self.get_query_source_map()
 
-        # If query source map is directly passed through frontend
-        query_srcs_map = self.queries_map
-
-        # Initialize a progress bar to track the values of 'k'
-        with tqdm(total=len(query_srcs_map.items()),
-                  desc="Getting the values of k: ",
-                  ncols=100) as pbar_k:
-            for query, sources in query_srcs_map.items():
-                # Get the value of 'k' for each query and append it to the list
-                all_k.append(self.get_k(
-                    query=query, sources=sources, matches=matches))
-                pbar_k.update()
+        # If the queries and sources are directly passed through frontend.
+        # Every line counts, repeated queries included, which rank_sources
+        # only embeds and searches once.
+        truncated = self.db_model.truncated
+        all_k = self.get_all_k(queries=[query for query, _ in self.query_pairs],
+                               sources=[sources for _, sources in self.query_pairs],
+                               matches=matches).tolist()
 
         # Calculate average 'k' and sigma
         avg = round(sum(all_k) / len(all_k))
@@ -179,7 +271,26 @@ class Combination(object):
                   'DB Type': self.db_model.name,
                   'Strategy': self.db_model.strategy,
                   'Average k': avg,
-                  'Sigma': sigma}
+                  'Sigma': sigma,
+                  'Chunk Size': self.db_model.chunk_size,
+                  'Chunk Overlap': self.db_model.chunk_overlap}
+        if self.db_model.truncated > truncated:
+            # Their k only bounds the real one, which the store cannot reach
+            report['Truncated'] = self.db_model.truncated - truncated
+
+        ingest_stats = self.db_model.ingest_stats
+        if ingest_stats is not None:
+            if ingest_stats.get('reused'):
+                report['Reused index'] = True
+            else:
+                report['Ingest chunks/s'] = ingest_stats['chunks_per_second']
+                report['Build s'] = ingest_stats['seconds']
+            report['Duplicate chunks'] = ingest_stats.get('duplicates', 0)
+            report['Skipped files'] = ingest_stats.get('skipped_files', 0)
+        index_size = self.db_model.get_index_size()
+        if index_size is not None:
+            report['Index bytes'] = index_size
+        report.update(self.db_model.timer.report_fields())
 
         return report
 
@@ -219,6 +330,7 @@ class Combination(object):
             data.append(list(report.values()))
 
         # Format the data as a table using the tabulate library
+        from tabulate import tabulate
         table = tabulate(data, headers="firstrow", tablefmt="pipe")
 
         # Write the table to the file
@@ -226,46 +338,377 @@ class Combination(object):
             file.write(table)
 
 
-def main():
-    data = json.loads(sys.argv[1])
-    selectedModel = data['selectedModel']
-    selectedStrategy = data['selectedStrategy']
+def get_query_pairs(lines: list[dict[str, str]]) -> list[tuple[str, list[str]]]:
+    """
+    Builds the query and sources of each line sent by the app.
+
+    Lines repeating a query are all kept, each with its own source, so that
+    the report counts every line of the form.
+
+    Args:
+        lines (list): The query and source of each line of the form.
+
+    Returns:
+        list: The (query, [source]) pair of each line.
+    """
+    return [(line['query'], [line['source']]) for line in lines]
+
+
+def save_trace(file_path: str,
+               runs: list[tuple[dict, StageTimer]]
+               ) -> None:
+    """
+    Writes the stage timings of benchmark runs to a JSON trace file.
+
+    Args:
+        file_path (str): The path of the trace file.
+        runs (list): The report and the timer of each run.
+    """
+    trace = [{'Embedding Model': report['Embedding Model'],
+              'DB Type': report['DB Type'],
+              'Strategy': report['Strategy'],
+              'stages': timer.summary()}
+             for report, timer in runs]
+    with open(file=file_path, mode='w') as fn:
+        json.dump(trace, fn, indent=2)
+
+
+def benchmark(db_model,
+              lines: list[dict[str, str]]
+              ) -> dict[str, str | int | float]:
+    """
+    Benchmarks a database model, which already holds the data, against
+    the given queries.
+
+    Args:
+        db_model: The database model to benchmark.
+        lines (list): The query and source of each line of the form.
+
+    Returns:
+        dict: The report of the benchmark.
+    """
+    # Initialize the combination model using the database and queries file
+    assets_directory = os.path.join(os.path.abspath(os.pardir),
+                                    "assets")
+    queries_path = os.path.join(assets_directory, 'queries_temp.json')
+    combination = Combination(db_model=db_model,
+                              queries_path=queries_path,
+                              query_pairs=get_query_pairs(lines))
+    # Get the report (statistics) based on the provided datas and queries
+    report = combination.get_report(matches=1)
+    # TODO: Need to add the number of documents in the report properly
+    report['Frequency'] = 3
+    report['Queries'] = len(lines)
+    return report
+
+
+def run_benchmark(data: dict,
+                  db_model
+                  ) -> list[dict[str, str | int | float]]:
+    """
+    Adds the selected data to a database model and benchmarks it against
+    the given queries.
+
+    Args:
+        data (dict): The benchmark request sent by the app, with the keys
+                     'selectedPath' and 'lines', and optionally 'storeOptions',
+                     the options the store was created with (see
+                     `get_store_kwargs`), and 'traceFile', the path of a JSON
+                     file the stage timings are written to.
+        db_model: The database model to benchmark.
+
+    Returns:
+        list: A list holding the report of the benchmark.
+    """
     selectedPath = data['selectedPath']
     # query = data['query']
     # source = data['selectedSource']
     lines = data['lines']
 
-    # Initialize embedding model using models in embeddings directory
-    emb_model = HuggingFaceEmbedding(selectedModel)
-    # Initialize database model using the database in vectorstores directory
-    db_model = Chroma(embedding=emb_model,
-                      strategy=selectedStrategy)
+    # Time this run only, also when the database model is reused
+    db_model.timer = StageTimer()
+    batch_stats = db_model.embedding.get_batch_stats()
+
     # Add embeddings to the database
     data_directory = selectedPath
-    db_model.add_data(data_directory=data_directory)
-    # Initialize the combination model using the database and queries file
-    assets_directory = os.path.join(os.path.abspath(os.pardir),
-                                    "assets")
+    with progress_context(model=db_model.embedding.get_name(),
+                          store=db_model.name,
+                          strategy=db_model.strategy):
+        db_model.add_data(data_directory=data_directory)
+        report = benchmark(db_model=db_model, lines=lines)
+    report.update(BaseEmbedding.batch_report(batch_stats,
+                                             db_model.embedding.get_batch_stats()))
+    if data.get('storeOptions'):
+        report['Store Options'] = data['storeOptions']
+    if data.get('traceFile'):
+        save_trace(file_path=data['traceFile'], runs=[(report, db_model.timer)])
+    return [report]
+
+
+def is_matrix(data: dict) -> bool:
+    """
+    Tells whether a benchmark request asks for several combinations,
+    i.e. gives a list of models, strategies, stores, store options, chunk
+    sizes or chunk overlaps.
+    """
+    return bool(data.get('storeSweep')) or any(
+        isinstance(data.get(key), list)
+        for key in ('selectedModel', 'selectedStrategy', 'selectedStore',
+                    'storeOptions', 'chunkSize', 'chunkOverlap'))
+
+
+def get_chunkings(data: dict) -> list[dict]:
+    """
+    Lists the chunkings to benchmark.
+
+    'chunkSize' and 'chunkOverlap' each give a value or a list of values,
+    BaseVectorstore's defaults when missing, and every size is combined
+    with every overlap smaller than it.
+
+    Args:
+        data (dict): The benchmark request.
+
+    Returns:
+        list: The chunk_size and chunk_overlap keyword arguments of the
+              store's constructor, one dict per chunking to benchmark.
+
+    Raises:
+        ValueError: If no overlap is smaller than any chunk size.
+    """
+    as_list = lambda value: value if isinstance(value, list) else [value]
+    sizes = as_list(data.get('chunkSize', BaseVectorstore.CHUNK_SIZE))
+    overlaps = as_list(data.get('chunkOverlap', BaseVectorstore.CHUNK_OVERLAP))
+    chunkings = [{'chunk_size': size, 'chunk_overlap': overlap}
+                 for size in sizes for overlap in overlaps if overlap < size]
+    if len(chunkings) == 0:
+        error_msg = f"No chunk overlap in {overlaps} is smaller than a chunk size in {sizes}"
+        raise ValueError(error_msg)
+    return chunkings
+
+
+def get_store_kwargs(data: dict) -> dict:
+    """
+    Gets the keyword arguments of the store's constructor for a request
+    benchmarking a single combination: its 'storeOptions' and chunking.
+    """
+    return {**(data.get('storeOptions') or {}), **get_chunkings(data)[0]}
+
+
+def get_store_options(data: dict) -> list[dict]:
+    """
+    Lists the store options to benchmark.
+
+    'storeOptions' gives one set of options or a list of them, and
+    'storeSweep' a grid of options to sweep, e.g. {'hnsw_m': [16, 32],
+    'hnsw_search_ef': [64, 256]}: every point of the grid is combined
+    with every set of options.
+
+    Args:
+        data (dict): The benchmark request.
+
+    Returns:
+        list: The keyword arguments of the store's constructor, one dict
+              per configuration to benchmark.
+    """
+    options = data.get('storeOptions') or {}
+    options = options if isinstance(options, list) else [options]
+    sweep = data.get('storeSweep')
+    if not sweep:
+        return options
+    keys = list(sweep.keys())
+    grid = [dict(zip(keys, values))
+            for values in itertools.product(*(sweep[key] for key in keys))]
+    return [{**base, **point} for base in options for point in grid]
+
+
+def create_vectorstore(store: str,
+                       embedding,
+                       strategy: str,
+                       options: dict | None = None):
+    """
+    Creates a vector store, passing the store options of the benchmark
+    request, e.g. {'index_type': 'HNSW'} for Milvus, to its constructor.
+
+    Args:
+        store (str): The name of the vector store.
+        embedding: The embedding model.
+        strategy (str): The search strategy.
+        options (dict): Keyword arguments of the store's constructor.
+
+    Returns:
+        BaseVectorstore: The vector store.
+    """
+    return get_vectorstore_class(store)(embedding=embedding,
+                                        strategy=strategy,
+                                        **(options or {}))
+
+
+def run_matrix(data: dict,
+               pool=None,
+               emit=None,
+               max_workers: int | None = None
+               ) -> list[dict[str, str | int | float]]:
+    """
+    Benchmarks every combination of the selected models, strategies,
+    stores, store options and chunkings over the same data in one run.
+
+    The directory is walked once, and loaded and split once per chunking,
+    and its chunks are handed to every combination of the chunking. Each
+    model is taken from the pool once per chunking and held for all its
+    combinations: the first of them embeds the chunks in bounded batches
+    and fills the embedding cache, then the others read their embeddings
+    from the cache, or from the embedding matrix of the Numpy store when
+    it is benchmarked too. The padding and throughput of each ONNX model's
+    encoding of the corpus are reported with every combination it served.
+    Combinations using different models or stores are benchmarked in
+    parallel; the strategies of the same model and store share its
+    persisted database, so they run one after the other.
+
+    Args:
+        data (dict): The benchmark request, where 'selectedModel',
+                     'selectedStrategy', 'selectedStore', 'storeOptions',
+                     'chunkSize' and 'chunkOverlap' may be lists, and
+                     'storeSweep' a grid of store options (see
+                     `get_store_options` and `get_chunkings`).
+        pool (EmbeddingPool): The pool the embedding models are taken from,
+                              a new one if None.
+        emit (Callable): Called with the report of each combination as
+                         soon as it is done.
+        max_workers (int): The number of models benchmarked at once.
+
+    Returns:
+        list: The reports of every combination.
+    """
+    as_list = lambda value: value if isinstance(value, list) else [value]
+    models = as_list(data['selectedModel'])
+    strategies = as_list(data['selectedStrategy'])
+    # The Numpy store goes first, so that the other stores of a model are
+    # filled from its embedding matrix (see BaseVectorstore.add_data)
+    stores = sorted(as_list(data.get('selectedStore', 'Chroma')),
+                    key=lambda store: store != 'Numpy')
+    store_options = get_store_options(data)
+    data_directory = data['selectedPath']
+    lines = data['lines']
+    if pool is None:
+        from embeddings.pool import EmbeddingPool
+        pool = EmbeddingPool()
+
+    # Load every store class up front, outside of the threads
+    for store in stores:
+        get_vectorstore_class(store)
+
+    # Walk the directory once for every combination
+    walk_timer = StageTimer()
+    start = time.perf_counter()
+    skipped = dict()
+    file_paths = BaseVectorstore.retrieve_file_paths(data_directory=data_directory,
+                                                     skipped=skipped)
+    walk_timer.add('walk', seconds=time.perf_counter() - start,
+                   items=len(file_paths))
+
+    reports = []
+    runs = []
+    lock = threading.Lock()
+    max_workers = max_workers or min(len(models), os.cpu_count() or 1)
+    cells = [(options, strategy) for options in store_options for strategy in strategies]
+
+    for chunking in get_chunkings(data):
+        # Load and split the directory once for every combination of the chunking
+        shared_timer = StageTimer()
+        shared_timer.merge(walk_timer)
+        chunking_skipped = dict(skipped)
+        chunks = dict(BaseVectorstore.process_files(file_paths=file_paths,
+                                                    timer=shared_timer,
+                                                    skipped=chunking_skipped,
+                                                    **chunking))
+        skipped_files = sum(chunking_skipped.values())
+
+        def run_cell(embedding,
+                     store: str,
+                     options: dict,
+                     strategy: str,
+                     model_batches: dict,
+                     first: bool = False) -> None:
+            model = embedding.get_name()
+            db_model = create_vectorstore(store=store,
+                                          embedding=embedding,
+                                          strategy=strategy,
+                                          options={**options, **chunking})
+            db_model.timer.merge(shared_timer)
+            with progress_context(model=model, store=store, strategy=strategy):
+                batch_stats = embedding.get_batch_stats()
+                db_model.add_data(data_directory=data_directory,
+                                  chunks=chunks,
+                                  skipped_files=skipped_files)
+                if first:
+                    # The first combination of the model embeds the corpus
+                    # into the cache, its encoding is reported for them all
+                    model_batches.update(BaseEmbedding.batch_report(batch_stats,
+                                                                    embedding.get_batch_stats()))
+                report = benchmark(db_model=db_model, lines=lines)
+            report.update(model_batches)
+            if len(options) > 0:
+                report['Store Options'] = options
+            with lock:
+                reports.append(report)
+                runs.append((report, db_model.timer))
+                if emit is not None:
+                    emit(report)
+
+        def run_model(model: str) -> None:
+            # Holding the model keeps it loaded for all its combinations,
+            # even if the pool evicts it meanwhile
+            embedding = pool.get(model)
+            model_batches = dict()
+            run_cell(embedding, stores[0], *cells[0], model_batches=model_batches, first=True)
+
+            def run_store(store: str) -> None:
+                for options, strategy in cells[1:] if store == stores[0] else cells:
+                    run_cell(embedding, store, options, strategy, model_batches=model_batches)
+
+            with ThreadPoolExecutor(max_workers=len(stores)) as executor:
+                for future in [executor.submit(run_store, store) for store in stores]:
+                    future.result()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(run_model, model) for model in models]:
+                future.result()
+    if data.get('traceFile'):
+        save_trace(file_path=data['traceFile'], runs=runs)
+    return reports
 
-    # If using single query
-    # map = {query: [source]}
 
-    map = {}
-    for line in lines:
-        query = line['query']
-        source = line['source']
-        map[query] = [source]
+def main():
+    data = json.loads(sys.argv[1])
+    lock = threading.Lock()
 
-    queries_path = os.path.join(assets_directory, 'queries_temp.json')
-    combination = Combination(db_model=db_model,
-                              queries_path=queries_path,
-                              queries_map=map)
-    # Get the report (statistics) based on the provided datas and queries
-    reports = [combination.get_report(matches=1)]
-    # TODO: Need to add the number of documents in the report properly
-    reports[0]['Frequency'] = 3
-    reports[0]['Queries'] = len(lines)
-    print(json.dumps(reports))
+    def write_line(message) -> None:
+        # Lines come from several threads and must not interleave
+        with lock:
+            sys.stdout.write(json.dumps(message) + '\n')
+            sys.stdout.flush()
+
+    # Progress events are JSON objects on their own lines, reports are lists
+    set_sink(write_line)
+    if is_matrix(data):
+        # Stream one report per combination, each on its own line
+        run_matrix(data=data, emit=lambda report: write_line([report]))
+        return
+
+    selectedModel = data['selectedModel']
+    selectedStrategy = data['selectedStrategy']
+    selectedStore = data.get('selectedStore', 'Chroma')
+
+    # Initialize embedding model using models in embeddings directory
+    from embeddings.pool import load_embedding
+    emb_model = load_embedding(selectedModel)
+    # Initialize database model using the database in vectorstores directory
+    db_model = create_vectorstore(store=selectedStore,
+                                  embedding=emb_model,
+                                  strategy=selectedStrategy,
+                                  options=get_store_kwargs(data))
+    reports = run_benchmark(data=data, db_model=db_model)
+    write_line(reports)
     # # combination.save_reports(all_reports=reports,
     # #                          file_path=os.path.join(os.path.abspath(os.pardir),
     # #                                                 os.path.join("benchmark", "benchmark.txt")))
@@ -1,55 +1,361 @@
-from langchain import PromptTemplate, LLMChain, HuggingFaceHub
-from langchain.llms import OpenAI
 import os
+import re
 import json
+import random
 import sys
+import hashlib
+import sqlite3
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 from dotenv import load_dotenv
-import random
 
 load_dotenv()
 
-#Get parameters from app
-data = json.loads(sys.argv[1])
-path = data['path']
-source = data['source']
-index = data['index']
-try:
+#List of huggingface models
+MODELS = ["google/flan-t5-xxl", "google/flan-t5-base", "google/flan-t5-small", "google/flan-t5-large", "lmsys/fastchat-t5-3b-v1.0"]
+
+TEMPLATE = """
+    Given the following context. Generate a query that could be asked to an LLM. 
+    Return only one query and nothing else, should end with a question mark:
+
+    {context}
+
+    """
+
+# Requests follow the HuggingFace Inference API, POST {endpoint}/{model},
+# so any server speaking it, e.g. the stand-in below, can replace it
+ENDPOINT = os.getenv("LLM_ENDPOINT", "https://api-inference.huggingface.co/models")
+
+# flan-t5 reads at most 512 tokens, part of which the template takes
+MAX_CONTEXT_TOKENS = 448
+# Estimate of the T5 tokens of an English word, to stay clear of a tokenizer
+TOKENS_PER_WORD = 1.3
+# Upper bound of the characters of a token, to only read the head of a file
+CHARS_PER_TOKEN = 32
+
+MAX_WORKERS = 4
+TIMEOUT = 120
+
+ERROR_QUERY = 'Oops! Check Error Dialog'
+
+CACHE_PATH = os.path.join(os.path.abspath(os.pardir), "database", "query_cache.sqlite")
+
+
+class QueryCache(object):
+    """
+    A persistent cache of generated queries stored in SQLite.
+
+    Queries are keyed by (sha256 of the file, model, sha256 of the endpoint,
+    template and context budget), so a file is only sent to a model again
+    once its content, the prompt or the server answering it changes.
 
-    file_path = os.path.join(path, source)
+    Attributes:
+        path (str): Path of the SQLite database file.
 
+    Methods:
+        __init__: Open (or create) the cache database.
+        get: Look up a generated query.
+        put: Store a generated query.
+        close: Close the database connection.
+    """
+
+    def __init__(self,
+                 path: str = CACHE_PATH) -> None:
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS queries (
+                                  file_hash TEXT NOT NULL,
+                                  model TEXT NOT NULL,
+                                  prompt_hash TEXT NOT NULL,
+                                  query TEXT NOT NULL,
+                                  PRIMARY KEY (file_hash, model, prompt_hash))""")
+        self._conn.commit()
+
+    def get(self,
+            key: tuple[str, str, str]) -> str | None:
+        """
+        Look up a generated query.
+
+        Args:
+            key (tuple): The file hash, model and prompt hash.
+
+        Returns:
+            str: The cached query, None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute("""SELECT query FROM queries
+                                        WHERE file_hash = ? AND model = ? AND prompt_hash = ?""",
+                                     key).fetchone()
+        return None if row is None else row[0]
+
+    def put(self,
+            key: tuple[str, str, str],
+            query: str) -> None:
+        """
+        Store a generated query.
+
+        Args:
+            key (tuple): The file hash, model and prompt hash.
+            query (str): The generated query.
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)",
+                               (*key, query))
+            self._conn.commit()
+
+    def close(self) -> None:
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> QueryCache:
+    """
+    Get the query cache shared by the requests of this process.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache(path=CACHE_PATH)
+        return _cache
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Get the sha256 of a file, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as fn:
+        for block in iter(lambda: fn.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_context(file_path: str,
+                 max_tokens: int = MAX_CONTEXT_TOKENS) -> str:
+    """
+    Read the head of a file that fits in a token budget.
+
+    The number of tokens is estimated from the number of words, and only
+    as many characters as the budget can span are read.
+
+    Args:
+        file_path (str): The path of the file.
+        max_tokens (int): The token budget of the context.
+
+    Returns:
+        str: The context, cut after its last whole word within the budget.
+    """
+    with open(file_path, 'r', errors='replace') as fn:
+        head = fn.read(max_tokens * CHARS_PER_TOKEN)
+    max_words = int(max_tokens / TOKENS_PER_WORD)
+    for count, word in enumerate(re.finditer(r'\S+', head), start=1):
+        if count == max_words:
+            return head[:word.end()]
+    return head
+
+
+def pick_model(file_hash: str,
+               fixed: bool = True) -> str:
+    """
+    Pick the model of a file when none is requested.
+
+    With `fixed`, the files are spread over the models as with a random
+    pick, but a file always gets the same model, so that its query is
+    found in the cache. Otherwise the model is picked at random, so that
+    asking again for a query may get another one.
+    """
+    if not fixed:
+        return random.choice(MODELS)
+    return MODELS[int(file_hash, 16) % len(MODELS)]
+
+
+def call_llm(prompt: str,
+             model: str,
+             endpoint: str = ENDPOINT,
+             use_cache: bool = True) -> str:
+    """
+    Generate text with a model of an Inference API endpoint.
+
+    Args:
+        prompt (str): The prompt.
+        model (str): The name of the model.
+        endpoint (str): The base URL of the endpoint.
+        use_cache (bool): Let the endpoint answer a prompt it has already
+                          answered with the same text.
+
+    Returns:
+        str: The generated text.
+
+    Raises:
+        ValueError: If the endpoint does not answer with generated text.
+    """
+    body = json.dumps({'inputs': prompt,
+                       'parameters': {'temperature': 0.5, 'max_length': 64},
+                       'options': {'use_cache': use_cache}})
+    headers = {'Content-Type': 'application/json'}
     #Must create .env file with the following key
-    os.environ["HUGGINGFACEHUB_API_TOKEN"] = os.getenv("API_KEY")
+    if os.getenv("API_KEY"):
+        headers['Authorization'] = f"Bearer {os.getenv('API_KEY')}"
+    request = urllib.request.Request(f"{endpoint.rstrip('/')}/{model}",
+                                     data=body.encode('utf-8'),
+                                     headers=headers,
+                                     method='POST')
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        output = json.loads(response.read())
+    if isinstance(output, list) and len(output) > 0 and 'generated_text' in output[0]:
+        return output[0]['generated_text'].strip()
+    error_msg = f"Unexpected response from {model}: {output}"
+    raise ValueError(error_msg)
 
-    #List of huggingface models
-    models = ["google/flan-t5-xxl", "google/flan-t5-base", "google/flan-t5-small", "google/flan-t5-large", "lmsys/fastchat-t5-3b-v1.0"]
 
-    template = """
-    Given the following context. Generate a query that could be asked to an LLM. 
-    Return only one query and nothing else, should end with a question mark:
+def generate_for_file(file_path: str,
+                      model: str | None = None,
+                      template: str = TEMPLATE,
+                      max_tokens: int = MAX_CONTEXT_TOKENS,
+                      endpoint: str = ENDPOINT,
+                      cache: QueryCache | None = None,
+                      refresh: bool = False) -> dict:
+    """
+    Generate a query from the content of a file.
 
-    {context}
+    Args:
+        file_path (str): The path of the file.
+        model (str): The name of the model, picked from the file if None.
+        template (str): The prompt template, with a {context} field.
+        max_tokens (int): The token budget of the context.
+        endpoint (str): The base URL of the Inference API endpoint.
+        cache (QueryCache): The cache of generated queries, if any.
+        refresh (bool): Generate the query again even if it is cached.
 
+    Returns:
+        dict: The query, the model, and whether it came from the cache.
     """
+    file_hash = hash_file(file_path)
+    # The model only has to follow the file when its query may be cached;
+    # a new query is asked of any model, bypassing the endpoint's cache too
+    cached = cache is not None and not refresh
+    model = model or pick_model(file_hash, fixed=cached)
+    # Models of the same name may be served differently by other endpoints
+    prompt_hash = hashlib.sha256(f"{endpoint}\n{max_tokens}\n{template}".encode('utf-8')).hexdigest()
+    key = (file_hash, model, prompt_hash)
+    if cache is not None and not refresh:
+        query = cache.get(key)
+        if query is not None:
+            return {'query': query, 'model': model, 'cached': True}
+
+    context = read_context(file_path=file_path, max_tokens=max_tokens)
+    query = call_llm(prompt=template.format(context=context),
+                     model=model,
+                     endpoint=endpoint,
+                     use_cache=cached)
+    if cache is not None:
+        cache.put(key, query)
+    return {'query': query, 'model': model, 'cached': False}
 
-    prompt = PromptTemplate.from_template(template)
 
+def _options(data: dict,
+             cache: bool = True) -> dict:
+    # The generation options of a request, with their defaults
+    return {'model': data.get('model'),
+            'template': data.get('template', TEMPLATE),
+            'max_tokens': data.get('maxContextTokens', MAX_CONTEXT_TOKENS),
+            'endpoint': data.get('endpoint', ENDPOINT),
+            'cache': get_cache() if data.get('cache', cache) else None,
+            'refresh': data.get('refresh', False)}
 
-    #Get context from file
-    file = open(file_path)
-    context = file.readlines()
-    file.close()
 
-    #Select a random model
-    repo_id = models[random.randint(0, len(models)-1)]
+def generate_query(data: dict) -> list:
+    #Get parameters from app
+    path = data['path']
+    source = data['source']
+    index = data['index']
+    try:
+        file_path = os.path.join(path, source)
+        # A single line is generated again on every request, e.g. when the
+        # user asks for another query, unless the request opts into the cache
+        result = generate_for_file(file_path=file_path, **_options(data, cache=False))
+        return [result['query'], index]
+    except:
+        return [ERROR_QUERY, index]
 
-    llm = HuggingFaceHub(repo_id=repo_id, model_kwargs={
-                        "temperature": 0.5, "max_length": 64})
-    
-    llm_chain = LLMChain(prompt=prompt, llm=llm)
 
-    query = llm_chain.run(context)
+def generate_queries(data: dict,
+                     emit: Callable[[int, dict], None] | None = None) -> list[dict]:
+    """
+    Generate a query for each of several files at once.
+
+    The requests are sent concurrently by at most 'maxWorkers' threads, so
+    the time of a batch is bound by the endpoint rather than by the
+    latency of each request. A file that fails gets ERROR_QUERY and the
+    error, the others are unaffected.
 
+    Args:
+        data (dict): The request, with 'path' and optionally 'sources', the
+                     files to generate queries for (every file under 'path'
+                     if missing), 'model', 'template', 'maxContextTokens',
+                     'endpoint', 'maxWorkers', 'cache' and 'refresh'.
+        emit (Callable): Called with the position of each source and its
+                         result as soon as it is done.
+
+    Returns:
+        list: For each source, in order, a dict with the 'source', 'query',
+              'model' and 'cached', or 'error' when it failed.
+    """
+    path = data['path']
+    sources = data.get('sources')
+    if sources is None:
+        sources = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            sources.extend(os.path.relpath(os.path.join(root, file_name), path)
+                           for file_name in sorted(files))
+    options = _options(data)
+
+    def generate(position: int) -> dict:
+        source = sources[position]
+        try:
+            result = generate_for_file(file_path=os.path.join(path, source), **options)
+            result = {'source': source, **result}
+        except Exception as error:
+            result = {'source': source, 'query': ERROR_QUERY, 'error': str(error)}
+        if emit is not None:
+            emit(position, result)
+        return result
+
+    max_workers = max(1, min(data.get('maxWorkers', MAX_WORKERS), len(sources)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(generate, range(len(sources))))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: QueryGeneration.py <request as JSON>", file=sys.stderr)
+        sys.exit(2)
+    data = json.loads(sys.argv[1])
     #Output response to app
-    print(json.dumps([query, index]))
-except:
-    print(json.dumps(['Oops! Check Error Dialog', index]))
+    if 'index' in data:
+        print(json.dumps(generate_query(data)))
+    else:
+        print(json.dumps(generate_queries(data)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Budget of each entry point, in seconds, for a cold import in a fresh
+# interpreter. Importing an entry point must not load the heavy libraries
+# below: they are only imported on the code paths that use them.
+BUDGETS = {'Combination': 1.0,
+           'QueryGeneration': 0.5,
+           'Worker': 0.3}
+
+HEAVY_MODULES = ['chromadb',
+                 'langchain',
+                 'pymilvus',
+                 'sentence_transformers',
+                 'tabulate',
+                 'torch',
+                 'transformers']
+
+RUNS = 5
+
+# Imports the entry point and reports the heavy modules it loaded
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r}
+               if name in sys.modules)
+print(json.dumps({{'seconds': seconds, 'heavy': heavy}}))
+"""
+
+
+def measure(module: str,
+            runs: int = RUNS) -> dict:
+    """
+    Measures the cold import time of an entry point.
+
+    Each run imports the entry point in a fresh interpreter, so nothing
+    is cached between runs but the OS file cache.
+
+    Args:
+        module (str): The name of the entry point module.
+        runs (int): The number of runs.
+
+    Returns:
+        dict: The median import time and interpreter wall time of the runs,
+              in seconds, and the heavy modules loaded by the import.
+    """
+    scripts_directory = os.path.dirname(os.path.abspath(__file__))
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    imports, walls, heavy = [], [], set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code],
+                                cwd=scripts_directory,
+                                capture_output=True,
+                                text=True)
+        walls.append(time.perf_counter() - start)
+        if output.returncode != 0:
+            error_msg = f"Importing {module} failed:\n{output.stderr}"
+            raise RuntimeError(error_msg)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        imports.append(result['seconds'])
+        heavy.update(result['heavy'])
+    return {'import_seconds': round(statistics.median(imports), 3),
+            'wall_seconds': round(statistics.median(walls), 3),
+            'heavy_modules': sorted(heavy)}
+
+
+def check(budgets: dict[str, float] = BUDGETS,
+          runs: int = RUNS) -> list[dict]:
+    """
+    Measures every entry point against its budget.
+
+    Args:
+        budgets (dict): The budget of each entry point, in seconds.
+        runs (int): The number of runs per entry point.
+
+    Returns:
+        list: The measurements of each entry point, with its budget and
+              whether it passed.
+    """
+    results = []
+    for module, budget in budgets.items():
+        result = measure(module=module, runs=runs)
+        result['entry_point'] = module
+        result['budget_seconds'] = budget
+        result['passed'] = (result['import_seconds'] <= budget
+                            and len(result['heavy_modules']) == 0)
+        results.append(result)
+    return results
+
+
+def main():
+    # Optional arguments: {"budgets": {"Combination": 1.0, ...}, "runs": 5}
+    data = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    results = check(budgets={**BUDGETS, **data.get('budgets', {})},
+                    runs=data.get('runs', RUNS))
+    for result in results:
+        print(json.dumps(result))
+    if not all(result['passed'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+import json
+import sys
+import time
+import threading
+import traceback
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Worker(object):
+    """
+    A long-lived benchmark worker speaking newline-delimited JSON.
+
+    The worker reads one JSON request per line from stdin and writes one
+    JSON response per line to stdout. Embedding models and vector stores
+    are kept open between requests, so only the first benchmark of a model
+    pays for importing the libraries and loading the model. Models are held
+    in an EmbeddingPool: once they exceed its memory budget, the least
+    recently used ones are unloaded together with their stores.
+
+    Requests have the form {"id": ..., "type": ..., "data": {...}} where
+    type is one of 'start-benchmark', 'generate-query', 'generate-queries',
+    'status' or 'shutdown'. Responses echo the id and type and carry either
+    {"ok": true, "result": ...} or {"ok": false, "error": ...}. A request
+    may first send partial results with "done": false; its last response
+    has "done": true. While it runs, a request also sends progress events
+    (see vectorstores.progress) as {"ok": true, "done": false,
+    "progress": {...}}, without a result.
+
+    Benchmarks run one at a time on a background thread, so 'status' and
+    'shutdown' are answered while they run. Query generations run on
+    threads of their own, so they are not queued behind a benchmark.
+
+    Attributes:
+        REQUEST_TYPES (set): Supported request types.
+        QUERY_WORKERS (int): Query generations run at once.
+        embedding_pool (EmbeddingPool): Loaded embedding models by model name.
+        vectorstores (dict): Open vector stores by (model, strategy, store, options).
+
+    Methods:
+        __init__: Initialize the worker.
+        get_embedding: Get a loaded embedding model.
+        get_vectorstore: Get an open vector store.
+        start_benchmark: Run a benchmark request.
+        generate_query: Run a query generation request.
+        generate_queries: Run a batch query generation request.
+        status: Get the state of the worker.
+        handle: Handle a single request.
+        serve: Serve requests until shutdown or end of input.
+    """
+
+    REQUEST_TYPES = {'start-benchmark',
+                     'generate-query',
+                     'generate-queries',
+                     'status',
+                     'shutdown'}
+
+    QUERY_WORKERS = 4
+
+    def __init__(self,
+                 stdout=sys.stdout,
+                 max_model_bytes: int | None = None
+                 ) -> None:
+        """
+        Initialize the worker.
+
+        Args:
+            stdout: The stream responses are written to.
+            max_model_bytes (int): Memory budget of the loaded embedding
+                                   models, EmbeddingPool's default if None.
+        """
+        from embeddings.pool import EmbeddingPool
+        self.embedding_pool = EmbeddingPool(
+            max_bytes=max_model_bytes or EmbeddingPool.DEFAULT_MAX_BYTES,
+            on_evict=self._release_model)
+        self.vectorstores = dict()
+        self._stdout = stdout
+        self._write_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._query_executor = ThreadPoolExecutor(max_workers=Worker.QUERY_WORKERS)
+        self._started = time.time()
+        self._state_lock = threading.Lock()
+        self._pending = 0
+        self._handled = 0
+        self._current = []
+
+    def get_embedding(self,
+                      model_name: str):
+        """
+        Get a loaded embedding model, loading it on first use.
+
+        Args:
+            model_name (str): The name of the embedding model.
+
+        Returns:
+            BaseEmbedding: The embedding model.
+        """
+        return self.embedding_pool.get(model_name)
+
+    def _release_model(self,
+                       model_name: str) -> None:
+        # Close the stores of an evicted model so that it can be freed
+        for key in [k for k in self.vectorstores if k[0] == model_name]:
+            del self.vectorstores[key]
+
+    def get_vectorstore(self,
+                        model_name: str,
+                        strategy: str,
+                        store: str = 'Chroma',
+                        options: dict | None = None):
+        """
+        Get an open vector store, opening it on first use.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            strategy (str): The search strategy.
+            store (str): The name of the vector store.
+            options (dict): Keyword arguments of the store's constructor.
+
+        Returns:
+            BaseVectorstore: The vector store.
+        """
+        key = (model_name, strategy, store, json.dumps(options or {}, sort_keys=True))
+        if key not in self.vectorstores:
+            from Combination import create_vectorstore
+            # Stores persist one database per model, so only one strategy
+            # or configuration of a model can be open at a time
+            for other in [k for k in self.vectorstores
+                          if k[0] == model_name and k[2] == store]:
+                del self.vectorstores[other]
+            self.vectorstores[key] = create_vectorstore(
+                store=store,
+                embedding=self.get_embedding(model_name),
+                strategy=strategy,
+                options=options)
+        return self.vectorstores[key]
+
+    def start_benchmark(self,
+                        data: dict,
+                        emit) -> list[dict]:
+        """
+        Run a benchmark request.
+
+        When the request gives lists of models, strategies or stores, the
+        report of each combination is emitted as soon as it is done, and
+        the open stores of those models and stores are closed.
+
+        Args:
+            data (dict): The same payload Combination.py takes as argument.
+            emit (Callable): Sends a partial result of the request.
+
+        Returns:
+            list: The reports of the benchmark.
+        """
+        from Combination import is_matrix, run_matrix, run_benchmark, get_store_kwargs
+        if is_matrix(data):
+            # The matrix opens its own stores over the same databases and
+            # may rebuild them, so the open stores would go stale
+            as_list = lambda value: value if isinstance(value, list) else [value]
+            models = set(as_list(data['selectedModel']))
+            stores = set(as_list(data.get('selectedStore', 'Chroma')))
+            for key in [k for k in self.vectorstores
+                        if k[0] in models and k[2] in stores]:
+                del self.vectorstores[key]
+            return run_matrix(data=data,
+                              pool=self.embedding_pool,
+                              emit=lambda report: emit([report]))
+        db_model = self.get_vectorstore(model_name=data['selectedModel'],
+                                        strategy=data['selectedStrategy'],
+                                        store=data.get('selectedStore', 'Chroma'),
+                                        options=get_store_kwargs(data))
+        return run_benchmark(data=data, db_model=db_model)
+
+    def generate_query(self,
+                       data: dict,
+                       emit) -> list:
+        """
+        Run a query generation request.
+
+        Args:
+            data (dict): The same payload QueryGeneration.py takes as argument.
+            emit (Callable): Sends a partial result of the request.
+
+        Returns:
+            list: The generated query and the index of its line.
+        """
+        from QueryGeneration import generate_query
+        return generate_query(data)
+
+    def generate_queries(self,
+                         data: dict,
+                         emit) -> list:
+        """
+        Run a batch query generation request.
+
+        The query of each source is emitted as [query, index] as soon as it
+        is generated, where index is the source's entry of 'indices' (its
+        position if missing), as for a 'generate-query' request.
+
+        Args:
+            data (dict): The payload of QueryGeneration.generate_queries,
+                         plus 'indices'.
+            emit (Callable): Sends a partial result of the request.
+
+        Returns:
+            list: The result of every source.
+        """
+        from QueryGeneration import generate_queries
+        indices = data.get('indices')
+        return generate_queries(
+            data,
+            emit=lambda position, result: emit(
+                [result['query'], position if indices is None else indices[position]]))
+
+    def status(self) -> dict:
+        """
+        Get the state of the worker.
+
+        Returns:
+            dict: The running requests, the number of queued and handled
+                  requests, the loaded models and their memory, the open
+                  stores and the uptime.
+        """
+        return {'current': list(self._current),
+                'pending': self._pending,
+                'handled': self._handled,
+                'models': self.embedding_pool.names(),
+                'models_bytes': self.embedding_pool.memory(),
+                'vectorstores': [list(key) for key in self.vectorstores],
+                'uptime': round(time.time() - self._started, 3)}
+
+    def _respond(self,
+                 request: dict,
+                 ok: bool,
+                 payload,
+                 done: bool = True) -> None:
+        response = {'id': request.get('id'),
+                    'type': request.get('type'),
+                    'ok': ok,
+                    'done': done,
+                    'result' if ok else 'error': payload}
+        with self._write_lock:
+            self._stdout.write(json.dumps(response) + '\n')
+            self._stdout.flush()
+
+    def _progress(self,
+                  request: dict,
+                  event: dict) -> None:
+        response = {'id': request.get('id'),
+                    'type': request.get('type'),
+                    'ok': True,
+                    'done': False,
+                    'progress': event}
+        with self._write_lock:
+            self._stdout.write(json.dumps(response) + '\n')
+            self._stdout.flush()
+
+    def _run(self,
+             request: dict) -> None:
+        from vectorstores.progress import set_sink
+        handler = {'start-benchmark': self.start_benchmark,
+                   'generate-query': self.generate_query,
+                   'generate-queries': self.generate_queries}[request['type']]
+        # Only benchmarks report progress, and only one runs at a time
+        is_benchmark = request['type'] == 'start-benchmark'
+        with self._state_lock:
+            self._current.append(request.get('id'))
+        if is_benchmark:
+            set_sink(lambda event: self._progress(request, event))
+        try:
+            emit = lambda partial: self._respond(request, True, partial, done=False)
+            result = handler(request.get('data', {}), emit)
+            self._respond(request, True, result)
+        except Exception as error:
+            traceback.print_exc(file=sys.stderr)
+            self._respond(request, False, str(error))
+        finally:
+            if is_benchmark:
+                set_sink(None)
+            with self._state_lock:
+                self._current.remove(request.get('id'))
+                self._pending -= 1
+                self._handled += 1
+
+    def handle(self,
+               request: dict) -> bool:
+        """
+        Handle a single request.
+
+        Args:
+            request (dict): The decoded request.
+
+        Returns:
+            bool: False once the worker should stop reading requests.
+        """
+        request_type = request.get('type')
+        if request_type not in Worker.REQUEST_TYPES:
+            self._respond(request, False, f"Unsupported request type: {request_type}")
+        elif request_type == 'status':
+            self._respond(request, True, self.status())
+        elif request_type == 'shutdown':
+            self._executor.shutdown(wait=True)
+            self._query_executor.shutdown(wait=True)
+            self._respond(request, True, self.status())
+            return False
+        else:
+            with self._state_lock:
+                self._pending += 1
+            executor = (self._executor if request_type == 'start-benchmark'
+                        else self._query_executor)
+            executor.submit(self._run, request)
+        return True
+
+    def serve(self,
+              stdin=sys.stdin) -> None:
+        """
+        Serve requests until shutdown or end of input.
+
+        Args:
+            stdin: The stream requests are read from.
+        """
+        # Anything the libraries print goes to stderr so that stdout only
+        # ever carries protocol lines. Requests run concurrently, so stdout
+        # is redirected once for all of them rather than by each request.
+        with redirect_stdout(sys.stderr):
+            for line in stdin:
+                if len(line.strip()) == 0:
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as error:
+                    self._respond({}, False, f"Invalid request: {error}")
+                    continue
+                if not self.handle(request):
+                    return
+            self._executor.shutdown(wait=True)
+            self._query_executor.shutdown(wait=True)
+
+
+def main():
+    Worker(stdout=sys.stdout).serve(stdin=sys.stdin)
+
+
+if __name__ == "__main__":
+    main()
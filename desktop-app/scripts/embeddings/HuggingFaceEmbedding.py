@@ -1,4 +1,5 @@
 from .base import BaseEmbedding
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
@@ -6,36 +7,59 @@ from tqdm import tqdm
 class HuggingFaceEmbedding(BaseEmbedding):
 
     def __init__(self,
-                 model_name : str) -> None:
+                 model_name : str,
+                 batch_size : int = BaseEmbedding.DEFAULT_BATCH_SIZE) -> None:
         super().__init__()
         self.name = model_name
+        self.batch_size = batch_size
         self.model = SentenceTransformer(model_name)
 
     def from_text(self, text: str) -> list[float]:
         return list(self.model.encode(text))
-    
 
-    def from_texts(self, texts: list[str]) -> list[list[float]]:
-        
-        embeddings = []
+
+    def from_texts(self,
+                   texts: list[str],
+                   batch_size: int = None) -> np.ndarray:
+
+        batch_size = batch_size or self.batch_size
+        # Preallocate the output so every batch is written in place into
+        # one contiguous float32 matrix
+        embeddings = np.empty((len(texts), self.get_dimension()),
+                              dtype=np.float32)
+        # SentenceTransformer.encode tokenizes every batch itself, so the
+        # texts are bucketed by their number of characters, as encode sorts
+        # them, rather than tokenized a second time. Only the ONNX models,
+        # which tokenize once before batching, report token padding.
+        lengths = [len(text) for text in texts]
         with tqdm(total=len(texts),
                   desc='Finding the embeddings',
                   ncols=80) as pbar:
-            for text in texts:
-                embeddings.append(self.from_text(text=text))
-                                  
+            for batch in self.bucket_batches(lengths, batch_size):
+                embeddings[batch] = self.model.encode(
+                    [texts[idx] for idx in batch],
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False)
+                pbar.update(len(batch))
+
         return embeddings
 
 
     def get_name(self):
         return self.name
-    
+
     def get_function(self):
         return self.model.encode
-    
+
     def get_dimension(self):
         return self.model.get_sentence_embedding_dimension()
-    
+
+    def get_memory_size(self) -> int:
+        # The weights and buffers dominate the memory of a loaded model
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
 
 
 
@@ -50,4 +74,4 @@ def main():
 
 
 
-if __name__ == "__main__": main()
\ No newline at end of file
+if __name__ == "__main__": main()
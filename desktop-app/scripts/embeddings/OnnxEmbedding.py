@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+from .base import BaseEmbedding
+import numpy as np
+from tqdm import tqdm
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """
+    A sentence-transformers model run on CPU with ONNX Runtime, optionally
+    with its weights dynamically quantized to int8.
+
+    The first use of a model exports its transformer to ONNX with PyTorch
+    and records its pooling; the exported model, its int8 variant and its
+    tokenizer are kept under `directory`, so later runs only need
+    onnxruntime and the tokenizer.
+
+    The name of the embedding carries the variant, e.g.
+    'all-MiniLM-L6-v2@onnx-int8', so that caches, stores and reports keep
+    the fp32 and int8 variants of a model apart.
+
+    Attributes:
+        MODELS_DIRECTORY (str): Default directory of the exported models.
+        OPSET (int): ONNX opset of the exported models.
+        model_name (str): Name of the sentence-transformers model.
+        quantize (bool): Whether the int8 variant is used.
+        name (str): Name of the embedding.
+        batch_size (int): Default number of texts encoded per batch.
+        model_directory (str): Directory of the exported model.
+
+    Methods:
+        __init__: Load the exported model, exporting it if needed.
+        export: Export a sentence-transformers model to ONNX.
+        from_text: Embed a single text.
+        from_texts: Embed texts in batches.
+        get_name: Get the name of the embedding.
+        get_function: Get the embedding function.
+        get_dimension: Get the dimension of the embeddings.
+        get_memory_size: Get the size of the loaded weights.
+    """
+
+    MODELS_DIRECTORY = os.path.join(os.path.abspath(os.pardir), "models", "onnx")
+    OPSET = 14
+
+    def __init__(self,
+                 model_name: str,
+                 quantize: bool = False,
+                 batch_size: int = BaseEmbedding.DEFAULT_BATCH_SIZE,
+                 num_threads: int | None = None,
+                 directory: str = MODELS_DIRECTORY) -> None:
+        """
+        Load the exported model, exporting it if needed.
+
+        Args:
+            model_name (str): Name of the sentence-transformers model.
+            quantize (bool): Use the weights dynamically quantized to int8.
+            batch_size (int): Default number of texts encoded per batch.
+            num_threads (int): Number of threads of ONNX Runtime, all cores if None.
+            directory (str): Directory of the exported models.
+        """
+        import onnxruntime
+        from transformers import AutoTokenizer
+        super().__init__()
+        self.model_name = model_name
+        self.quantize = quantize
+        self.name = f"{model_name}@onnx-int8" if quantize else f"{model_name}@onnx"
+        self.batch_size = batch_size
+        self.model_directory = os.path.join(directory, re.sub(r'[^\w.-]', '_', model_name))
+        if not os.path.exists(os.path.join(self.model_directory, 'config.json')):
+            OnnxEmbedding.export(model_name=model_name, model_directory=self.model_directory)
+        with open(os.path.join(self.model_directory, 'config.json'), 'r') as fn:
+            self._config = json.load(fn)
+
+        self._model_path = os.path.join(self.model_directory, 'model.onnx')
+        if quantize:
+            self._model_path = os.path.join(self.model_directory, 'model.int8.onnx')
+            if not os.path.exists(self._model_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(model_input=os.path.join(self.model_directory, 'model.onnx'),
+                                 model_output=self._model_path,
+                                 weight_type=QuantType.QInt8)
+
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+        self._session = onnxruntime.InferenceSession(self._model_path,
+                                                     sess_options=options,
+                                                     providers=['CPUExecutionProvider'])
+        self._input_names = [node.name for node in self._session.get_inputs()]
+        self._tokenizer = AutoTokenizer.from_pretrained(self.model_directory)
+
+    @staticmethod
+    def export(model_name: str,
+               model_directory: str) -> None:
+        """
+        Export a sentence-transformers model to ONNX.
+
+        Writes model.onnx, the tokenizer and a config.json recording the
+        pooling, normalization, dimension and maximum sequence length.
+
+        Args:
+            model_name (str): Name of the sentence-transformers model.
+            model_directory (str): Directory the model is exported to.
+
+        Raises:
+            ValueError: If the model does not pool with the mean or the CLS token.
+        """
+        import torch
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name, device='cpu')
+        transformer, pooling = model[0], model[1]
+        if pooling.pooling_mode_mean_tokens:
+            pooling_mode = 'mean'
+        elif pooling.pooling_mode_cls_token:
+            pooling_mode = 'cls'
+        else:
+            error_msg = f"{model_name} pooling is not supported"
+            raise ValueError(error_msg)
+
+        os.makedirs(model_directory, exist_ok=True)
+        inputs = transformer.tokenizer(['Hello world'], return_tensors='pt')
+        input_names = list(inputs.keys())
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+        transformer.auto_model.eval()
+        with torch.no_grad():
+            torch.onnx.export(transformer.auto_model,
+                              (dict(inputs),),
+                              os.path.join(model_directory, 'model.onnx'),
+                              input_names=input_names,
+                              output_names=['last_hidden_state'],
+                              dynamic_axes=dynamic_axes,
+                              opset_version=OnnxEmbedding.OPSET)
+        transformer.tokenizer.save_pretrained(model_directory)
+
+        # Written last, so that an interrupted export is started over
+        with open(os.path.join(model_directory, 'config.json'), 'w') as fn:
+            json.dump({'model': model_name,
+                       'pooling': pooling_mode,
+                       'normalize': any(type(module).__name__ == 'Normalize'
+                                        for module in model),
+                       'dimension': model.get_sentence_embedding_dimension(),
+                       'max_length': transformer.max_seq_length}, fn)
+
+    def _tokenize(self,
+                  texts: list[str],
+                  padding: bool) -> dict:
+        return self._tokenizer(texts,
+                               padding=padding,
+                               truncation=True,
+                               max_length=self._config['max_length'],
+                               return_tensors='np' if padding else None)
+
+    def _run(self,
+             encoded) -> np.ndarray:
+        # Pool the hidden states of a padded batch of tokenized texts
+        feed = {name: np.asarray(encoded[name], dtype=np.int64) for name in self._input_names}
+        hidden = self._session.run(None, feed)[0]
+        if self._config['pooling'] == 'cls':
+            pooled = hidden[:, 0]
+        else:
+            mask = np.asarray(encoded['attention_mask'], dtype=np.float32)[:, :, None]
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self._config['normalize']:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled
+
+    def from_text(self, text: str) -> list[float]:
+        return list(self._run(self._tokenize([text], padding=True))[0])
+
+    def from_texts(self,
+                   texts: list[str],
+                   batch_size: int = None) -> np.ndarray:
+
+        batch_size = batch_size or self.batch_size
+        embeddings = np.empty((len(texts), self.get_dimension()),
+                              dtype=np.float32)
+        if len(texts) == 0:
+            return embeddings
+        start = time.perf_counter()
+        # The texts are tokenized once, unpadded: the token lengths give the
+        # buckets, and each bucket is only padded to its longest text
+        encoded = self._tokenize(texts, padding=False)
+        lengths = [len(ids) for ids in encoded['input_ids']]
+        batches = self.bucket_batches(lengths, batch_size)
+        with tqdm(total=len(texts),
+                  desc='Finding the embeddings',
+                  ncols=80) as pbar:
+            for batch in batches:
+                features = {name: [values[idx] for idx in batch]
+                            for name, values in encoded.items()}
+                embeddings[batch] = self._run(self._tokenizer.pad(features,
+                                                                  padding=True,
+                                                                  return_tensors='np'))
+                pbar.update(len(batch))
+        self.record_batches(lengths, batches, batch_size,
+                            seconds=time.perf_counter() - start)
+
+        return embeddings
+
+    def get_name(self):
+        return self.name
+
+    def get_function(self):
+        # Chroma's embedding functions return lists of floats, not arrays
+        def embed(texts: list[str]) -> list[list[float]]:
+            return self.from_texts(list(texts)).tolist()
+        return embed
+
+    def get_dimension(self):
+        return self._config['dimension']
+
+    def get_memory_size(self) -> int:
+        # The session holds the weights, i.e. about the size of the model file
+        return os.path.getsize(self._model_path)
+
+
+def main():
+
+    fp32 = OnnxEmbedding('all-MiniLM-L6-v2')
+    int8 = OnnxEmbedding('all-MiniLM-L6-v2', quantize=True)
+    texts = ['Hello world', 'Describe the ICD-10 Code A01.2']
+    print(np.sum(fp32.from_texts(texts) * int8.from_texts(texts), axis=1))
+
+
+if __name__ == "__main__": main()
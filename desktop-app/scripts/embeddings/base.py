@@ -1,13 +1,102 @@
 
 
+import threading
 from abc import ABC, abstractmethod
-from sentence_transformers import SentenceTransformer
+import numpy as np
 
 
 class BaseEmbedding(ABC):
 
+    DEFAULT_BATCH_SIZE = 64
+
     def __init__(self) -> None:
         super().__init__()
+        self._batch_stats = {'texts': 0,
+                             'tokens': 0,
+                             'padded_tokens': 0,
+                             'unbucketed_padded_tokens': 0,
+                             'seconds': 0.0}
+        self._batch_stats_lock = threading.Lock()
+
+    @staticmethod
+    def bucket_batches(lengths,
+                       batch_size: int) -> list[np.ndarray]:
+        """
+        Group texts of similar token lengths into the same batches.
+
+        Every text of a batch is padded to the longest one, so batching
+        texts by length instead of by position cuts the padding. The
+        longest batches come first, so running out of memory shows at once.
+
+        Args:
+            lengths (Sequence): The length of each text, in tokens or in
+                                any unit the model's padding follows.
+            batch_size (int): The number of texts per batch.
+
+        Returns:
+            list: The positions of the texts of each batch; writing each
+                  batch's output at its positions restores the input order.
+        """
+        order = np.argsort(-np.asarray(lengths), kind='stable')
+        return [order[start:start + batch_size]
+                for start in range(0, len(order), batch_size)]
+
+    def record_batches(self,
+                       lengths,
+                       batches: list[np.ndarray],
+                       batch_size: int,
+                       seconds: float) -> None:
+        """
+        Add a call of `from_texts` to the batching statistics.
+
+        Args:
+            lengths (Sequence): The token length of each text.
+            batches (list): The positions of the texts of each batch.
+            batch_size (int): The number of texts per batch.
+            seconds (float): The time spent encoding.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if len(lengths) == 0:
+            return
+        padded = sum(len(batch) * int(lengths[batch].max()) for batch in batches)
+        unbucketed = sum(len(chunk) * int(chunk.max())
+                         for chunk in (lengths[start:start + batch_size]
+                                       for start in range(0, len(lengths), batch_size)))
+        with self._batch_stats_lock:
+            self._batch_stats['texts'] += len(lengths)
+            self._batch_stats['tokens'] += int(lengths.sum())
+            self._batch_stats['padded_tokens'] += padded
+            self._batch_stats['unbucketed_padded_tokens'] += unbucketed
+            self._batch_stats['seconds'] += seconds
+
+    def get_batch_stats(self) -> dict:
+        """
+        Get the cumulative batching statistics of the model: the number of
+        texts and tokens encoded, the tokens processed with and without
+        length bucketing once padded, and the time spent encoding.
+        """
+        with self._batch_stats_lock:
+            return dict(self._batch_stats)
+
+    @staticmethod
+    def batch_report(before: dict,
+                     after: dict) -> dict:
+        """
+        Get the report fields of the encoding done between two snapshots
+        of `get_batch_stats`.
+
+        Returns:
+            dict: 'Padding ratio', the share of padding in the encoded
+                  tokens, 'Unbucketed padding ratio', the same without
+                  length bucketing, and 'Embed tokens/s'; empty when
+                  nothing was encoded or the model does not count tokens.
+        """
+        delta = {key: after[key] - before[key] for key in after}
+        if delta['tokens'] == 0:
+            return dict()
+        return {'Padding ratio': round(1 - delta['tokens'] / delta['padded_tokens'], 4),
+                'Unbucketed padding ratio': round(1 - delta['tokens'] / delta['unbucketed_padded_tokens'], 4),
+                'Embed tokens/s': round(delta['tokens'] / max(delta['seconds'], 1e-9), 2)}
 
 
     @abstractmethod
@@ -26,19 +115,34 @@ class BaseEmbedding(ABC):
 
     @abstractmethod
     def from_texts(self,
-                   texts : list[str]) -> list[list[float]]:
+                   texts : list[str],
+                   batch_size : int = None) -> np.ndarray:
+        """
+        Encode the texts in batches of `batch_size`.
+
+        Implementations must return a single C-contiguous float32 array of
+        shape (len(texts), dimension) whose rows follow the order of `texts`.
+        """
         pass
 
 
     def get_dimension(self):
         pass
 
+    def get_memory_size(self) -> int | None:
+        """
+        Get the memory held by the loaded model, in bytes, or None when
+        unknown, in which case EmbeddingPool measures it.
+        """
+        return None
+
 
 
 class TestEmbedding(BaseEmbedding):
 
     def __init__(self,
                  model_name: str) -> None:
+        from sentence_transformers import SentenceTransformer
         super().__init__()
         self.name = model_name
         self.model = SentenceTransformer(model_name)
@@ -48,9 +152,13 @@ class TestEmbedding(BaseEmbedding):
         return self.model.encode(text)
     
 
-    def from_texts(self, texts: list[str]) -> list[list[float]]:
-        return list(map(self.from_text,
-                        texts))
+    def from_texts(self,
+                   texts: list[str],
+                   batch_size: int = None) -> np.ndarray:
+        embeddings = self.model.encode(texts,
+                                       batch_size=batch_size or self.DEFAULT_BATCH_SIZE,
+                                       convert_to_numpy=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
 
 
     def get_name(self):
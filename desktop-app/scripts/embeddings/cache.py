@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import threading
+import hashlib
+import numpy as np
+from .base import BaseEmbedding
+
+
+class EmbeddingCache(object):
+    """
+    A persistent, content-addressed cache of embeddings stored in SQLite.
+
+    Every vector is keyed by (embedding model name, sha256 of the text) and
+    stored as a raw float32 blob. Each hit refreshes the entry's last-used
+    tick, kept in memory and written once per `embed` call, with its
+    `put` if any, rather than once per lookup, and entries are evicted least recently used first once the total
+    size of the stored vectors exceeds `max_bytes`.
+
+    Attributes:
+        DEFAULT_MAX_BYTES (int): Default size budget of the stored vectors.
+        path (str): Path of the SQLite database file.
+        max_bytes (int): Size budget of the stored vectors.
+
+    Methods:
+        __init__: Open (or create) the cache database.
+        hash_text: Get the content hash used as the cache key of a text.
+        get: Look up the cached embeddings of the given hashes.
+        put: Store embeddings for the given hashes.
+        embed: Embed texts, only calling the model for cache misses.
+        flush: Write the last-used ticks of the hits so far.
+        evict: Evict least recently used entries until under the budget.
+        close: Close the database connection.
+    """
+
+    DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+    # SQLite's default limit on the number of host parameters is 999
+    _MAX_PARAMS = 900
+    # The number of refreshed ticks held in memory before they are written
+    _MAX_TOUCHED = 65536
+
+    def __init__(self,
+                 path: str,
+                 max_bytes: int = DEFAULT_MAX_BYTES
+                 ) -> None:
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            max_bytes (int): Size budget of the stored vectors.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS embeddings (
+                                  model TEXT NOT NULL,
+                                  hash TEXT NOT NULL,
+                                  vector BLOB NOT NULL,
+                                  size INTEGER NOT NULL,
+                                  last_used INTEGER NOT NULL,
+                                  PRIMARY KEY (model, hash))""")
+        self._conn.execute("""CREATE INDEX IF NOT EXISTS embeddings_lru
+                              ON embeddings (last_used)""")
+        self._conn.commit()
+        row = self._conn.execute("SELECT MAX(last_used) FROM embeddings").fetchone()
+        self._tick = row[0] or 0
+        # The size of the stored vectors is kept up to date by `put` and
+        # `_evict`, so the table is only summed once
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        self._total_bytes = row[0]
+        # The last-used tick of every hit not yet written, by (model, hash)
+        self._touched = dict()
+        self._closed = False
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """
+        Get the content hash used as the cache key of a text.
+
+        Args:
+            text (str): The text to hash.
+
+        Returns:
+            str: The hex sha256 digest of the utf-8 encoded text.
+        """
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self,
+            model_name: str,
+            hashes: list[str]
+            ) -> dict[str, np.ndarray]:
+        """
+        Look up the cached embeddings of the given hashes.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            hashes (list): The content hashes to look up.
+
+        Returns:
+            dict: A mapping of every cached hash to its embedding.
+        """
+        found = dict()
+        with self._lock:
+            self._tick += 1
+            for start in range(0, len(hashes), EmbeddingCache._MAX_PARAMS):
+                batch = hashes[start:start + EmbeddingCache._MAX_PARAMS]
+                marks = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    [model_name, *batch]).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+                    self._touched[(model_name, key)] = self._tick
+            if len(self._touched) >= EmbeddingCache._MAX_TOUCHED:
+                self._flush()
+                self._conn.commit()
+        return found
+
+    def put(self,
+            model_name: str,
+            hashes: list[str],
+            embeddings: np.ndarray
+            ) -> None:
+        """
+        Store embeddings for the given hashes.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            hashes (list): The content hashes of the embedded texts.
+            embeddings (np.ndarray): The embeddings, one row per hash.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self._tick += 1
+            # A hash is the content of its text, so an entry stored
+            # meanwhile by another caller already holds the same vector
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?, ?)",
+                ((model_name, key, row.tobytes(), row.nbytes, self._tick)
+                 for key, row in zip(hashes, embeddings)))
+            if len(embeddings) > 0:
+                self._total_bytes += cursor.rowcount * embeddings[0].nbytes
+            self._flush()
+            self._conn.commit()
+            self._evict()
+
+    def embed(self,
+              embedding: BaseEmbedding,
+              texts: list[str],
+              batch_size: int = None
+              ) -> np.ndarray:
+        """
+        Embed texts, only calling the model for cache misses.
+
+        Args:
+            embedding (BaseEmbedding): The embedding model to use on misses.
+            texts (list): The texts to embed.
+            batch_size (int): The batch size used for the misses.
+
+        Returns:
+            np.ndarray: A float32 array with one row per text, in order.
+        """
+        model_name = embedding.get_name()
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        found = self.get(model_name=model_name, hashes=hashes)
+
+        # Embed every distinct missing text once
+        missing = dict()
+        for key, text in zip(hashes, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if len(missing) > 0:
+            computed = embedding.from_texts(list(missing.values()),
+                                            batch_size=batch_size)
+            self.put(model_name=model_name,
+                     hashes=list(missing.keys()),
+                     embeddings=computed)
+            found.update(zip(missing.keys(), computed))
+        else:
+            # `put` writes the ticks of the hits, a full hit writes them here
+            self.flush()
+
+        if len(texts) == 0:
+            return np.empty((0, embedding.get_dimension()), dtype=np.float32)
+        return np.stack([found[key] for key in hashes]).astype(np.float32, copy=False)
+
+    def _flush(self) -> None:
+        if len(self._touched) == 0:
+            return
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND hash = ?",
+            ((tick, model, key) for (model, key), tick in self._touched.items()))
+        self._touched.clear()
+
+    def flush(self) -> None:
+        """
+        Write the last-used ticks of the hits so far.
+        """
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Other processes sharing the database (e.g. the worker and a
+        # command line run) change its size too, so count it again
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        self._total_bytes = row[0]
+        if self._total_bytes <= self.max_bytes:
+            return
+        excess = self._total_bytes - self.max_bytes
+        rows = self._conn.execute(
+            "SELECT model, hash, size FROM embeddings ORDER BY last_used")
+        victims = []
+        for model, key, size in rows:
+            victims.append((model, key))
+            excess -= size
+            self._total_bytes -= size
+            if excess <= 0:
+                break
+        self._conn.executemany(
+            "DELETE FROM embeddings WHERE model = ? AND hash = ?", victims)
+        self._conn.commit()
+
+    def evict(self) -> None:
+        """
+        Evict least recently used entries until under the size budget.
+        """
+        with self._lock:
+            # Evict on the written ticks, so that recent hits are spared
+            self._flush()
+            self._conn.commit()
+            self._evict()
+
+    def close(self) -> None:
+        """
+        Close the database connection, writing the pending last-used ticks.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            self._conn.commit()
+            self._conn.close()
+            self._closed = True
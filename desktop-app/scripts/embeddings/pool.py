@@ -0,0 +1,175 @@
+import gc
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable
+from .base import BaseEmbedding
+
+
+def resident_bytes() -> int:
+    """
+    Get the resident memory of the process, in bytes, 0 if unknown.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as fn:
+            return int(fn.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def load_embedding(model_name: str) -> BaseEmbedding:
+    """
+    Load an embedding model from its name.
+
+    A plain name loads the sentence-transformers model with PyTorch, and
+    the suffixes '@onnx' and '@onnx-int8' load it with ONNX Runtime, in
+    fp32 or with int8 weights, e.g. 'all-MiniLM-L6-v2@onnx-int8'.
+
+    Args:
+        model_name (str): The name of the model, with its backend suffix.
+
+    Returns:
+        BaseEmbedding: The loaded model, named `model_name`.
+
+    Raises:
+        ValueError: If the backend is not supported.
+    """
+    name, _, backend = model_name.partition('@')
+    if backend == '':
+        from .HuggingFaceEmbedding import HuggingFaceEmbedding
+        return HuggingFaceEmbedding(name)
+    if backend in ('onnx', 'onnx-int8'):
+        from .OnnxEmbedding import OnnxEmbedding
+        return OnnxEmbedding(name, quantize=backend == 'onnx-int8')
+    error_msg = f"{backend} embedding backend is not supported"
+    raise ValueError(error_msg)
+
+
+class EmbeddingPool(object):
+    """
+    A pool of loaded embedding models shared by name.
+
+    Getting a model returns the instance already loaded under that name, or
+    loads it. Each model's memory is measured when it is loaded, and the
+    least recently used models are evicted once the pool holds more than
+    `max_bytes`. The model just requested is never evicted, so a model
+    larger than the budget is still served, alone.
+
+    An evicted model is only freed once nothing else references it, so
+    holders of models (e.g. open vector stores) are told through
+    `on_evict` to let go of them.
+
+    Attributes:
+        DEFAULT_MAX_BYTES (int): Default memory budget of the loaded models.
+        max_bytes (int): Memory budget of the loaded models.
+
+    Methods:
+        __init__: Initialize an empty pool.
+        get: Get a loaded model, loading it on first use.
+        evict: Drop a model from the pool.
+        names: Get the names of the loaded models, least recently used first.
+        sizes: Get the measured memory of the loaded models.
+        memory: Get the total measured memory of the loaded models.
+        __contains__: Check if a model is loaded.
+    """
+
+    DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+    def __init__(self,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 loader: Callable[[str], BaseEmbedding] = load_embedding,
+                 on_evict: Callable[[str], None] | None = None
+                 ) -> None:
+        """
+        Initialize an empty pool.
+
+        Args:
+            max_bytes (int): Memory budget of the loaded models.
+            loader (Callable): Loads a model from its name,
+                               `load_embedding` by default.
+            on_evict (Callable): Called with the name of every evicted model.
+        """
+        self.max_bytes = max_bytes
+        self._loader = loader
+        self._on_evict = on_evict
+        # Loads run under the lock too: loading two models at once could
+        # overshoot the budget before either is measured
+        self._lock = threading.RLock()
+        self._models = OrderedDict()
+        self._sizes = dict()
+
+    def get(self,
+            model_name: str) -> BaseEmbedding:
+        """
+        Get a loaded model, loading it on first use.
+
+        Args:
+            model_name (str): The name of the model.
+
+        Returns:
+            BaseEmbedding: The shared instance of the model.
+        """
+        with self._lock:
+            if model_name in self._models:
+                self._models.move_to_end(model_name)
+                return self._models[model_name]
+
+            before = resident_bytes()
+            embedding = self._loader(model_name)
+            size = embedding.get_memory_size()
+            if size is None:
+                size = max(0, resident_bytes() - before)
+            self._models[model_name] = embedding
+            self._sizes[model_name] = size
+
+            while self.memory() > self.max_bytes and len(self._models) > 1:
+                self.evict(next(iter(self._models)))
+            return embedding
+
+    def evict(self,
+              model_name: str) -> None:
+        """
+        Drop a model from the pool.
+
+        Args:
+            model_name (str): The name of the model.
+        """
+        with self._lock:
+            if model_name not in self._models:
+                return
+            del self._models[model_name]
+            del self._sizes[model_name]
+            if self._on_evict is not None:
+                self._on_evict(model_name)
+            gc.collect()
+
+    def names(self) -> list[str]:
+        """
+        Get the names of the loaded models, least recently used first.
+        """
+        with self._lock:
+            return list(self._models.keys())
+
+    def sizes(self) -> dict[str, int]:
+        """
+        Get the measured memory of each loaded model, in bytes.
+        """
+        with self._lock:
+            return dict(self._sizes)
+
+    def memory(self) -> int:
+        """
+        Get the total measured memory of the loaded models, in bytes.
+        """
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def __contains__(self,
+                     model_name: str) -> bool:
+        with self._lock:
+            return model_name in self._models
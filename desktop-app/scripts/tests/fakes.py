@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import numpy as np
+
+from embeddings.base import BaseEmbedding
+from vectorstores.base import BaseVectorstore
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    A deterministic stand-in of an embedding model: every text is embedded
+    as a unit vector seeded by the hash of its `key`, by default the whole
+    text.
+    """
+
+    DIMENSION = 8
+
+    def get_function(self):
+        return None
+
+    def get_name(self):
+        return 'fake-model'
+
+    def key(self, text):
+        return text
+
+    def from_text(self, text):
+        return self.from_texts([text])[0]
+
+    def from_texts(self, texts, batch_size=None):
+        rows = [np.random.default_rng(int(hashlib.sha256(self.key(text).encode('utf-8')).hexdigest(), 16))
+                .standard_normal(FakeEmbedding.DIMENSION)
+                for text in texts]
+        embeddings = np.array(rows, dtype=np.float32).reshape(-1, FakeEmbedding.DIMENSION)
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    def get_dimension(self):
+        return FakeEmbedding.DIMENSION
+
+
+class StoreTestCase(unittest.TestCase):
+    """
+    Runs every test with the databases of the stores and the shared
+    embedding cache in a temporary directory, removed after the test.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database_directory = os.path.join(self.directory.name, 'database')
+        self.patches = []
+        self.patch(mock.patch.object(BaseVectorstore, 'DATABASE_DIRECTORY', self.database_directory))
+        self.patch(mock.patch.object(BaseVectorstore, '_default_cache', None, create=True))
+
+    def tearDown(self):
+        if BaseVectorstore._default_cache is not None:
+            BaseVectorstore._default_cache.close()
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.directory.cleanup()
+
+    def patch(self, patch):
+        # Start a patch, stopped in reverse order after the test
+        self.patches.append(patch)
+        return patch.start()
+
+    def write_files(self, files: dict, name: str = 'data') -> str:
+        # Write {file name: content} under a directory of the test
+        data_directory = os.path.join(self.directory.name, name)
+        os.makedirs(data_directory, exist_ok=True)
+        for file_name, content in files.items():
+            with open(os.path.join(data_directory, file_name), 'w', encoding='utf-8') as fn:
+                fn.write(content)
+        return data_directory
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Answers Inference API requests with a query made from the first words
+    of the context, after an optional `delay`, so that query generation
+    runs offline.
+    """
+
+    delay = 0.0
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        prompt = json.loads(self.rfile.read(length))['inputs']
+        context = prompt.rsplit('question mark:', 1)[-1]
+        words = re.findall(r'\w+', context)[:8]
+        time.sleep(self.delay)
+        body = json.dumps([{'generated_text': f"What is {' '.join(words)}?"}])
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve_stand_in(port: int = 0,
+                   delay: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start a local stand-in of the Inference API on a background thread.
+
+    Args:
+        port (int): The port to listen on, any free port if 0.
+        delay (float): The time each answer takes, in seconds.
+
+    Returns:
+        ThreadingHTTPServer: The running server; its endpoint is
+                             f"http://127.0.0.1:{server.server_port}".
+    """
+    handler = type('StandInHandler', (StandInHandler,), {'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
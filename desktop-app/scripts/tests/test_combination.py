@@ -0,0 +1,127 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstores.Numpy import Numpy
+from vectorstores.base import BaseVectorstore
+from embeddings.pool import EmbeddingPool
+import Combination
+from fakes import FakeEmbedding, StoreTestCase
+
+
+class FirstWordEmbedding(FakeEmbedding):
+    # Texts starting with the same word get the same embedding, so a query
+    # ranks the files starting with it first
+
+    def key(self, text):
+        return text.split()[0]
+
+
+class NamedEmbedding(FirstWordEmbedding):
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+    def get_name(self):
+        return self.name
+
+    def get_memory_size(self):
+        return 1
+
+
+class TestQueryPairs(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data_directory = self.write_files({'a.txt': "alpha " * 20,
+                                                'b.txt': "beta " * 20,
+                                                'c.txt': "gamma " * 20})
+
+    def test_every_line_is_kept(self):
+        lines = [{'query': 'alpha', 'source': 'a.txt'},
+                 {'query': 'alpha', 'source': 'b.txt'},
+                 {'query': 'beta', 'source': 'b.txt'}]
+        self.assertEqual(Combination.get_query_pairs(lines),
+                         [('alpha', ['a.txt']), ('alpha', ['b.txt']), ('beta', ['b.txt'])])
+
+    def test_repeated_queries_are_ranked_per_line_and_embedded_once(self):
+        store = Numpy(embedding=FirstWordEmbedding(), strategy='l2', num_workers=1)
+        store.add_data(data_directory=self.data_directory)
+        combination = Combination.Combination(
+            db_model=store,
+            queries_path=None,
+            query_pairs=Combination.get_query_pairs(
+                [{'query': 'alpha', 'source': 'a.txt'},
+                 {'query': 'alpha', 'source': 'b.txt'},
+                 {'query': 'beta', 'source': 'b.txt'}]))
+        with mock.patch.object(store, 'embed_texts', wraps=store.embed_texts) as embed_texts:
+            all_k = combination.get_all_k(queries=[query for query, _ in combination.query_pairs],
+                                          sources=[sources for _, sources in combination.query_pairs],
+                                          matches=1)
+        self.assertEqual(len(all_k), 3)
+        self.assertEqual(all_k[0], 1)
+        self.assertGreater(all_k[1], 1)
+        self.assertEqual(all_k[2], 1)
+        embed_texts.assert_called_once_with(['alpha', 'beta'])
+
+
+    def test_latency_is_sampled_apart_from_the_query_cost(self):
+        store = Numpy(embedding=FirstWordEmbedding(), strategy='l2', num_workers=1)
+        store.add_data(data_directory=self.data_directory)
+        self.patch(mock.patch.object(Numpy, 'LATENCY_SAMPLE', 2))
+        with mock.patch.object(store, 'search', wraps=store.search) as search:
+            store.rank_sources(query_texts=['alpha', 'beta', 'gamma', 'alpha'],
+                               sources=[['a.txt'], ['b.txt'], ['c.txt'], ['a.txt']])
+        # One batched search, then one search per sampled query
+        self.assertEqual(search.call_count, 3)
+        self.assertEqual([len(call.kwargs['query_embeddings']) for call in search.call_args_list],
+                         [3, 1, 1])
+        summary = store.timer.summary()
+        self.assertEqual(summary['query']['items'], 4)
+        self.assertEqual(len(store.timer._latencies['query']), 2)
+        self.assertEqual(len(store.timer._latencies['query cost']), 4)
+        fields = store.timer.report_fields()
+        self.assertIn('Query p95 ms', fields)
+        self.assertIn('Query cost p95 ms', fields)
+        self.assertNotIn('Query cost s', fields)
+
+
+class TestRunMatrix(StoreTestCase):
+
+    def test_corpus_is_parsed_once_per_chunking_and_models_are_held(self):
+        data_directory = self.write_files({'a.txt': "alpha " * 20,
+                                           'b.txt': "beta " * 20})
+        loads = []
+        # The pool only fits one model at a time
+        pool = EmbeddingPool(max_bytes=1,
+                             loader=lambda name: loads.append(name) or NamedEmbedding(name))
+        data = {'selectedModel': ['m1', 'm2'],
+                'selectedStrategy': ['l2', 'ip'],
+                'selectedStore': 'Numpy',
+                'selectedPath': data_directory,
+                'chunkSize': [50, 80],
+                'chunkOverlap': 0,
+                'lines': [{'query': 'alpha', 'source': 'a.txt'}]}
+        with mock.patch.object(BaseVectorstore, 'process_files',
+                               wraps=BaseVectorstore.process_files) as process_files:
+            reports = Combination.run_matrix(data=data, pool=pool, max_workers=1)
+        self.assertEqual(process_files.call_count, 2)
+        self.assertEqual(loads, ['m1', 'm2', 'm1', 'm2'])
+        self.assertEqual(len(reports), 8)
+        for report in reports:
+            # The second strategy reuses the matrix stored by the first
+            if report['Strategy'] == 'l2':
+                self.assertIn('Build s', report)
+                self.assertNotIn('Reused index', report)
+            else:
+                self.assertTrue(report['Reused index'])
+                self.assertNotIn('Build s', report)
+            self.assertEqual(report['Average k'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
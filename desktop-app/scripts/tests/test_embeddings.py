@@ -0,0 +1,93 @@
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import sentence_transformers
+except ImportError:
+    # The model is replaced by FakeSentenceTransformer below, so the
+    # library only has to be importable
+    sentence_transformers = types.ModuleType('sentence_transformers')
+    sentence_transformers.SentenceTransformer = mock.MagicMock()
+    sys.modules['sentence_transformers'] = sentence_transformers
+
+from embeddings import HuggingFaceEmbedding as huggingface_module
+from embeddings.HuggingFaceEmbedding import HuggingFaceEmbedding
+from embeddings.base import BaseEmbedding
+
+
+class FakeTokenizer(object):
+    # One token per word, truncated to max_length
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts, truncation=False, max_length=None, return_length=False):
+        self.calls += 1
+        lengths = [min(len(text.split()), max_length) if truncation else len(text.split())
+                   for text in texts]
+        return {'length': lengths}
+
+
+class FakeSentenceTransformer(object):
+    """
+    A stand-in of a SentenceTransformer embedding a text as its number of
+    words in every dimension, recording the texts of every batch.
+    """
+
+    DIMENSION = 4
+
+    def __init__(self, model_name):
+        self.max_seq_length = 16
+        self.tokenizer = FakeTokenizer()
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False):
+        if isinstance(texts, str):
+            return np.full(FakeSentenceTransformer.DIMENSION, len(texts.split()), dtype=np.float32)
+        self.batches.append(list(texts))
+        return np.array([[len(text.split())] * FakeSentenceTransformer.DIMENSION for text in texts],
+                        dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return FakeSentenceTransformer.DIMENSION
+
+
+class HuggingFaceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(huggingface_module, 'SentenceTransformer', FakeSentenceTransformer)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.embedding = HuggingFaceEmbedding('fake-model', batch_size=4)
+        rng = np.random.default_rng(0)
+        self.texts = [' '.join(['word'] * int(length)) for length in rng.integers(1, 30, size=37)]
+
+
+class TestLengthBucketing(HuggingFaceTestCase):
+
+    def test_batches_group_similar_lengths(self):
+        embeddings = self.embedding.from_texts(self.texts)
+        # The rows follow the input order whatever the batches
+        self.assertEqual(embeddings[:, 0].tolist(), [len(text.split()) for text in self.texts])
+        batch_lengths = [[len(text) for text in batch]
+                         for batch in self.embedding.model.batches]
+        self.assertEqual([len(batch) for batch in batch_lengths], [4] * 9 + [1])
+        self.assertEqual(sum(batch_lengths, []),
+                         sorted((len(text) for text in self.texts), reverse=True))
+        # encode tokenizes every batch, so the texts are not tokenized before
+        self.assertEqual(self.embedding.model.tokenizer.calls, 0)
+
+    def test_no_token_padding_is_reported(self):
+        before = self.embedding.get_batch_stats()
+        self.embedding.from_texts(self.texts)
+        self.assertEqual(BaseEmbedding.batch_report(before, self.embedding.get_batch_stats()),
+                         dict())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstores import loaders
+from vectorstores.base import BaseVectorstore
+from vectorstores.Numpy import Numpy
+from fakes import FakeEmbedding, StoreTestCase
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        file_path = os.path.join(self.directory.name, name)
+        with open(file_path, 'wb') as fn:
+            fn.write(content)
+        return file_path
+
+    def detected(self, *encodings):
+        # Stands in for langchain's detection, which is only imported for
+        # files that are not UTF-8
+        helpers = types.ModuleType('langchain.document_loaders.helpers')
+        helpers.detect_file_encodings = lambda file_path: [types.SimpleNamespace(encoding=encoding)
+                                                           for encoding in encodings]
+        return mock.patch.dict(sys.modules, {'langchain.document_loaders.helpers': helpers})
+
+    def test_documents_are_yielded_as_the_file_is_read(self):
+        file_path = self.write('records.jsonl', b'{"text": "first"}\n{"text": "second"}\nnot json\n')
+        documents = loaders.load(file_path)
+        # The file decodes, so its records stream until the invalid line
+        self.assertEqual(next(documents).page_content, 'first')
+        self.assertEqual(next(documents).page_content, 'second')
+        with self.assertRaises(ValueError):
+            next(documents)
+
+    def test_non_utf8_file_is_read_again_with_the_detected_encoding(self):
+        file_path = self.write('latin.txt', 'café crème\r\n'.encode('latin-1'))
+        with self.detected('ascii', 'latin-1'):
+            documents = list(loaders.load(file_path))
+        self.assertEqual([document.page_content for document in documents], ['café crème\n'])
+        self.assertEqual(documents[0].metadata, {'source': file_path})
+
+    def test_undecodable_file_is_rejected(self):
+        file_path = self.write('latin.txt', 'café'.encode('latin-1'))
+        with self.detected('ascii'):
+            with self.assertRaises(ValueError):
+                list(loaders.load(file_path))
+
+    def test_decoding_error_after_the_first_document_falls_back_to_detection(self):
+        # The invalid byte is past the first read buffer of the file
+        rows = ''.join(f'row {idx},value\n' for idx in range(2000)) + 'café,crème\n'
+        file_path = self.write('rows.csv', ('name,value\n' + rows).encode('latin-1'))
+        with self.detected('latin-1'):
+            documents = list(loaders.load(file_path))
+        # Every row is read once, from the detected encoding only
+        self.assertEqual([document.metadata['row'] for document in documents], list(range(2001)))
+        self.assertEqual(documents[0].page_content, 'name: row 0\nvalue: value')
+        self.assertEqual(documents[-1].page_content, 'name: café\nvalue: crème')
+
+    def test_documents_split_differently_by_the_detected_encoding_are_not_duplicated(self):
+        encodings = []
+
+        def load_rows(file_path, encoding=loaders.ENCODING):
+            encodings.append(encoding)
+            if encoding == loaders.ENCODING:
+                yield loaders.Document(page_content='a')
+                yield loaders.Document(page_content='b')
+            yield loaders.Document(page_content='ab')
+            yield loaders.Document(page_content='c')
+
+        file_path = self.write('rows.dat', b'a\xffb')
+        with self.detected('ascii', 'latin-1'):
+            documents = list(loaders.load(file_path, loaders={'.dat': load_rows}))
+        # The file is checked to decode before the loader reads it
+        self.assertEqual(encodings, ['latin-1'])
+        self.assertEqual([document.page_content for document in documents], ['ab', 'c'])
+
+    def test_undecodable_file_is_skipped_and_counted(self):
+        good = self.write('good.txt', b'plain text')
+        bad = self.write('bad.jsonl', b'{"text": "first"}\n' + b'{"text": "\xff"}\n' * 3000)
+        skipped = {'.pdf': 1}
+        with self.detected('ascii'):
+            results = dict(BaseVectorstore.process_files(file_paths=[good, bad], num_workers=1,
+                                                         skipped=skipped))
+        self.assertEqual([chunk.page_content for chunk in results[good]], ['plain text'])
+        self.assertEqual(results[bad], [])
+        self.assertEqual(skipped, {'.pdf': 1, '.jsonl': 1})
+
+    def test_empty_file_has_no_documents(self):
+        self.assertEqual(list(loaders.load(self.write('empty.csv', b''))), [])
+
+    def test_unsupported_extension_is_rejected(self):
+        with self.assertRaises(ValueError):
+            list(loaders.load(self.write('image.png', b'\x89PNG')))
+
+    def test_file_is_split_while_it_is_loaded(self):
+        lines = b''.join(b'{"text": "%d %s"}\n' % (idx, b'word ' * 50) for idx in range(20))
+        file_path = self.write('records.jsonl', lines)
+        chunks, load_seconds, split_seconds = BaseVectorstore._timed_process_file(
+            file_path=file_path, chunk_size=100, chunk_overlap=0)
+        self.assertEqual(len(chunks), 60)
+        self.assertEqual({chunk.metadata['line'] for chunk in chunks}, set(range(20)))
+        self.assertGreaterEqual(load_seconds, 0)
+        self.assertGreaterEqual(split_seconds, 0)
+
+
+class TestIngestSkippedFiles(StoreTestCase):
+
+    def test_undecodable_files_count_as_skipped(self):
+        data_directory = self.write_files({'good.txt': 'plain text', 'image.png': 'not an image'})
+        with open(os.path.join(data_directory, 'bad.txt'), 'wb') as fn:
+            fn.write(b'\xff\xfe\xfa')
+        store = Numpy(embedding=FakeEmbedding(), strategy='l2', num_workers=1)
+        helpers = types.ModuleType('langchain.document_loaders.helpers')
+        helpers.detect_file_encodings = lambda file_path: []
+        with mock.patch.dict(sys.modules, {'langchain.document_loaders.helpers': helpers}):
+            store.add_data(data_directory=data_directory)
+        self.assertEqual(store.ingest_stats['skipped_files'], 2)
+        self.assertEqual(store.ingest_stats['chunks'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,322 @@
+import json
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import pymilvus
+except ImportError:
+    # The store runs against FakeCollection below, so the client library
+    # only has to be importable
+    pymilvus = types.ModuleType('pymilvus')
+    for name in ['connections', 'utility', 'FieldSchema',
+                 'CollectionSchema', 'DataType', 'Collection']:
+        setattr(pymilvus, name, mock.MagicMock())
+    sys.modules['pymilvus'] = pymilvus
+
+from vectorstores import Milvus as milvus_module
+from vectorstores.Milvus import Milvus
+from vectorstores.Numpy import Numpy
+from fakes import FakeEmbedding, StoreTestCase
+
+
+class FakeHit(object):
+
+    def __init__(self, row):
+        self.id = row[0]
+        self.entity = {'source': row[1], 'documents': row[3]}
+
+
+class FakeHits(object):
+
+    def __init__(self, rows, distances):
+        self.ids = [row[0] for row in rows]
+        self.distances = list(distances)
+        self._hits = [FakeHit(row) for row in rows]
+
+    def __iter__(self):
+        return iter(self._hits)
+
+
+class FakeCollection(object):
+    """
+    An in-memory stand-in of a pymilvus Collection, searching exactly with
+    the metric of the request and recording every insert and search.
+    """
+
+    def __init__(self, name, schema=None, **kwargs):
+        self.name = name
+        self.description = 'fake collection'
+        self.rows = []
+        self.inserts = []
+        self.searches = []
+        self.queries = []
+        self.index_config = None
+
+    @property
+    def num_entities(self):
+        return len(self.rows)
+
+    def insert(self, data):
+        self.inserts.append(data)
+        self.rows.extend(zip(*data))
+
+    def delete(self, expr):
+        pass
+
+    def query(self, expr, output_fields):
+        self.queries.append(expr)
+        wanted = set(json.loads(expr[len('ids in '):]))
+        return [{'ids': row[0], 'source': row[1]} for row in self.rows if row[0] in wanted]
+
+    def flush(self):
+        pass
+
+    def has_index(self):
+        return self.index_config is not None
+
+    def index(self):
+        return types.SimpleNamespace(params=dict(self.index_config))
+
+    def create_index(self, field_name, index_params):
+        self.index_config = index_params
+
+    def drop_index(self):
+        self.index_config = None
+
+    def release(self):
+        pass
+
+    def load(self):
+        pass
+
+    def search(self, data, anns_field, param, output_fields, limit):
+        self.searches.append({'param': param, 'output_fields': output_fields, 'limit': limit})
+        embeddings = np.array([row[2] for row in self.rows], dtype=np.float32)
+        results = []
+        for query in data:
+            if param['metric_type'] == 'IP':
+                distances = embeddings @ query
+                order = np.argsort(-distances, kind='stable')
+            else:
+                distances = ((embeddings - query) ** 2).sum(axis=1)
+                order = np.argsort(distances, kind='stable')
+            order = order[:limit]
+            results.append(FakeHits([self.rows[idx] for idx in order], distances[order]))
+        return results
+
+
+class MilvusTestCase(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.patch(mock.patch.object(milvus_module, 'connections', mock.MagicMock()))
+        self.patch(mock.patch.object(milvus_module, 'utility', mock.MagicMock(**{'has_collection.return_value': False})))
+        self.patch(mock.patch.object(milvus_module, 'FieldSchema', mock.MagicMock()))
+        self.patch(mock.patch.object(milvus_module, 'CollectionSchema', mock.MagicMock()))
+        self.patch(mock.patch.object(milvus_module, 'Collection', FakeCollection))
+
+    def create_store(self, **kwargs):
+        return Milvus(embedding=FakeEmbedding(), **kwargs)
+
+
+class TestMilvusInsert(MilvusTestCase):
+
+    def test_inserts_stay_under_max_insert_bytes(self):
+        max_insert_bytes = 4096
+        store = self.create_store(strategy='l2', max_insert_bytes=max_insert_bytes)
+        rng = np.random.default_rng(0)
+        n = 200
+        ids = [f'id-{idx}' for idx in range(n)]
+        documents = ['é' * int(length) for length in rng.integers(1, 600, size=n)]
+        metadatas = [{'source': f'/data/file-{idx % 7}.txt'} for idx in range(n)]
+        embeddings = store.embedding.from_texts(documents)
+
+        store._insert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+        inserts = store._collection.inserts
+        self.assertGreater(len(inserts), 1)
+        for batch_ids, batch_sources, batch_embeddings, batch_documents in inserts:
+            size = sum(FakeEmbedding.DIMENSION * 4 + len(chunk_id) + len(source.encode('utf-8'))
+                       + len(document.encode('utf-8'))
+                       for chunk_id, source, document in zip(batch_ids, batch_sources, batch_documents))
+            self.assertLessEqual(size, max_insert_bytes)
+        self.assertEqual([row[0] for row in store._collection.rows], ids)
+        self.assertEqual([row[3] for row in store._collection.rows], documents)
+
+    def test_oversized_row_is_sent_alone(self):
+        store = self.create_store(strategy='l2', max_insert_bytes=256)
+        documents = ['small', 'x' * 1000, 'small too']
+        store._insert(ids=['a', 'b', 'c'],
+                      embeddings=store.embedding.from_texts(documents),
+                      metadatas=[{'source': 'f.txt'}] * 3,
+                      documents=documents)
+        self.assertEqual([batch[0] for batch in store._collection.inserts],
+                         [['a'], ['b'], ['c']])
+
+
+class TestMilvusIndex(MilvusTestCase):
+
+    def test_metric_type_follows_strategy(self):
+        for strategy, metric_type in Milvus.METRIC_TYPES.items():
+            with self.subTest(strategy=strategy):
+                store = self.create_store(strategy=strategy, index_type='HNSW')
+                documents = ['alpha', 'beta', 'gamma']
+                store._insert(ids=['a', 'b', 'c'],
+                              embeddings=store.embedding.from_texts(documents),
+                              metadatas=[{'source': 'f.txt'}] * 3,
+                              documents=documents)
+                store._persist()
+                self.assertEqual(store._collection.index_config,
+                                 {'index_type': 'HNSW',
+                                  'metric_type': metric_type,
+                                  'params': Milvus.INDEX_PARAMS['HNSW']})
+                store.search(query_embeddings=store.embedding.from_texts(['alpha']),
+                             n_results=2,
+                             include=['distances'])
+                self.assertEqual(store._collection.searches[-1]['param']['metric_type'], metric_type)
+
+    def test_index_is_rebuilt_when_strategy_changes(self):
+        store = self.create_store(strategy='l2')
+        store._persist()
+        self.assertEqual(store._collection.index_config['metric_type'], 'L2')
+        store.strategy = 'ip'
+        store._persist()
+        self.assertEqual(store._collection.index_config['metric_type'], 'IP')
+
+    def test_hnsw_search_breadth_covers_the_limit(self):
+        store = self.create_store(strategy='ip', index_type='HNSW', search_params={'ef': 8})
+        documents = [f'document {idx}' for idx in range(40)]
+        store._insert(ids=[str(idx) for idx in range(40)],
+                      embeddings=store.embedding.from_texts(documents),
+                      metadatas=[{'source': 'f.txt'}] * 40,
+                      documents=documents)
+        store.search(query_embeddings=store.embedding.from_texts(['query']),
+                     n_results=32,
+                     include=['distances'])
+        self.assertEqual(store._collection.searches[-1]['param']['params'], {'ef': 32})
+
+    def test_limit_is_capped_at_max_topk(self):
+        self.patch(mock.patch.object(Milvus, 'MAX_TOPK', 16))
+        store = self.create_store(strategy='ip', index_type='HNSW', search_params={'ef': 8})
+        documents = [f'document {idx}' for idx in range(40)]
+        store._insert(ids=[str(idx) for idx in range(40)],
+                      embeddings=store.embedding.from_texts(documents),
+                      metadatas=[{'source': 'f.txt'}] * 40,
+                      documents=documents)
+        self.assertEqual(store.get_max_n(), 16)
+        for n_results in [-1, 32]:
+            with self.subTest(n_results=n_results):
+                output = store.search(query_embeddings=store.embedding.from_texts(['query']),
+                                      n_results=n_results,
+                                      include=['distances'])
+                self.assertEqual(store._collection.searches[-1]['limit'], 16)
+                self.assertEqual(store._collection.searches[-1]['param']['params'], {'ef': 16})
+                self.assertEqual(len(output['ids'][0]), 16)
+
+    def test_sources_past_max_topk_get_a_censored_rank(self):
+        self.patch(mock.patch.object(Milvus, 'MAX_TOPK', 4))
+        store = self.create_store(strategy='l2')
+        documents = [f'document {idx}' for idx in range(10)]
+        store._insert(ids=[str(idx) for idx in range(10)],
+                      embeddings=store.embedding.from_texts(documents),
+                      metadatas=[{'source': f'{idx}.txt'} for idx in range(10)],
+                      documents=documents)
+        ranks = store.rank_sources(query_texts=['document 3', 'document 3'],
+                                   sources=[['3.txt'], ['missing.txt']])
+        self.assertEqual(ranks.tolist(), [1, 5])
+        self.assertEqual(store.truncated, 1)
+
+    def test_unknown_index_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.create_store(strategy='l2', index_type='DISKANN')
+
+
+class TestMilvusSearch(MilvusTestCase):
+
+    def add(self, store, ids, sources, in_manifest):
+        documents = [f'document {chunk_id}' for chunk_id in ids]
+        store._insert(ids=ids,
+                      embeddings=store.embedding.from_texts(documents),
+                      metadatas=[{'source': source} for source in sources],
+                      documents=documents)
+        for chunk_id, source in zip(ids, sources):
+            if in_manifest:
+                entry = store.manifest.entries.setdefault(source, {'ids': []})
+                entry['ids'].append(chunk_id)
+
+    def test_results_are_columnar(self):
+        store = self.create_store(strategy='ip')
+        self.add(store, ['a', 'b', 'c'], ['x.txt', 'y.txt', 'x.txt'], in_manifest=True)
+        output = store.search(query_embeddings=store.embedding.from_texts(['q1', 'q2']),
+                              n_results=3,
+                              include=['metadatas', 'distances'])
+        self.assertEqual(len(output['ids']), 2)
+        for ids, distances, metadatas in zip(output['ids'], output['distances'], output['metadatas']):
+            self.assertIsInstance(ids, list)
+            self.assertIsInstance(distances, list)
+            self.assertEqual(sorted(ids), ['a', 'b', 'c'])
+            self.assertEqual([metadata['source'] for metadata in metadatas],
+                             ['y.txt' if chunk_id == 'b' else 'x.txt' for chunk_id in ids])
+        # Every source came from the manifest
+        self.assertEqual(store._collection.queries, [])
+        self.assertEqual(store._collection.searches[-1]['output_fields'], [])
+
+    def test_sources_missing_from_manifest_are_fetched_per_hit(self):
+        store = self.create_store(strategy='l2')
+        self.add(store, ['a', 'b'], ['x.txt', 'y.txt'], in_manifest=True)
+        self.add(store, ['c', 'd'], ['z.txt', 'x.txt'], in_manifest=False)
+        query_embeddings = store.embedding.from_texts(['q'])
+        output = store.search(query_embeddings=query_embeddings, n_results=4, include=['metadatas'])
+        sources = dict(zip(output['ids'][0],
+                           (metadata['source'] for metadata in output['metadatas'][0])))
+        self.assertEqual(sources, {'a': 'x.txt', 'b': 'y.txt', 'c': 'z.txt', 'd': 'x.txt'})
+        self.assertEqual(len(store._collection.queries), 1)
+        self.assertEqual(set(json.loads(store._collection.queries[0][len('ids in '):])), {'c', 'd'})
+        # The fetched sources are kept until the collection changes
+        store.search(query_embeddings=query_embeddings, n_results=4, include=['metadatas'])
+        self.assertEqual(len(store._collection.queries), 1)
+
+
+
+class TestMilvusFromMatrix(MilvusTestCase):
+
+    def test_new_store_is_filled_from_the_numpy_matrix(self):
+        data_directory = self.write_files({'a.txt': 'alpha ' * 20,
+                                           'b.txt': 'beta ' * 20,
+                                           'c.txt': 'gamma ' * 20})
+        matrix_store = Numpy(embedding=FakeEmbedding(), strategy='l2', num_workers=1)
+        matrix_store.add_data(data_directory=data_directory)
+        with open(os.path.join(data_directory, 'c.txt'), 'w') as fn:
+            fn.write('delta ' * 20)
+
+        store = self.create_store(strategy='l2', num_workers=1)
+        with mock.patch.object(store, 'embed_texts', wraps=store.embed_texts) as embed_texts:
+            store.add_data(data_directory=data_directory)
+        # Only the file changed since the matrix was written is embedded
+        embed_texts.assert_called_once_with(['delta ' * 19 + 'delta'])
+        self.assertEqual(store.ingest_stats['chunks'], 4)
+        self.assertFalse(store.ingest_stats['reused'])
+        self.assertEqual(set(store.manifest.entries),
+                         {os.path.join(data_directory, name) for name in ['a.txt', 'b.txt', 'c.txt']})
+        query = store.embedding.from_texts(['alpha ' * 19 + 'alpha'])
+        output = store.search(query_embeddings=query, n_results=1, include=['metadatas'])
+        self.assertEqual(output['metadatas'][0][0]['source'], os.path.join(data_directory, 'a.txt'))
+
+    def test_matrix_of_other_files_is_not_used(self):
+        matrix_store = Numpy(embedding=FakeEmbedding(), strategy='l2', num_workers=1)
+        matrix_store.add_data(data_directory=self.write_files({'a.txt': 'alpha'}, name='other'))
+        store = self.create_store(strategy='l2', num_workers=1)
+        store.add_data(data_directory=self.write_files({'b.txt': 'beta'}))
+        self.assertEqual(store.ingest_stats['chunks'], 1)
+        self.assertEqual([row[0] for row in store._collection.rows],
+                         store.manifest.entries[os.path.join(self.directory.name, 'data', 'b.txt')]['ids'])
+
+
+if __name__ == '__main__':
+    unittest.main()
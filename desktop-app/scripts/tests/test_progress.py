@@ -0,0 +1,75 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstores.Numpy import Numpy
+from vectorstores.progress import Progress, set_sink
+from fakes import FakeEmbedding, StoreTestCase
+
+
+class TestIngestProgress(StoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.data_directory = self.write_files(
+            {f'file-{idx}.txt': ' '.join(f'word{idx}-{position}' for position in range(200 * (idx + 1)))
+             for idx in range(8)})
+        self.events = []
+        set_sink(self.events.append)
+
+    def tearDown(self):
+        set_sink(None)
+        super().tearDown()
+
+    def create_store(self):
+        return Numpy(embedding=FakeEmbedding(), strategy='l2', num_workers=1,
+                     insert_batch_size=16, chunk_size=200, chunk_overlap=20)
+
+    def add_data(self, store, **kwargs):
+        # Events are throttled, so the totals are checked where they are set
+        totals = []
+        set_total = Progress.set_total
+
+        def record(progress, total):
+            totals.append((progress.stage, total))
+            set_total(progress, total)
+
+        with mock.patch.object(Progress, 'set_total', record):
+            store.add_data(data_directory=self.data_directory, **kwargs)
+        return totals
+
+    def assert_totals(self, totals, stage, chunks):
+        stage_totals = [total for name, total in totals if name == stage]
+        self.assertGreater(len(stage_totals), 1)
+        self.assertEqual(stage_totals[-1], chunks)
+        last = [event for event in self.events if event['stage'] == stage][-1]
+        self.assertEqual((last['done'], last['total']), (chunks, chunks))
+
+    def test_chunk_stages_report_a_total(self):
+        store = self.create_store()
+        totals = self.add_data(store)
+        chunks = store.ingest_stats['chunks']
+        self.assertGreater(chunks, 16)
+        # The first estimate extrapolates the first batch to every file
+        self.assertGreater(totals[0][1], 16)
+        self.assert_totals(totals, 'embed', chunks)
+        self.assert_totals(totals, 'insert', chunks)
+
+    def test_given_chunks_set_the_total_from_the_start(self):
+        store = self.create_store()
+        file_paths = store.retrieve_file_paths(data_directory=self.data_directory)
+        chunks = dict(store.process_files(file_paths=file_paths, num_workers=1,
+                                          chunk_size=store.chunk_size,
+                                          chunk_overlap=store.chunk_overlap))
+        self.events.clear()
+        totals = self.add_data(store, chunks=chunks)
+        first = next(event for event in self.events if event['stage'] == 'embed')
+        self.assertEqual(first['total'], sum(len(file_chunks) for file_chunks in chunks.values()))
+        self.assert_totals(totals, 'embed', store.ingest_stats['chunks'])
+
+
+if __name__ == '__main__':
+    unittest.main()
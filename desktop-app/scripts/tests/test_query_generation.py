@@ -0,0 +1,154 @@
+import os
+import re
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import QueryGeneration
+from fakes import serve_stand_in
+
+
+class QueryGenerationTestCase(unittest.TestCase):
+
+    DELAY = 0.2
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.patches = [mock.patch.object(QueryGeneration, 'CACHE_PATH',
+                                          os.path.join(self.directory.name, 'query_cache.sqlite')),
+                        mock.patch.object(QueryGeneration, '_cache', None)]
+        for patch in self.patches:
+            patch.start()
+        self.path = os.path.join(self.directory.name, 'data')
+        os.makedirs(self.path)
+        self.sources = []
+        for idx in range(8):
+            source = f'file-{idx}.txt'
+            with open(os.path.join(self.path, source), 'w') as fn:
+                fn.write(' '.join(f'word{idx}x{position}' for position in range(1000)))
+            self.sources.append(source)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        if QueryGeneration._cache is not None:
+            QueryGeneration._cache.close()
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.directory.cleanup()
+
+    def stand_in(self, delay=DELAY):
+        server = serve_stand_in(delay=delay)
+        self.servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    def generate(self, **data):
+        start = time.perf_counter()
+        results = QueryGeneration.generate_queries({'path': self.path,
+                                                    'sources': self.sources,
+                                                    'model': 'stand-in',
+                                                    **data})
+        return results, time.perf_counter() - start
+
+
+class TestGenerateQueries(QueryGenerationTestCase):
+
+    def test_requests_run_concurrently(self):
+        emitted = []
+        start = time.perf_counter()
+        results = QueryGeneration.generate_queries({'path': self.path,
+                                                    'sources': self.sources,
+                                                    'model': 'stand-in',
+                                                    'endpoint': self.stand_in(),
+                                                    'maxWorkers': 4,
+                                                    'cache': False},
+                                                   emit=lambda position, result: emitted.append(position))
+        seconds = time.perf_counter() - start
+        # Four workers take about two delays for eight files, one at a time eight
+        self.assertLess(seconds, len(self.sources) * self.DELAY / 2)
+        self.assertEqual([result['source'] for result in results], self.sources)
+        for idx, result in enumerate(results):
+            self.assertNotIn('error', result)
+            self.assertTrue(result['query'].startswith(f'What is word{idx}x0 '))
+        self.assertEqual(sorted(emitted), list(range(len(self.sources))))
+
+    def test_context_is_cut_to_the_token_budget(self):
+        max_tokens = 13
+        with mock.patch.object(QueryGeneration, 'call_llm',
+                               wraps=QueryGeneration.call_llm) as call_llm:
+            results, _ = self.generate(endpoint=self.stand_in(delay=0),
+                                       maxContextTokens=max_tokens,
+                                       cache=False)
+        self.assertTrue(all('error' not in result for result in results))
+        self.assertEqual(call_llm.call_count, len(self.sources))
+        for call in call_llm.call_args_list:
+            context = call.kwargs['prompt'].rsplit('question mark:', 1)[-1]
+            words = re.findall(r'\S+', context)
+            self.assertEqual(len(words), int(max_tokens / QueryGeneration.TOKENS_PER_WORD))
+            self.assertTrue(words[0].endswith('x0'))
+
+    def test_second_run_is_answered_from_the_cache(self):
+        endpoint = self.stand_in()
+        first, _ = self.generate(endpoint=endpoint)
+        second, seconds = self.generate(endpoint=endpoint)
+        self.assertTrue(all(not result['cached'] for result in first))
+        self.assertTrue(all(result['cached'] for result in second))
+        self.assertEqual([result['query'] for result in first],
+                         [result['query'] for result in second])
+        self.assertLess(seconds, self.DELAY)
+
+    def test_refresh_asks_a_random_model_past_the_endpoint_cache(self):
+        endpoint = self.stand_in(delay=0)
+        self.generate(endpoint=endpoint)
+        with mock.patch.object(QueryGeneration.random, 'choice', return_value='other-model') as choice, \
+             mock.patch.object(QueryGeneration, 'call_llm',
+                               wraps=QueryGeneration.call_llm) as call_llm:
+            results, _ = self.generate(endpoint=endpoint, model=None, refresh=True)
+        self.assertEqual(choice.call_count, len(self.sources))
+        self.assertTrue(all(result['model'] == 'other-model' and not result['cached']
+                            for result in results))
+        self.assertTrue(all(call.kwargs['use_cache'] is False for call in call_llm.call_args_list))
+
+    def test_cache_is_kept_per_endpoint(self):
+        self.generate(endpoint=self.stand_in(delay=0))
+        results, _ = self.generate(endpoint=self.stand_in(delay=0))
+        self.assertTrue(all(not result['cached'] for result in results))
+
+    def test_unreachable_endpoint_fails_every_file(self):
+        endpoint = self.stand_in(delay=0)
+        server = self.servers.pop()
+        server.shutdown()
+        server.server_close()
+        results, _ = self.generate(endpoint=endpoint, cache=False)
+        for result in results:
+            self.assertEqual(result['query'], QueryGeneration.ERROR_QUERY)
+            self.assertIn('error', result)
+
+
+class TestGenerateQuery(QueryGenerationTestCase):
+
+    def test_single_line_is_not_cached(self):
+        data = {'path': self.path,
+                'source': self.sources[0],
+                'index': 3,
+                'model': 'stand-in',
+                'endpoint': self.stand_in(delay=0)}
+        with mock.patch.object(QueryGeneration, 'call_llm',
+                               wraps=QueryGeneration.call_llm) as call_llm:
+            first = QueryGeneration.generate_query(data)
+            second = QueryGeneration.generate_query(data)
+        self.assertEqual(call_llm.call_count, 2)
+        self.assertEqual(first, second)
+        self.assertEqual(first[1], 3)
+        self.assertTrue(first[0].startswith('What is word0x0 '))
+        self.assertIsNone(QueryGeneration._cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
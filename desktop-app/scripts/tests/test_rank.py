@@ -0,0 +1,51 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstores.base import BaseVectorstore
+
+
+def first_rank(ranked, given, matches):
+    found = 0
+    for position, name in enumerate(ranked, start=1):
+        found += name in given
+        if found >= matches:
+            return position
+    return -1
+
+
+class TestMatchRanks(unittest.TestCase):
+
+    def test_ranks_match_a_linear_scan(self):
+        rng = random.Random(0)
+        names = [f'file-{idx}.txt' for idx in range(12)]
+        for _ in range(200):
+            n_queries = rng.randint(1, 20)
+            ranked_sources = [[rng.choice(names) for _ in range(rng.randint(0, 30))]
+                              for _ in range(n_queries)]
+            sources = [rng.sample(names, rng.randint(0, 3)) for _ in range(n_queries)]
+            matches = rng.randint(1, 3)
+            self.assertEqual(BaseVectorstore.match_ranks(ranked_sources=ranked_sources,
+                                                         sources=sources,
+                                                         matches=matches).tolist(),
+                             [first_rank(ranked, set(given), matches)
+                              for ranked, given in zip(ranked_sources, sources)])
+
+    def test_sources_of_other_queries_do_not_match(self):
+        ranks = BaseVectorstore.match_ranks(ranked_sources=[['b.txt', 'a.txt'], ['a.txt', 'b.txt']],
+                                            sources=[['a.txt'], ['b.txt']],
+                                            matches=1)
+        self.assertEqual(ranks.tolist(), [2, 2])
+
+    def test_missing_source_is_never_reached(self):
+        ranks = BaseVectorstore.match_ranks(ranked_sources=[['a.txt'] * 50000, []],
+                                            sources=[['mistyped.txt'], ['a.txt']],
+                                            matches=1)
+        self.assertEqual(ranks.tolist(), [-1, -1])
+
+
+if __name__ == '__main__':
+    unittest.main()
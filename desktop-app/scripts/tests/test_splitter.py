@@ -0,0 +1,105 @@
+import os
+import json
+import random
+import hashlib
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vectorstores.loaders import Document
+from vectorstores.splitter import TextSplitter
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        RecursiveCharacterTextSplitter = None
+
+# The chunks of langchain's RecursiveCharacterTextSplitter for the cases
+# below, checked in so the splitter is compared to it without langchain.
+# Written again by `python tests/test_splitter.py --golden` with langchain
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'splitter_golden.json')
+
+ALPHABET = ["a", "b", " ", "\n", "\n\n", "xyz", "  ", "\n \n", "é"]
+
+
+def random_cases():
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(ALPHABET)
+                       if rng.random() < 0.5 else "w" * rng.randint(1, 30)
+                       for _ in range(rng.randint(0, 200)))
+        chunk_size = rng.randint(1, 80)
+        yield text, chunk_size, rng.randint(0, chunk_size)
+
+
+def long_cases():
+    # Long texts take the vectorized scan of the separators
+    words = " ".join(f"word{idx % 97}" + ("\n" if idx % 13 == 0 else "")
+                     + ("\n\n" if idx % 101 == 0 else "")
+                     for idx in range(20000))
+    return [(words, 750, 100), ("a " * 20000, 750, 100), ("x" * 10000, 750, 100)]
+
+
+def digest(chunks):
+    # The golden file holds digests, the chunks of every case would weigh
+    # megabytes
+    return hashlib.sha256(json.dumps(chunks).encode('utf-8')).hexdigest()[:16]
+
+
+def write_golden():
+    golden = {name: [digest(RecursiveCharacterTextSplitter(chunk_size=chunk_size,
+                                                           chunk_overlap=chunk_overlap).split_text(text))
+                     for text, chunk_size, chunk_overlap in cases()]
+              for name, cases in [('random', random_cases), ('long', long_cases)]}
+    with open(GOLDEN_PATH, 'w') as fn:
+        json.dump(golden, fn, indent=0)
+
+
+class TestTextSplitter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(GOLDEN_PATH) as fn:
+            cls.golden = json.load(fn)
+
+    def assert_same_chunks(self, cases, name):
+        cases = list(cases)
+        self.assertEqual(len(cases), len(self.golden[name]))
+        for (text, chunk_size, chunk_overlap), expected in zip(cases, self.golden[name]):
+            chunks = TextSplitter(chunk_size, chunk_overlap).split_text(text)
+            msg = f"text={text[:200]!r} chunk_size={chunk_size} chunk_overlap={chunk_overlap}"
+            if RecursiveCharacterTextSplitter is not None:
+                self.assertEqual(chunks,
+                                 RecursiveCharacterTextSplitter(chunk_size=chunk_size,
+                                                                chunk_overlap=chunk_overlap).split_text(text),
+                                 msg=msg)
+            self.assertEqual(digest(chunks), expected, msg=msg)
+
+    def test_random_texts_split_as_langchain(self):
+        self.assert_same_chunks(random_cases(), 'random')
+
+    def test_long_texts_split_as_langchain(self):
+        self.assert_same_chunks(long_cases(), 'long')
+
+    def test_documents_keep_their_metadata(self):
+        docs = [Document(page_content="alpha beta gamma delta", metadata={'source': 'a.txt'}),
+                Document(page_content="", metadata={'source': 'b.txt'})]
+        chunks = TextSplitter(chunk_size=12, chunk_overlap=0).split_documents(iter(docs))
+        self.assertEqual([chunk.page_content for chunk in chunks], ["alpha beta", "gamma delta"])
+        self.assertEqual([chunk.metadata for chunk in chunks], [{'source': 'a.txt'}] * 2)
+        self.assertIsNot(chunks[0].metadata, docs[0].metadata)
+
+    def test_overlap_larger_than_chunk_is_rejected(self):
+        with self.assertRaises(ValueError):
+            TextSplitter(chunk_size=10, chunk_overlap=11)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--golden']:
+        write_golden()
+    else:
+        unittest.main()
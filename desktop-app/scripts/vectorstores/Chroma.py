@@ -2,14 +2,13 @@
 import sys, os
 from typing import Any
 from .base import BaseVectorstore
+from .manifest import IndexManifest
 from tqdm import tqdm
-from uuid import uuid1
 from chromadb import Client
 from chromadb.config import Settings
 from chromadb.api.types import QueryResult 
 sys.path.append('..')
 from embeddings.base import BaseEmbedding
-from embeddings.HuggingFaceEmbedding import HuggingFaceEmbedding
 
 
 class Chroma(BaseVectorstore):
@@ -18,19 +17,31 @@ class Chroma(BaseVectorstore):
 
     Attributes:
         SEARCH_STRATEGIES (set): Supported search strategies for Chroma.
+        HNSW_M (int): Default number of neighbours of each HNSW node.
+        HNSW_CONSTRUCTION_EF (int): Default candidate list size while building.
+        HNSW_SEARCH_EF (int): Default candidate list size while searching.
         name (str): Name of the vector store (Chroma).
         emb_model_name (str): Name of the embedding model.
         persist_directory (str): Directory for persisting the Chroma database.
         _client (Client): Chroma client instance.
         _collection (Collection): Chroma collection instance.
+        manifest (IndexManifest): Manifest of the indexed files.
+        bulk_ingest (bool): Whether batches are added with a single call.
+        hnsw_m (int): Number of neighbours of each HNSW node.
+        hnsw_construction_ef (int): Candidate list size while building the index.
+        hnsw_search_ef (int): Candidate list size while searching the index.
 
     Methods:
         __init__: Initialize the Chroma vector store.
         _collection_exist: Check if a collection exists in the Chroma database.
         __setattr__: Set attribute value with additional validation.
         _add_collection: Add a new collection to the Chroma database.
-        add_data: Add data to the Chroma collection.
+        _insert: Insert chunks with precomputed embeddings into the collection.
+        _delete: Delete chunks from the collection.
+        _persist: Persist the Chroma database to disk.
+        get_index_size: Get the size of the persisted database.
         query: Execute a query on the Chroma collection.
+        search: Search the Chroma collection with several query embeddings at once.
         get_available_strategies: Get the available search strategies for Chroma.
         get_max_n: Get the maximum number of results in the Chroma collection.
         __call__: Not implemented.
@@ -40,9 +51,22 @@ class Chroma(BaseVectorstore):
                          'cosine', 
                          'l2'}
 
+    HNSW_M = 100
+    HNSW_CONSTRUCTION_EF = 4096
+    HNSW_SEARCH_EF = 4096
+
     def __init__(self, 
                  embedding: BaseEmbedding, 
-                 strategy: str
+                 strategy: str,
+                 bulk_ingest: bool = True,
+                 insert_batch_size: int = BaseVectorstore.INSERT_BATCH_SIZE,
+                 checkpoint_every: int = BaseVectorstore.CHECKPOINT_EVERY,
+                 num_workers: int | None = None,
+                 hnsw_m: int = HNSW_M,
+                 hnsw_construction_ef: int = HNSW_CONSTRUCTION_EF,
+                 hnsw_search_ef: int = HNSW_SEARCH_EF,
+                 chunk_size: int = BaseVectorstore.CHUNK_SIZE,
+                 chunk_overlap: int = BaseVectorstore.CHUNK_OVERLAP
                  ) -> None:
         """
         Initialize the Chroma vector store.
@@ -50,13 +74,31 @@ class Chroma(BaseVectorstore):
         Args:
             embedding (BaseEmbedding): The embedding model to use.
             strategy (str): The search strategy to use.
+            bulk_ingest (bool): Add each batch of chunks with a single call
+                                instead of one call per chunk.
+            insert_batch_size (int): The number of chunks embedded and added per batch.
+            checkpoint_every (int): The number of chunks added between two persists.
+            num_workers (int): The number of processes loading and splitting files.
+            hnsw_m (int): Number of neighbours of each HNSW node.
+            hnsw_construction_ef (int): Candidate list size while building the index.
+            hnsw_search_ef (int): Candidate list size while searching the index.
+            chunk_size (int): The maximum number of characters of a chunk.
+            chunk_overlap (int): The maximum overlap of consecutive chunks.
         """
-        _DATABASE_DIRECTORY = os.path.join(os.path.abspath(os.pardir), "database")
-        super().__init__(embedding=embedding, strategy=strategy)
+        super().__init__(embedding=embedding, strategy=strategy,
+                         insert_batch_size=insert_batch_size,
+                         checkpoint_every=checkpoint_every,
+                         num_workers=num_workers,
+                         chunk_size=chunk_size,
+                         chunk_overlap=chunk_overlap)
+        self.bulk_ingest = bulk_ingest
+        self.hnsw_m = hnsw_m
+        self.hnsw_construction_ef = hnsw_construction_ef
+        self.hnsw_search_ef = hnsw_search_ef
         self.name = 'Chroma'
         emb_model_name = embedding.get_name()
         self.emb_model_name = emb_model_name
-        self.persist_directory = os.path.join(_DATABASE_DIRECTORY, f"{emb_model_name}__Chroma")
+        self.persist_directory = os.path.join(BaseVectorstore.DATABASE_DIRECTORY, f"{emb_model_name}__Chroma")
         self._client = Client(Settings(chroma_db_impl="duckdb+parquet", persist_directory=self.persist_directory))
         self._add_collection()
 
@@ -107,31 +149,80 @@ class Chroma(BaseVectorstore):
     def _add_collection(self) -> None:
         """
         Add a new collection to the Chroma database.
+
+        A persisted collection is reused when its manifest was built with
+        the same configuration, otherwise the database is reset. The HNSW
+        parameters and the chunking are part of the configuration, since
+        the index is built with them.
         """
         name = 'chroma_collection'
-        metadata = {'hnsw:space': self.strategy, 'hnsw:construction_ef': 4096, 'hnsw:search_ef': 4096, 'hnsw:M': 100}
+        metadata = {'hnsw:space': self.strategy,
+                    'hnsw:construction_ef': self.hnsw_construction_ef,
+                    'hnsw:search_ef': self.hnsw_search_ef,
+                    'hnsw:M': self.hnsw_m}
         func = self.embedding.get_function()
-        if self._collection_exist(name):
+        self.manifest = IndexManifest(path=f"{self.persist_directory}.manifest.json",
+                                      config={'collection': name, 'metadata': metadata,
+                                              'chunking': [self.chunk_size, self.chunk_overlap]})
+        exists = self._collection_exist(name)
+        if exists and not self.manifest.reusable:
             self._client.reset()
+        # The manifest is kept next to the database, so it can outlive it:
+        # it only describes a collection that is reused
+        if not exists or not self.manifest.reusable:
+            self.manifest.clear()
         kwargs = {"name": name, "metadata": metadata, "embedding_function": func}
-        self._collection = self._client.create_collection(**kwargs)
+        self._collection = self._client.get_or_create_collection(**kwargs)
 
-    def add_data(self, 
-                 data_directory: str
-                 ) -> None:
+    def _insert(self, 
+                ids: list[str], 
+                embeddings, 
+                metadatas: list[dict], 
+                documents: list[str]
+                ) -> None:
         """
-        Add data to the Chroma collection.
+        Insert chunks with precomputed embeddings into the Chroma collection.
 
         Args:
-            data_directory (str): The directory containing the data files.
+            ids (list): The ids of the chunks.
+            embeddings (np.ndarray): The embeddings of the chunks.
+            metadatas (list): The metadatas of the chunks.
+            documents (list): The texts of the chunks.
         """
-        docs = super().process_documents(data_directory=data_directory)
-        with tqdm(total=len(docs), desc="Adding documents", ncols=80) as pbar:
-            for doc in docs:
-                self._collection.add(ids=[str(uuid1())], metadatas=[doc.metadata], documents=[doc.page_content])
+        if self.bulk_ingest:
+            self._collection.add(ids=ids, embeddings=embeddings.tolist(), metadatas=metadatas, documents=documents)
+            return
+        with tqdm(total=len(ids), desc="Adding documents", ncols=80) as pbar:
+            for idx, embedding in enumerate(embeddings):
+                self._collection.add(ids=[ids[idx]], embeddings=[embedding.tolist()], metadatas=[metadatas[idx]], documents=[documents[idx]])
                 pbar.update()
+
+    def _delete(self, 
+                ids: list[str]
+                ) -> None:
+        """
+        Delete chunks from the Chroma collection.
+
+        Args:
+            ids (list): The ids of the chunks to delete.
+        """
+        self._collection.delete(ids=ids)
+
+    def _persist(self) -> None:
+        """
+        Persist the Chroma database to disk.
+        """
         self._client.persist()
 
+    def get_index_size(self) -> int:
+        """
+        Get the size of the persisted database.
+
+        Returns:
+            int: The size of the persist directory, in bytes.
+        """
+        return BaseVectorstore.directory_size(self.persist_directory)
+
     def query(self, 
               query_text: str, 
               n_results: int, 
@@ -152,6 +243,26 @@ class Chroma(BaseVectorstore):
             return self._collection.query(query_texts=query_text, n_results=self.get_max_n(), include=include)
         return self._collection.query(query_texts=query_text, n_results=n_results, include=include)
 
+    def search(self, 
+               query_embeddings, 
+               n_results: int, 
+               include: list[str]
+               ) -> QueryResult:
+        """
+        Search the Chroma collection with several query embeddings in one call.
+
+        Args:
+            query_embeddings (np.ndarray): One query embedding per row.
+            n_results (int): The number of results per query, -1 for all.
+            include (list): The list of fields to include in the results.
+
+        Returns:
+            dict: The query result, with one list of results per query.
+        """
+        if n_results == -1:
+            n_results = self.get_max_n()
+        return self._collection.query(query_embeddings=query_embeddings.tolist(), n_results=n_results, include=include)
+
     def get_available_strategies(self) -> list[str]:
         """
         Get the available search strategies for Chroma.
@@ -185,6 +296,7 @@ def main():
     """
     Main function to demonstrate the usage of the Chroma module.
     """
+    from embeddings.HuggingFaceEmbedding import HuggingFaceEmbedding
     embedding = HuggingFaceEmbedding(model_name='all-MiniLM-L6-v2')
     chroma = Chroma(embedding=embedding, strategy='ip')
     data_directory = os.path.join(os.path.abspath(os.curdir), 'data_temp')
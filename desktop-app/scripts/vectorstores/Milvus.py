@@ -1,9 +1,10 @@
 import sys
 import os
+import re
+import json
 from typing import Any
 from .base import BaseVectorstore
-from tqdm import tqdm
-from uuid import uuid1
+from .manifest import IndexManifest
 from pymilvus import (
     connections,
     utility,
@@ -14,7 +15,6 @@ from pymilvus import (
 )
 sys.path.append('..')
 from embeddings.base import BaseEmbedding
-from embeddings.HuggingFaceEmbedding import HuggingFaceEmbedding
 
 
 
@@ -24,19 +24,35 @@ class Milvus(BaseVectorstore):
 
     Attributes:
         SEARCH_STRATEGIES (set): Supported search strategies for Milvus.
+        METRIC_TYPES (dict): The Milvus metric of each search strategy.
+        INDEX_PARAMS (dict): Default build parameters of each index type.
+        SEARCH_PARAMS (dict): Default search parameters of each index type.
+        MAX_INSERT_BYTES (int): Maximum size of a single insert request.
         name (str): Name of the vector store (Milvus).
         emb_model_name (str): Name of the embedding model.
+        index_type (str): The index type, one of INDEX_PARAMS.
+        index_params (dict): The build parameters of the index.
+        search_params (dict): The search parameters of the index.
+        max_insert_bytes (int): Maximum size of a single insert request.
         _collection (Collection): Milvus collection instance.
+        manifest (IndexManifest): Manifest of the indexed files.
 
     Methods:
         __init__: Initialize the Milvus vector store.
         _collection_exist: Check if a collection exists in the Milvus database.
         __setattr__: Set attribute value with additional validation.
         _add_collection: Add a new collection to the Milvus database.
-        add_data: Add data to the Milvus collection.
-        _process_output: Process the query output.
+        _insert: Insert chunks with precomputed embeddings into the collection.
+        _delete: Delete chunks from the collection.
+        _index_config: Get the index the collection should have.
+        _persist: Flush the collection, (re)build its index and load it.
+        _source_lookup: Map the chunk ids of the collection to their sources.
+        _fetch_sources: Add the sources of chunks the manifest misses.
+        _process_output: Decode the search output.
         query: Execute a query on the Milvus collection.
+        search: Search the Milvus collection with several query embeddings at once.
         get_available_strategies: Get the available search strategies for Milvus.
+        get_size: Get the number of chunks in the Milvus collection.
         get_max_n: Get the maximum number of results in the Milvus collection.
         __call__: Not implemented.
     """
@@ -44,11 +60,41 @@ class Milvus(BaseVectorstore):
     SEARCH_STRATEGIES = {'ip',
                          'l2'}
 
+    METRIC_TYPES = {'ip': 'IP',
+                    'l2': 'L2'}
+
+    INDEX_PARAMS = {'FLAT': {},
+                    'IVF_FLAT': {'nlist': 1024},
+                    'IVF_SQ8': {'nlist': 1024},
+                    'HNSW': {'M': 16, 'efConstruction': 256}}
+
+    SEARCH_PARAMS = {'FLAT': {},
+                     'IVF_FLAT': {'nprobe': 16},
+                     'IVF_SQ8': {'nprobe': 16},
+                     'HNSW': {'ef': 64}}
+
+    # The largest number of results Milvus returns for one query (topk)
+    MAX_TOPK = 16384
+
+    # Half of the default 64 MB gRPC message limit, leaving room for
+    # the encoding overhead
+    MAX_INSERT_BYTES = 32 * 1024 ** 2
+
     def __init__(self,
                  embedding,
                  strategy,
                  host="localhost",
                  port="19530",
+                 uri: str | None = None,
+                 index_type: str = 'FLAT',
+                 index_params: dict | None = None,
+                 search_params: dict | None = None,
+                 insert_batch_size: int = BaseVectorstore.INSERT_BATCH_SIZE,
+                 checkpoint_every: int = BaseVectorstore.CHECKPOINT_EVERY,
+                 num_workers: int | None = None,
+                 max_insert_bytes: int = MAX_INSERT_BYTES,
+                 chunk_size: int = BaseVectorstore.CHUNK_SIZE,
+                 chunk_overlap: int = BaseVectorstore.CHUNK_OVERLAP
                  ) -> None:
         """
         Initialize the Milvus vector store.
@@ -58,15 +104,47 @@ class Milvus(BaseVectorstore):
             strategy: The search strategy to use.
             host: The Milvus server host.
             port: The Milvus server port.
+            uri (str): The uri of the Milvus server, or the path of a
+                       Milvus Lite database file; replaces host and port.
+            index_type (str): The index type, FLAT, IVF_FLAT, IVF_SQ8 or HNSW.
+            index_params (dict): Build parameters overriding the defaults
+                                 of the index type.
+            search_params (dict): Search parameters overriding the defaults
+                                  of the index type.
+            insert_batch_size (int): The number of chunks embedded and added per batch.
+            checkpoint_every (int): The number of chunks added between two persists.
+            num_workers (int): The number of processes loading and splitting files.
+            max_insert_bytes (int): Maximum size of a single insert request.
+            chunk_size (int): The maximum number of characters of a chunk.
+            chunk_overlap (int): The maximum overlap of consecutive chunks.
+
+        Raises:
+            ValueError: If the index type is not supported.
         """
         super().__init__(embedding=embedding,
-                         strategy=strategy)
+                         strategy=strategy,
+                         insert_batch_size=insert_batch_size,
+                         checkpoint_every=checkpoint_every,
+                         num_workers=num_workers,
+                         chunk_size=chunk_size,
+                         chunk_overlap=chunk_overlap)
+        if index_type not in Milvus.INDEX_PARAMS:
+            error_msg = f"{index_type} index type is not supported"
+            raise ValueError(error_msg)
         self.name = 'Milvus'
+        self.index_type = index_type
+        self.index_params = {**Milvus.INDEX_PARAMS[index_type], **(index_params or {})}
+        self.search_params = {**Milvus.SEARCH_PARAMS[index_type], **(search_params or {})}
+        self.max_insert_bytes = max_insert_bytes
+        self._sources = None
         emb_model_name = embedding.get_name()
         self.emb_model_name = emb_model_name
-        connections.connect("default",
-                            host=host,
-                            port=port)
+        if uri is not None:
+            connections.connect("default", uri=uri)
+        else:
+            connections.connect("default",
+                                host=host,
+                                port=port)
         self._add_collection()
 
 
@@ -115,10 +193,26 @@ class Milvus(BaseVectorstore):
     def _add_collection(self):
         """
         Add a new collection to the Milvus database.
+
+        An existing collection is reused when its manifest was built with
+        the same configuration, otherwise it is dropped and recreated.
         """
-        name = 'milvus_collection'
+        # One collection per model, so that several models can be indexed
+        # side by side
+        name = 'milvus_collection__' + re.sub(r'\W', '_', self.emb_model_name)
+        self.manifest = IndexManifest(
+            path=os.path.join(BaseVectorstore.DATABASE_DIRECTORY,
+                              f"{self.emb_model_name}__Milvus.manifest.json"),
+            config={'collection': name,
+                    'model': self.emb_model_name,
+                    'dimension': self.embedding.get_dimension(),
+                    'chunking': [self.chunk_size, self.chunk_overlap]})
+        if self._collection_exist(name) and self.manifest.reusable:
+            self._collection = Collection(name)
+            return
         if self._collection_exist(name): 
             utility.drop_collection(name) 
+        self.manifest.clear()
         id_field = FieldSchema(
             name="ids",
             dtype=DataType.VARCHAR,
@@ -146,70 +240,173 @@ class Milvus(BaseVectorstore):
         fields = [id_field, metadata_field, embed_field,  doc_field]
         schema = CollectionSchema(fields, "Milvus collection")
         self._collection = Collection(name, schema, consistency_level="Strong")
-        print(self._collection.description)
+        print(self._collection.description, file=sys.stderr)
         
     
 
-    def add_data(self, 
-                 data_directory: str
-                 ) -> None:
+    def _insert(self, 
+                ids: list[str], 
+                embeddings, 
+                metadatas: list[dict], 
+                documents: list[str]
+                ) -> None:
         """
-        Add data to the Milvus collection.
+        Insert chunks with precomputed embeddings into the Milvus collection.
+
+        The chunks are sent in as many requests as needed to keep each
+        one under `max_insert_bytes`, since a request over the gRPC message
+        limit is rejected as a whole.
 
         Args:
-            data_directory (str): The directory containing the data files.
+            ids (list): The ids of the chunks.
+            embeddings (np.ndarray): The embeddings of the chunks.
+            metadatas (list): The metadatas of the chunks.
+            documents (list): The texts of the chunks.
+        """
+        self._sources = None
+        sources = [metadata['source'] for metadata in metadatas]
+        vector_bytes = self.embedding.get_dimension() * 4
+        start, size = 0, 0
+        for end in range(len(ids)):
+            row_bytes = (vector_bytes + len(ids[end]) + len(sources[end].encode('utf-8'))
+                         + len(documents[end].encode('utf-8')))
+            if size + row_bytes > self.max_insert_bytes and end > start:
+                self._collection.insert([ids[start:end], sources[start:end],
+                                         list(embeddings[start:end]),
+                                         documents[start:end]])
+                start, size = end, 0
+            size += row_bytes
+        if start < len(ids):
+            self._collection.insert([ids[start:], sources[start:],
+                                     list(embeddings[start:]), documents[start:]])
+
+    def _delete(self, 
+                ids: list[str]
+                ) -> None:
+        """
+        Delete chunks from the Milvus collection.
+
+        Args:
+            ids (list): The ids of the chunks to delete.
+        """
+        self._sources = None
+        self._collection.delete(expr=f"ids in {json.dumps(ids)}")
+
+    def _index_config(self) -> dict:
+        """
+        Get the index the collection should have for the strategy,
+        index type and build parameters of the store.
+
+        Returns:
+            dict: The index type, metric type and build parameters.
+        """
+        return {"index_type": self.index_type,
+                "metric_type": Milvus.METRIC_TYPES[self.strategy],
+                "params": self.index_params}
+
+    def _persist(self) -> None:
+        """
+        Flush the inserted chunks and load the indexed collection.
+
+        The data does not depend on the index, so when the strategy or the
+        index changed since the collection was indexed, only the index is
+        rebuilt.
         """
-        
-        docs = super().process_documents(data_directory=data_directory)
-        datas = [[], [], [], []]
-        with tqdm(total=len(docs), 
-                    desc="Extracting datas", 
-                    ncols=80) as pbar:
-            for doc in docs: 
-                datas[0].append(str(uuid1()))
-                datas[1].append(doc.metadata['source'])
-                datas[2].append(self.embedding.from_text(doc.page_content))
-                datas[3].append(doc.page_content)
-                pbar.update() 
-        self._collection.insert(datas)
         self._collection.flush() 
-        field_params = {
-            "index_type": "FLAT",
-            "metric_type": "IP", 
-        }
-        self._collection.create_index("embeddings", field_params)
+        config = self._index_config()
+        if self._collection.has_index():
+            current = dict(self._collection.index().params)
+            if isinstance(current.get('params'), str):
+                current['params'] = json.loads(current['params'])
+            if {key: current.get(key) for key in config} != config:
+                self._collection.release()
+                self._collection.drop_index()
+        if not self._collection.has_index():
+            self._collection.create_index("embeddings", config)
         self._collection.load()
 
+    def _source_lookup(self):
+        """
+        Map the chunk ids of the collection to their sources using the
+        manifest, so that searches do not fetch the source of every hit.
+
+        Returns:
+            tuple: The id to source index mapping and one shared metadata
+                   dict per source.
+        """
+        if self._sources is None:
+            source_of, metadatas = dict(), []
+            for path, entry in self.manifest.entries.items():
+                for chunk_id in entry['ids']:
+                    source_of[chunk_id] = len(metadatas)
+                metadatas.append({'source': path})
+            self._sources = (source_of, metadatas)
+        return self._sources
+
+    def _fetch_sources(self,
+                       chunk_ids: list[str],
+                       sources: tuple) -> None:
+        """
+        Fetch the sources of chunks added outside of the manifest from the
+        collection, and add them to the mapping until the collection changes.
+
+        Args:
+            chunk_ids (list): The ids of the chunks.
+            sources (tuple): The mapping returned by `_source_lookup`.
+        """
+        source_of, metadatas = sources
+        index_of = {metadata['source']: idx for idx, metadata in enumerate(metadatas)}
+        rows = self._collection.query(expr=f"ids in {json.dumps(chunk_ids)}",
+                                      output_fields=['source'])
+        for row in rows:
+            if row['source'] not in index_of:
+                index_of[row['source']] = len(metadatas)
+                metadatas.append({'source': row['source']})
+            source_of[row['ids']] = index_of[row['source']]
+
     def _process_output(self,
                         output,
-                        include):
+                        include,
+                        sources=None):
         """
-        Process the query output.
+        Decode the search output column by column.
+
+        Ids and distances are read from the columns of each query's hits
+        into lists, and metadatas point to one shared dict per source
+        instead of being built for every hit. The sources of hits the
+        manifest does not know are fetched in one query.
 
         Args:
-            output: The query output.
+            output: The search output.
             include: The list of fields to include in the results.
+            sources (tuple): The mapping returned by `_source_lookup`,
+                             needed when metadatas are included.
 
         Returns:
-            dict: The processed query result.
+            dict: The processed query result, with one list of results per
+                  query for every included field.
         """
-        all_fields = {
-            "ids":[],
-            "distances":[],
-            "metadatas":[[]],
-            "documents":[]
-        }
-        for row in output[0]:
-            row_dict = row.to_dict()
-            all_fields['ids'].append(row_dict['id'])
-            all_fields['distances'].append(row_dict['distance'])
-            all_fields['metadatas'][0].append({'source':row_dict['entity']['source']})
-            all_fields['documents'].append(row_dict['entity']['documents'])
-        
-        new_output = dict()
-        for field in include : new_output[field] = all_fields[field] 
+        # Ids are always returned, as Chroma does
+        new_output = {field: [] for field in ['ids', *include]}
+        if 'metadatas' in new_output:
+            source_of, shared = sources
+            missing = dict.fromkeys(chunk_id for hits in output
+                                    for chunk_id in hits.ids
+                                    if chunk_id not in source_of)
+            if len(missing) > 0:
+                self._fetch_sources(chunk_ids=list(missing), sources=sources)
+        for hits in output:
+            new_output['ids'].append(list(hits.ids))
+            if 'distances' in new_output:
+                new_output['distances'].append(list(hits.distances))
+            if 'metadatas' in new_output:
+                new_output['metadatas'].append([shared[source_of[chunk_id]]
+                                                for chunk_id in hits.ids])
+            if 'documents' in new_output:
+                new_output['documents'].append([hit.entity.get('documents')
+                                                for hit in hits])
         return new_output
-        
+
     def query(self, 
               query_text: str, 
               n_results: int,
@@ -225,20 +422,54 @@ class Milvus(BaseVectorstore):
         Returns:
             dict: The query result.
         """
-        query_vector = self.embedding.from_text(query_text)
-        limit = self._collection.num_entities if n_results == -1 else n_results
+        return self.query_batch(query_texts=[query_text],
+                                n_results=n_results,
+                                include=include)
+
+    def search(self, 
+               query_embeddings, 
+               n_results: int,
+               include: list[str]):
+        """
+        Search the Milvus collection with several query embeddings in one search.
+
+        Only the fields needed by `include` are fetched with the hits; the
+        sources are looked up from the manifest, and only fetched for the
+        hits it misses.
+
+        Milvus returns at most `MAX_TOPK` results per query, so larger
+        requests, including -1 on a larger collection, are capped to it.
+
+        Args:
+            query_embeddings (np.ndarray): One query embedding per row.
+            n_results (int): The number of results per query, -1 for all.
+            include (list): The list of fields to include in the results.
+
+        Returns:
+            dict: The query result, with the results of each query (see
+                  `_process_output`).
+        """
+        limit = self.get_max_n() if n_results == -1 else min(n_results, Milvus.MAX_TOPK)
+        params = dict(self.search_params)
+        if 'ef' in params:
+            # HNSW cannot return more results than its search breadth
+            params['ef'] = max(params['ef'], limit)
         param = {
-            "metric_type": "IP",
-            "limit": limit, 
+            "metric_type": Milvus.METRIC_TYPES[self.strategy],
+            "params": params,
         }
-        output = self._collection.search(data=[query_vector],
+        sources = self._source_lookup() if 'metadatas' in include else None
+        output_fields = []
+        if 'documents' in include:
+            output_fields.append('documents')
+        output = self._collection.search(data=list(query_embeddings),
                                          anns_field="embeddings",
                                          param=param,
-                                         output_fields=['source',
-                                                        'documents'],
+                                         output_fields=output_fields,
                                          limit=limit) 
         return self._process_output(output=output,
-                                    include=include)
+                                    include=include,
+                                    sources=sources)
         
         
     def get_available_strategies(self) -> list[str]:
@@ -250,14 +481,24 @@ class Milvus(BaseVectorstore):
         """
         return Milvus.SEARCH_STRATEGIES
     
+    def get_size(self) -> int:
+        """
+        Get the number of chunks in the Milvus collection.
+
+        Returns:
+            int: The number of chunks.
+        """
+        return self._collection.num_entities
+
     def get_max_n(self) -> int:
         """
-        Get the maximum number of results in the Milvus collection.
+        Get the maximum number of results of a search of the Milvus
+        collection: its size, up to `MAX_TOPK`.
 
         Returns:
             int: The maximum number of results.
         """
-        return self._collection.num_entities
+        return min(self._collection.num_entities, Milvus.MAX_TOPK)
     
     def __call__(self, 
                  embedding, 
@@ -273,6 +514,7 @@ class Milvus(BaseVectorstore):
 
 
 def main(): 
+    from embeddings.HuggingFaceEmbedding import HuggingFaceEmbedding
     embedding = HuggingFaceEmbedding(model_name='all-MiniLM-L6-v2') 
     milvus = Milvus(embedding=embedding, strategy='ip')
     milvus.add_data(os.path.join(os.path.abspath(os.pardir), 'data_temp')) 
@@ -0,0 +1,370 @@
+import sys
+import os
+from typing import Any
+import numpy as np
+from .base import BaseVectorstore
+from .manifest import IndexManifest
+from .matrix import EmbeddingMatrix
+sys.path.append('..')
+from embeddings.base import BaseEmbedding
+
+
+class Numpy(BaseVectorstore):
+    """
+    An in-process vector store doing exact search with NumPy.
+
+    The embeddings are kept in one contiguous float32 matrix and a whole
+    batch of queries is answered with a single matrix multiply followed by
+    `argpartition`/`argsort`. Search is exact, so it gives the ground truth
+    of the approximate stores, and needs no external service.
+
+    Attributes:
+        SEARCH_STRATEGIES (set): Supported search strategies for Numpy.
+        MAX_SCORES (int): Maximum number of scores computed in one multiply.
+        name (str): Name of the vector store (Numpy).
+        emb_model_name (str): Name of the embedding model.
+        persist_directory (str): Directory of the store's embedding matrix.
+        matrix_dtype (str): The dtype of the persisted matrix.
+        manifest (IndexManifest): Manifest of the indexed files.
+
+    Methods:
+        __init__: Initialize the Numpy vector store.
+        __setattr__: Set attribute value with additional validation.
+        _add_collection: Open the persisted store, if any.
+        _materialize: Copy a memory-mapped store into memory.
+        _insert: Append chunks with precomputed embeddings to the store.
+        _delete: Delete chunks from the store.
+        _persist: Persist the store to disk.
+        get_index_size: Get the size of the persisted store.
+        query: Execute a query on the store.
+        search: Search the store with several query embeddings at once.
+        get_available_strategies: Get the available search strategies for Numpy.
+        get_max_n: Get the maximum number of results in the store.
+        __call__: Not implemented.
+    """
+
+    SEARCH_STRATEGIES = {'ip',
+                         'cosine',
+                         'l2'}
+
+    # Bounds the (queries x chunks) score matrix to 128 MB of float32
+    MAX_SCORES = 32 * 1024 ** 2
+
+    # The store is the matrix that other stores are filled from
+    REUSES_MATRIX = False
+
+    def __init__(self,
+                 embedding: BaseEmbedding,
+                 strategy: str,
+                 insert_batch_size: int = BaseVectorstore.INSERT_BATCH_SIZE,
+                 num_workers: int | None = None,
+                 matrix_dtype: str = 'float32',
+                 chunk_size: int = BaseVectorstore.CHUNK_SIZE,
+                 chunk_overlap: int = BaseVectorstore.CHUNK_OVERLAP
+                 ) -> None:
+        """
+        Initialize the Numpy vector store.
+
+        Args:
+            embedding (BaseEmbedding): The embedding model to use.
+            strategy (str): The search strategy to use.
+            insert_batch_size (int): The number of chunks embedded and added per batch.
+            num_workers (int): The number of processes loading and splitting files.
+            matrix_dtype (str): The dtype of the persisted matrix, float32 or float16.
+            chunk_size (int): The maximum number of characters of a chunk.
+            chunk_overlap (int): The maximum overlap of consecutive chunks.
+        """
+        super().__init__(embedding=embedding, strategy=strategy,
+                         insert_batch_size=insert_batch_size,
+                         # Every persist rewrites the whole matrix, so it is
+                         # only persisted once at the end of `add_data`
+                         checkpoint_every=None,
+                         num_workers=num_workers,
+                         chunk_size=chunk_size,
+                         chunk_overlap=chunk_overlap)
+        self.name = 'Numpy'
+        self.matrix_dtype = matrix_dtype
+        emb_model_name = embedding.get_name()
+        self.emb_model_name = emb_model_name
+        self.persist_directory = self.matrix_directory(emb_model_name)
+        self._add_collection()
+
+    def __setattr__(self,
+                    __name: str,
+                    __value: Any
+                    ) -> None:
+        """
+        Set attribute value with additional validation.
+
+        Args:
+            __name (str): The name of the attribute.
+            __value (Any): The value to be set.
+
+        Raises:
+            ValueError: If the embedding is not of type BaseEmbedding.
+            ValueError: If the strategy is not supported.
+        """
+        if __name == "embedding":
+            if not isinstance(__value, BaseEmbedding):
+                error_msg = "Embedding must be of BaseEmbedding type"
+                raise ValueError(error_msg)
+        elif __name == "strategy":
+            if __value not in Numpy.SEARCH_STRATEGIES:
+                error_msg = f"{__value} search strategy is not supported"
+                raise ValueError(error_msg)
+
+        return super().__setattr__(__name, __value)
+
+    def _add_collection(self) -> None:
+        """
+        Open the persisted store, if any.
+
+        The embeddings do not depend on the strategy, so a persisted store
+        is reused whatever the strategy it was searched with, as long as
+        it was stored with the same dtype.
+        """
+        dimension = self.embedding.get_dimension()
+        self._embeddings = np.empty((0, dimension), dtype=np.float32)
+        self._size = 0
+        self._norms = None
+        self._dirty = False
+        self._ids, self._sources, self._documents = [], [], []
+        self.manifest = IndexManifest(path=f"{self.persist_directory}.manifest.json",
+                                      config={'dimension': dimension,
+                                              'dtype': self.matrix_dtype,
+                                              'chunking': [self.chunk_size, self.chunk_overlap]})
+        if not self.manifest.reusable or not EmbeddingMatrix.exists(self.persist_directory):
+            self.manifest.clear()
+            return
+
+        # Open the persisted matrix in place: nothing is read until searched,
+        # and the pages are shared with any other process opening it
+        matrix = EmbeddingMatrix(self.persist_directory)
+        self._embeddings = matrix.embeddings
+        self._size = len(matrix)
+        self._ids = matrix.ids
+        self._sources = matrix.chunk_sources
+        self._documents = matrix.documents
+
+    def _materialize(self) -> None:
+        """
+        Copy a memory-mapped store into memory before modifying it.
+        """
+        if not isinstance(self._ids, list):
+            self._ids = list(self._ids)
+            self._sources = list(self._sources)
+            self._documents = list(self._documents)
+        self._dirty = True
+
+    def _insert(self,
+                ids: list[str],
+                embeddings,
+                metadatas: list[dict],
+                documents: list[str]
+                ) -> None:
+        """
+        Append chunks with precomputed embeddings to the store.
+
+        The matrix grows geometrically, so appending n chunks in batches
+        copies the existing rows O(log n) times.
+
+        Args:
+            ids (list): The ids of the chunks.
+            embeddings (np.ndarray): The embeddings of the chunks.
+            metadatas (list): The metadatas of the chunks.
+            documents (list): The texts of the chunks.
+        """
+        self._materialize()
+        needed = self._size + len(ids)
+        if needed > len(self._embeddings):
+            capacity = max(needed, 2 * len(self._embeddings))
+            grown = np.empty((capacity, self._embeddings.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._embeddings[:self._size]
+            self._embeddings = grown
+        self._embeddings[self._size:needed] = embeddings
+        self._size = needed
+        self._norms = None
+        self._ids.extend(ids)
+        self._sources.extend(metadata['source'] for metadata in metadatas)
+        self._documents.extend(documents)
+
+    def _delete(self,
+                ids: list[str]
+                ) -> None:
+        """
+        Delete chunks from the store.
+
+        Args:
+            ids (list): The ids of the chunks to delete.
+        """
+        self._materialize()
+        stale = set(ids)
+        keep = np.array([chunk_id not in stale for chunk_id in self._ids], dtype=bool)
+        self._embeddings = np.ascontiguousarray(self._embeddings[:self._size][keep])
+        self._size = len(self._embeddings)
+        self._norms = None
+        self._ids = [value for value, kept in zip(self._ids, keep) if kept]
+        self._sources = [value for value, kept in zip(self._sources, keep) if kept]
+        self._documents = [value for value, kept in zip(self._documents, keep) if kept]
+
+    def _persist(self) -> None:
+        """
+        Persist the store to disk as an embedding matrix, if it changed.
+        """
+        if not self._dirty:
+            return
+        EmbeddingMatrix.write(directory=self.persist_directory,
+                              model_name=self.emb_model_name,
+                              ids=self._ids,
+                              embeddings=self._embeddings[:self._size],
+                              sources=self._sources,
+                              documents=self._documents,
+                              dtype=self.matrix_dtype)
+        self._dirty = False
+
+    def get_index_size(self) -> int:
+        """
+        Get the size of the persisted embedding matrix.
+
+        Returns:
+            int: The size of the matrix directory, in bytes.
+        """
+        return BaseVectorstore.directory_size(self.persist_directory)
+
+    def _distances(self,
+                   query_embeddings: np.ndarray,
+                   embeddings: np.ndarray
+                   ) -> np.ndarray:
+        """
+        Compute the distances between queries and chunks, smaller is closer.
+
+        The distances follow Chroma's conventions: 1 - inner product for ip,
+        1 - cosine similarity for cosine and the squared euclidean distance
+        for l2.
+        """
+        if self.strategy == 'cosine':
+            query_embeddings = query_embeddings / np.maximum(
+                np.linalg.norm(query_embeddings, axis=1, keepdims=True), 1e-12)
+            return 1.0 - (query_embeddings @ embeddings.T) / np.maximum(
+                self._norms, 1e-12)
+        scores = query_embeddings @ embeddings.T
+        if self.strategy == 'ip':
+            return 1.0 - scores
+        return (np.square(self._norms)
+                - 2.0 * scores
+                + np.sum(np.square(query_embeddings), axis=1, keepdims=True))
+
+    def query(self,
+              query_text: str,
+              n_results: int,
+              include: list[str]
+              ) -> dict:
+        """
+        Execute a query on the store.
+
+        Args:
+            query_text (str): The query text.
+            n_results (int): The number of results to retrieve.
+            include (list): The list of fields to include in the results.
+
+        Returns:
+            dict: The query result.
+        """
+        return self.query_batch(query_texts=[query_text],
+                                n_results=n_results,
+                                include=include)
+
+    def search(self,
+               query_embeddings,
+               n_results: int,
+               include: list[str]
+               ) -> dict:
+        """
+        Search the store with several query embeddings at once.
+
+        Args:
+            query_embeddings (np.ndarray): One query embedding per row.
+            n_results (int): The number of results per query, -1 for all.
+            include (list): The list of fields to include in the results.
+
+        Returns:
+            dict: The query result, with one list of results per query.
+        """
+        if self._embeddings.dtype != np.float32:
+            # float16 matrices are upcast once, float32 ones are searched in place
+            self._embeddings = self._embeddings.astype(np.float32)
+        embeddings = self._embeddings[:self._size]
+        if self._norms is None:
+            self._norms = np.linalg.norm(embeddings, axis=1)
+        n_results = self._size if n_results == -1 else min(n_results, self._size)
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+
+        # Ids are always returned, as Chroma does
+        output = {field: [] for field in ['ids', *include]}
+        # Split the queries so that the score matrix stays bounded
+        step = max(1, Numpy.MAX_SCORES // max(1, self._size))
+        for start in range(0, len(query_embeddings), step):
+            distances = self._distances(query_embeddings[start:start + step],
+                                        embeddings)
+            if n_results < self._size:
+                top = np.argpartition(distances, n_results - 1, axis=1)[:, :n_results]
+            else:
+                top = np.broadcast_to(np.arange(self._size), distances.shape)
+            order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+
+            for row, indices in enumerate(top):
+                if 'ids' in output:
+                    output['ids'].append([self._ids[idx] for idx in indices])
+                if 'distances' in output:
+                    output['distances'].append(distances[row, indices].tolist())
+                if 'metadatas' in output:
+                    output['metadatas'].append([{'source': self._sources[idx]}
+                                                for idx in indices])
+                if 'documents' in output:
+                    output['documents'].append([self._documents[idx] for idx in indices])
+        return output
+
+    def get_available_strategies(self) -> list[str]:
+        """
+        Get the available search strategies for Numpy.
+
+        Returns:
+            list: A list of available search strategies.
+        """
+        return Numpy.SEARCH_STRATEGIES
+
+    def get_max_n(self) -> int:
+        """
+        Get the maximum number of results in the store.
+
+        Returns:
+            int: The maximum number of results.
+        """
+        return self._size
+
+    def __call__(self,
+                 embedding: BaseEmbedding,
+                 strategy: str,
+                 data_directory: str
+                 ) -> None:
+        """
+        Not implemented.
+        """
+        raise NotImplementedError()
+
+
+def main():
+    """
+    Main function to demonstrate the usage of the Numpy module.
+    """
+    from embeddings.HuggingFaceEmbedding import HuggingFaceEmbedding
+    embedding = HuggingFaceEmbedding(model_name='all-MiniLM-L6-v2')
+    store = Numpy(embedding=embedding, strategy='ip')
+    data_directory = os.path.join(os.path.abspath(os.curdir), 'data_temp')
+    store.add_data(data_directory=data_directory)
+    print(store.query(query_text='Describe the ICD-10 Code A01.2', n_results=10, include=['distances']))
+
+
+if __name__ == "__main__":
+    main()
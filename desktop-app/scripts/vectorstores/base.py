@@ -1,51 +1,184 @@
+import atexit
+import multiprocessing
 import os
+import sys
+import time
 
 from abc import ABC, abstractmethod
 from typing import Any
+from uuid import uuid1
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
 from tqdm import tqdm
-from langchain.document_loaders import TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+sys.path.append('..')
+from embeddings.cache import EmbeddingCache
+from . import loaders
+from .manifest import IndexManifest
+from .matrix import EmbeddingMatrix
+from .pipeline import bounded_map, prefetch
+from .progress import Progress
+from .splitter import TextSplitter
+from .timing import StageTimer
 
 
 class BaseVectorstore(ABC):
 
-    DOC_LOADER = {'.txt' : lambda file_path : 
-                           TextLoader(file_path=file_path,
-                                      autodetect_encoding=True).load()}
+    DATABASE_DIRECTORY = os.path.join(os.path.abspath(os.pardir), "database")
+
+    INSERT_BATCH_SIZE = 4096
+    INITIAL_N_RESULTS = 16
+    LATENCY_SAMPLE = 16
+    CHECKPOINT_EVERY = 65536
+    QUEUE_SIZE = 2
+    CHUNK_SIZE = 750
+    CHUNK_OVERLAP = 100
+
+    # The loader of every supported file extension (see loaders.register_loader)
+    DOC_LOADER = loaders.LOADERS
+
+    # Whether a new store is filled from the embedding matrix of the same
+    # model and chunking, when the Numpy store has written one
+    REUSES_MATRIX = True
 
     def __init__(self,
                  embedding,
-                 strategy) -> None:
+                 strategy,
+                 embedding_cache: EmbeddingCache | None = None,
+                 use_cache: bool = True,
+                 insert_batch_size: int = INSERT_BATCH_SIZE,
+                 checkpoint_every: int | None = CHECKPOINT_EVERY,
+                 num_workers: int | None = None,
+                 queue_size: int = QUEUE_SIZE,
+                 chunk_size: int = CHUNK_SIZE,
+                 chunk_overlap: int = CHUNK_OVERLAP) -> None:
         self.embedding = embedding
         self.strategy = strategy
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.insert_batch_size = insert_batch_size
+        self.checkpoint_every = checkpoint_every
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.ingest_stats = None
+        self.truncated = 0
+        self.timer = StageTimer()
+        self.initial_n_results = BaseVectorstore.INITIAL_N_RESULTS
+        # Every store shares the same on-disk cache by default, so the same
+        # corpus is only embedded once per model across strategies and stores
+        if embedding_cache is None and use_cache:
+            embedding_cache = BaseVectorstore.default_cache()
+        self.embedding_cache = embedding_cache
+        self.manifest: IndexManifest | None = None
         super().__init__()
 
+    @classmethod
+    def default_cache(cls) -> EmbeddingCache:
+        """
+        Get the embedding cache shared by the vector stores of this process.
+        """
+        if getattr(BaseVectorstore, '_default_cache', None) is None:
+            path = os.path.join(cls.DATABASE_DIRECTORY, 'embedding_cache.sqlite')
+            BaseVectorstore._default_cache = EmbeddingCache(path=path)
+            # Write the pending last-used ticks when the process ends
+            atexit.register(BaseVectorstore._default_cache.close)
+        return BaseVectorstore._default_cache
+
+    def embed_texts(self,
+                    texts: list[str]):
+        """
+        Embed texts through the embedding cache, calling the model
+        only for the texts that were never embedded by it before.
+        Without a cache, repeated texts are still only embedded once.
+        """
+        if self.embedding_cache is None:
+            position = dict()
+            inverse = [position.setdefault(text, len(position)) for text in texts]
+            if len(position) == len(texts):
+                return self.embedding.from_texts(texts)
+            return self.embedding.from_texts(list(position))[inverse]
+        return self.embedding_cache.embed(embedding=self.embedding,
+                                          texts=texts)
+
+    @classmethod
+    def matrix_directory(cls,
+                         model_name: str) -> str:
+        """
+        Get the directory of the embedding matrix of a model, written by
+        the Numpy store and readable by every store.
+        """
+        return os.path.join(cls.DATABASE_DIRECTORY, f"{model_name}__Numpy")
+
+    def open_matrix(self) -> tuple[EmbeddingMatrix, IndexManifest] | None:
+        """
+        Open the float32 embedding matrix of the store's model and chunking
+        together with the manifest of the files it holds, if one was written.
+
+        Returns:
+            tuple: The matrix and its manifest, None if there is none.
+        """
+        directory = self.matrix_directory(self.embedding.get_name())
+        manifest = IndexManifest(path=f"{directory}.manifest.json",
+                                 config={'dimension': self.embedding.get_dimension(),
+                                         'dtype': 'float32',
+                                         'chunking': [self.chunk_size, self.chunk_overlap]})
+        if not manifest.reusable or not EmbeddingMatrix.exists(directory):
+            return None
+        return EmbeddingMatrix(directory), manifest
+
     @classmethod
     def retrieve_file_paths(cls,
-                            data_directory : str) -> list[str]:
-        
+                            data_directory : str,
+                            skipped: dict | None = None) -> list[str]:
+        """
+        List the files of a directory that have a loader, in sorted order.
+
+        Files of other extensions are skipped rather than failing the run;
+        their number is printed to stderr.
+
+        Args:
+            data_directory (str): The directory to walk.
+            skipped (dict): Filled with the number of skipped files of each
+                            extension, if given.
+
+        Returns:
+            list: The paths of the files to load.
+        """
         file_paths = []
+        if skipped is None:
+            skipped = dict()
+        progress = Progress('walk')
 
-        for root, _, files in os.walk(data_directory):
+        for root, dirs, files in os.walk(data_directory):
+            # Walk in sorted order so that the chunks, and therefore the
+            # benchmark results, do not depend on the filesystem's order
+            dirs.sort()
             # print("Files: ", files)
             with tqdm(total=len(files), 
                       desc="Retrieving file paths", 
                       ncols=80) as pbar:
-                for file_name in files:
-                    file_paths.append(os.path.join(root, file_name))
+                for file_name in sorted(files):
+                    file_path = os.path.join(root, file_name)
+                    if loaders.get_loader(file_path=file_path, loaders=cls.DOC_LOADER) is None:
+                        extension = os.path.splitext(file_name)[1].lower()
+                        skipped[extension] = skipped.get(extension, 0) + 1
+                    else:
+                        file_paths.append(file_path)
                     pbar.update()
+                    progress.update()
+        progress.close()
+        if len(skipped) > 0:
+            counts = ", ".join(f"{extension or '(none)'}: {count}"
+                               for extension, count in sorted(skipped.items()))
+            print(f"Skipped {sum(skipped.values())} unsupported files ({counts})",
+                  file=sys.stderr)
         return file_paths
     
     @classmethod
     def _load_document(cls,
                        file_path : str):
         
-        file_extension = os.path.splitext(file_path)[1]
-        if not file_extension in cls.DOC_LOADER:
-            error_msg = f'Unsupport file extension: {file_extension}'
-            raise ValueError(error_msg)
-        
-        return cls.DOC_LOADER[file_extension](file_path=file_path)
+        return loaders.load(file_path=file_path, loaders=cls.DOC_LOADER)
 
     
     @classmethod
@@ -54,31 +187,463 @@ class BaseVectorstore(ABC):
         
         if len(file_paths) == 0:
             raise ValueError("Number of filepaths can't be zero")
-        docs = cls._load_document(file_paths[0])
+        docs = list(cls._load_document(file_paths[0]))
         for path in file_paths[1:]: 
             docs.extend(cls._load_document(file_path=path))
 
         return docs    
 
 
+    @classmethod
+    def split_documents(cls,
+                        docs,
+                        chunk_size: int = CHUNK_SIZE,
+                        chunk_overlap: int = CHUNK_OVERLAP):
+        """
+        Split documents into chunks, on the same boundaries as langchain's
+        RecursiveCharacterTextSplitter but faster (see TextSplitter).
+        """
+        splitter = TextSplitter(chunk_size=chunk_size,
+                                chunk_overlap=chunk_overlap)
+        return splitter.split_documents(docs)
+
+
     @classmethod
     def process_documents(cls,
-                          data_directory : str) :
+                          data_directory : str,
+                          num_workers : int | None = None,
+                          chunk_size: int = CHUNK_SIZE,
+                          chunk_overlap: int = CHUNK_OVERLAP) :
         
         
         file_paths = cls.retrieve_file_paths(data_directory=data_directory)
         #print("Data directory: ", data_directory)
-        loaded_docs = cls.load_documents(file_paths=file_paths)
-        splitter = RecursiveCharacterTextSplitter(chunk_size=750,
-                                                  chunk_overlap=100)
-        splitted_docs = splitter.split_documents(loaded_docs)
+        if len(file_paths) == 0:
+            raise ValueError("Number of filepaths can't be zero")
+        splitted_docs = []
+        for _, chunks in cls.process_files(file_paths=file_paths,
+                                           num_workers=num_workers,
+                                           chunk_size=chunk_size,
+                                           chunk_overlap=chunk_overlap):
+            splitted_docs.extend(chunks)
         
         return splitted_docs
-    
 
-    @abstractmethod
+
+    @classmethod
+    def process_file(cls,
+                     file_path: str,
+                     chunk_size: int = CHUNK_SIZE,
+                     chunk_overlap: int = CHUNK_OVERLAP):
+        """
+        Load and split a single file.
+
+        Returns:
+            list: The chunks of the file.
+        """
+        return cls.split_documents(cls._load_document(file_path=file_path),
+                                   chunk_size=chunk_size,
+                                   chunk_overlap=chunk_overlap)
+
+
+    @classmethod
+    def _timed_process_file(cls,
+                            file_path: str,
+                            chunk_size: int = CHUNK_SIZE,
+                            chunk_overlap: int = CHUNK_OVERLAP):
+        """
+        Load and split a single file, timing both steps.
+
+        The documents are split as they are loaded, so the time of each
+        step is the time spent reading documents and the rest.
+
+        Returns:
+            tuple: The chunks of the file, None if no encoding decodes it,
+                   and the seconds spent loading and splitting it.
+        """
+        load_seconds = 0.0
+
+        def timed(docs):
+            nonlocal load_seconds
+            while True:
+                read = time.perf_counter()
+                doc = next(docs, None)
+                load_seconds += time.perf_counter() - read
+                if doc is None:
+                    return
+                yield doc
+
+        start = time.perf_counter()
+        try:
+            chunks = cls.split_documents(timed(cls._load_document(file_path=file_path)),
+                                         chunk_size=chunk_size,
+                                         chunk_overlap=chunk_overlap)
+        except loaders.UndecodableFileError:
+            chunks = None
+        return chunks, load_seconds, time.perf_counter() - start - load_seconds
+
+
+    @classmethod
+    def process_files(cls,
+                      file_paths: list[str],
+                      num_workers: int | None = None,
+                      timer: StageTimer | None = None,
+                      chunk_size: int = CHUNK_SIZE,
+                      chunk_overlap: int = CHUNK_OVERLAP,
+                      skipped: dict | None = None):
+        """
+        Load and split the given files on a pool of `num_workers` processes
+        (all cores by default, no pool when 1).
+
+        The chunks are yielded in the order of `file_paths` whatever the
+        order the workers finish in, so the output is deterministic. A file
+        that no encoding decodes is skipped, as an unsupported one, and
+        yielded without chunks.
+
+        Args:
+            file_paths (list): The files to load and split.
+            num_workers (int): The number of processes.
+            timer (StageTimer): Records the time spent loading and splitting,
+                                summed over the workers.
+            chunk_size (int): The maximum number of characters of a chunk.
+            chunk_overlap (int): The maximum overlap of consecutive chunks.
+            skipped (dict): Incremented with the number of undecodable
+                            files of each extension, if given.
+
+        Yields:
+            tuple: The file path and the list of chunks it produced.
+        """
+        num_workers = num_workers or os.cpu_count() or 1
+        num_workers = min(num_workers, len(file_paths))
+        chunking = {'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap}
+
+        def record(path, result):
+            chunks, load_seconds, split_seconds = result
+            if chunks is None:
+                print(f"Skipped {path}: no detected encoding decodes it", file=sys.stderr)
+                if skipped is not None:
+                    extension = os.path.splitext(path)[1].lower()
+                    skipped[extension] = skipped.get(extension, 0) + 1
+                chunks = []
+            if timer is not None:
+                timer.add('load', seconds=load_seconds, items=1)
+                timer.add('split', seconds=split_seconds, items=len(chunks))
+            return path, chunks
+
+        with tqdm(total=len(file_paths),
+                  desc="Loading documents",
+                  ncols=80) as pbar, Progress('load', total=len(file_paths)) as progress:
+            if num_workers <= 1:
+                for path in file_paths:
+                    yield record(path, cls._timed_process_file(file_path=path, **chunking))
+                    pbar.update()
+                    progress.update()
+                return
+            # Hand the files out in groups to amortize the inter-process
+            # overhead, with a bounded number of groups in flight so that
+            # loaded chunks never pile up ahead of the consumer
+            group_size = max(1, min(64, len(file_paths) // (num_workers * 4)))
+            starts = range(0, len(file_paths), group_size)
+            groups = (file_paths[start:start + group_size] for start in starts)
+            # The files are often loaded from a background pipeline stage
+            # while other threads hold locks (logging, SQLite, tokenizers),
+            # which a forked worker would inherit locked, so spawn them
+            with ProcessPoolExecutor(max_workers=num_workers,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = bounded_map(executor,
+                                      partial(cls._process_file_group, **chunking),
+                                      groups,
+                                      max_pending=num_workers * 2)
+                for start, group_chunks in zip(starts, results):
+                    group = file_paths[start:start + group_size]
+                    for path, result in zip(group, group_chunks):
+                        yield record(path, result)
+                        pbar.update()
+                        progress.update()
+
+
+    @classmethod
+    def _process_file_group(cls,
+                            file_paths: list[str],
+                            chunk_size: int = CHUNK_SIZE,
+                            chunk_overlap: int = CHUNK_OVERLAP):
+        return [cls._timed_process_file(file_path=path,
+                                        chunk_size=chunk_size,
+                                        chunk_overlap=chunk_overlap)
+                for path in file_paths]
+
+
     def add_data(self, 
-                 data_directory: str) -> None:
+                 data_directory: str,
+                 chunks: dict | None = None,
+                 skipped_files: int = 0) -> None:
+        """
+        Add data to the vector store, re-indexing only what changed.
+
+        The files of `data_directory` are compared against the store's
+        manifest: chunks of removed and changed files are deleted, and only
+        new and changed files are loaded, split, embedded and inserted. A
+        new store is first filled from the embedding matrix of the same
+        files, if the Numpy store wrote one (see `open_matrix`). Chunks are
+        streamed from the files to the store in batches of
+        `insert_batch_size`, and the store and its manifest are persisted every
+        `checkpoint_every` chunks, if set, and once at the end. Chunks whose text is
+        already stored are not embedded nor stored again, only recorded in
+        the manifest under their file. The ingest throughput is recorded in
+        `ingest_stats`, which tells whether the stored index was reused
+        as is, and the time of every stage in `timer`.
+
+        Args:
+            data_directory (str): The directory containing the data files.
+            chunks (dict): The chunks of every file of the directory, when
+                           already loaded and split with the store's
+                           `chunk_size` and `chunk_overlap`, by file path.
+            skipped_files (int): The number of unsupported or undecodable
+                                 files skipped by the walk and the loading
+                                 that produced `chunks`.
+        """
+        start = time.perf_counter()
+        if chunks is None:
+            skipped = dict()
+            file_paths = self.retrieve_file_paths(data_directory=data_directory,
+                                                  skipped=skipped)
+            self.timer.add('walk', seconds=time.perf_counter() - start,
+                           items=len(file_paths))
+        else:
+            file_paths = list(chunks.keys())
+        # A new store takes the chunks already embedded into the matrix of
+        # the same files, then only indexes the files changed since
+        seeded = 0
+        if self.REUSES_MATRIX and len(self.manifest.entries) == 0:
+            opened = self.open_matrix()
+            if opened is not None and not opened[1].entries.keys().isdisjoint(file_paths):
+                self.add_matrix(*opened)
+                seeded = len(opened[0])
+        added, changed, removed = self.manifest.diff(file_paths)
+
+        stale_ids = self.manifest.pop(changed + removed)
+        if len(stale_ids) > 0:
+            self._delete(ids=stale_ids)
+
+        # Stream the chunks through three overlapping stages: loading and
+        # splitting, embedding, and insertion. Each hands over to the next
+        # through a queue of at most `queue_size` batches, so memory stays
+        # bounded whatever the size of the corpus.
+        if chunks is None:
+            files = self.process_files(file_paths=added + changed,
+                                       num_workers=self.num_workers,
+                                       timer=self.timer,
+                                       chunk_size=self.chunk_size,
+                                       chunk_overlap=self.chunk_overlap,
+                                       skipped=skipped)
+        else:
+            files = ((path, chunks[path]) for path in added + changed)
+        # The number of new chunks is only known once every file is split,
+        # so the chunk stages start from the number of given chunks, if any,
+        # and extrapolate it from the new chunks of the files batched so far
+        num_files = len(added) + len(changed)
+        total = None if chunks is None else sum(len(chunks[path]) for path in added + changed)
+        embed_progress = Progress('embed', total=total)
+        insert_progress = Progress('insert', total=total)
+
+        def estimate_totals(batches):
+            batched_files, new_chunks = 0, 0
+            for batch in batches:
+                batched_files += len(batch['files'])
+                new_chunks += len(batch['ids'])
+                total = round(new_chunks * num_files / max(batched_files, 1))
+                embed_progress.set_total(total)
+                insert_progress.set_total(total)
+                yield batch
+            embed_progress.set_total(new_chunks)
+            insert_progress.set_total(new_chunks)
+
+        def embed(batch: dict) -> dict:
+            batch = self._embed_batch(batch)
+            embed_progress.update(len(batch['ids']))
+            return batch
+
+        batches = prefetch(estimate_totals(self._batch_chunks(files)),
+                           maxsize=self.queue_size)
+        embedded = prefetch((embed(batch) for batch in batches),
+                            maxsize=self.queue_size)
+
+        inserted, duplicates, since_checkpoint = 0, 0, 0
+        for batch in embedded:
+            self._insert_batch(batch)
+            insert_progress.update(len(batch['ids']))
+            inserted += len(batch['ids'])
+            duplicates += batch['duplicates']
+            since_checkpoint += len(batch['ids'])
+            if self.checkpoint_every is not None and since_checkpoint >= self.checkpoint_every:
+                self._checkpoint()
+                since_checkpoint = 0
+        self._checkpoint()
+        embed_progress.close()
+        insert_progress.close()
+        if chunks is None:
+            # Undecodable files are only known once every file is loaded
+            skipped_files = sum(skipped.values())
+
+        seconds = time.perf_counter() - start
+        inserted += seeded
+        self.ingest_stats = {'chunks': inserted,
+                             'reused': seeded == 0 and len(added) + len(changed) + len(removed) == 0,
+                             'duplicates': duplicates,
+                             'skipped_files': skipped_files,
+                             'seconds': round(seconds, 3),
+                             'chunks_per_second': round(inserted / seconds, 2)}
+
+    def _batch_chunks(self,
+                      files):
+        """
+        Group the chunks of the loaded files into batches of at least
+        `insert_batch_size` new chunks, never splitting a file across batches.
+
+        A chunk whose text is already stored, or earlier in the input,
+        takes the id of that chunk instead of being added to the batch.
+
+        Yields:
+            dict: The files of the batch with their chunk ids, the ids,
+                  content hashes, metadatas and texts of its new chunks,
+                  and the number of duplicate chunks.
+        """
+        def new_batch():
+            return {'files': [], 'ids': [], 'hashes': [], 'metadatas': [],
+                    'documents': [], 'duplicates': 0}
+
+        # Chunks of this run are only added to the manifest once inserted,
+        # so that a checkpoint never records a chunk that is not stored yet
+        pending = dict()
+        batch = new_batch()
+        for path, chunks in files:
+            chunk_ids = []
+            for chunk in chunks:
+                key = EmbeddingCache.hash_text(chunk.page_content)
+                chunk_id = self.manifest.chunks.get(key) or pending.get(key)
+                if chunk_id is None:
+                    chunk_id = str(uuid1())
+                    pending[key] = chunk_id
+                    batch['ids'].append(chunk_id)
+                    batch['hashes'].append(key)
+                    batch['metadatas'].append(chunk.metadata)
+                    batch['documents'].append(chunk.page_content)
+                else:
+                    batch['duplicates'] += 1
+                chunk_ids.append(chunk_id)
+            batch['files'].append((path, chunk_ids))
+            if len(batch['ids']) >= self.insert_batch_size:
+                yield batch
+                batch = new_batch()
+        if len(batch['files']) > 0:
+            yield batch
+
+    def _embed_batch(self,
+                     batch: dict) -> dict:
+        """
+        Add the embeddings of its chunks to a batch.
+        """
+        batch['embeddings'] = None
+        if len(batch['documents']) > 0:
+            with self.timer.stage('embed', items=len(batch['documents'])):
+                batch['embeddings'] = self.embed_texts(batch['documents'])
+        return batch
+
+    def _insert_batch(self,
+                      batch: dict) -> None:
+        """
+        Insert one embedded batch of chunks, then record its chunks and
+        files in the manifest.
+        """
+        if len(batch['documents']) > 0:
+            with self.timer.stage('insert', items=len(batch['documents'])):
+                self._insert(ids=batch['ids'],
+                             embeddings=batch['embeddings'],
+                             metadatas=batch['metadatas'],
+                             documents=batch['documents'])
+        self.manifest.chunks.update(zip(batch['hashes'], batch['ids']))
+        for path, chunk_ids in batch['files']:
+            self.manifest.track(file_path=path, ids=chunk_ids)
+
+    def add_matrix(self,
+                   matrix: EmbeddingMatrix,
+                   manifest: IndexManifest | None = None) -> None:
+        """
+        Add the chunks of an embedding matrix without embedding them again.
+
+        The files the chunks came from are recorded in the manifest, so a
+        later `add_data` over the same directory only indexes what changed
+        since. The matrix must have been built with the store's model.
+
+        Args:
+            matrix (EmbeddingMatrix): The matrix to add.
+            manifest (IndexManifest): The manifest of the files the matrix
+                                      was built from, if known. Its records
+                                      are copied, so files changed since
+                                      are indexed again; otherwise the
+                                      files are recorded as they are now.
+
+        Raises:
+            ValueError: If the matrix was built with another embedding model.
+        """
+        if matrix.meta['model'] != self.embedding.get_name():
+            error_msg = (f"Matrix was built with {matrix.meta['model']}, "
+                         f"not {self.embedding.get_name()}")
+            raise ValueError(error_msg)
+
+        files = dict()
+        with tqdm(total=len(matrix), desc="Adding matrix", ncols=80) as pbar, \
+             Progress('insert', total=len(matrix)) as progress:
+            for start in range(0, len(matrix), self.insert_batch_size):
+                rows = range(start, min(start + self.insert_batch_size, len(matrix)))
+                ids = [matrix.ids[idx] for idx in rows]
+                sources = [matrix.source(idx) for idx in rows]
+                documents = [matrix.documents[idx] for idx in rows]
+                with self.timer.stage('insert', items=len(rows)):
+                    self._insert(ids=ids,
+                                 embeddings=np.asarray(matrix.embeddings[rows.start:rows.stop],
+                                                       dtype=np.float32),
+                                 metadatas=[{'source': source} for source in sources],
+                                 documents=documents)
+                for chunk_id, source, document in zip(ids, sources, documents):
+                    files.setdefault(source, []).append(chunk_id)
+                    self.manifest.chunks.setdefault(EmbeddingCache.hash_text(document),
+                                                    chunk_id)
+                pbar.update(len(rows))
+                progress.update(len(rows))
+
+        if manifest is not None:
+            self.manifest.entries.update({path: dict(entry)
+                                          for path, entry in manifest.entries.items()})
+            self.manifest.chunks.update(manifest.chunks)
+        else:
+            for path, chunk_ids in files.items():
+                if os.path.exists(path):
+                    self.manifest.track(file_path=path, ids=chunk_ids)
+        self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        """
+        Persist the store together with a manifest that matches it.
+        """
+        with self.timer.stage('persist'):
+            self._persist()
+            self.manifest.save()
+
+    @abstractmethod
+    def _insert(self,
+                ids: list[str],
+                embeddings,
+                metadatas: list[dict],
+                documents: list[str]) -> None:
+        pass
+
+    @abstractmethod
+    def _delete(self,
+                ids: list[str]) -> None:
+        pass
+
+    def _persist(self) -> None:
         pass
 
     @abstractmethod
@@ -87,6 +652,239 @@ class BaseVectorstore(ABC):
               n_results: int):
         pass
 
+    def query_batch(self,
+                    query_texts: list[str],
+                    n_results: int,
+                    include: list[str]) -> dict:
+        """
+        Execute several queries at once.
+
+        Args:
+            query_texts (list): The query texts.
+            n_results (int): The number of results per query, -1 for all.
+            include (list): The list of fields to include in the results.
+
+        Returns:
+            dict: For every included field, one list of results per query.
+        """
+        return self.search(query_embeddings=self.embed_texts(query_texts),
+                           n_results=n_results,
+                           include=include)
+
+    @abstractmethod
+    def search(self,
+               query_embeddings,
+               n_results: int,
+               include: list[str]) -> dict:
+        """
+        Search the store with several query embeddings at once.
+
+        Args:
+            query_embeddings (np.ndarray): One query embedding per row.
+            n_results (int): The number of results per query, -1 for all.
+            include (list): The list of fields to include in the results.
+
+        Returns:
+            dict: For every included field, and for 'ids' whether included
+                  or not (as Chroma does), one list of results per query.
+                  The results of a query are a plain list, never an array.
+        """
+        pass
+
+    @staticmethod
+    def match_ranks(ranked_sources: list[list[str]],
+                    sources: list[list[str]],
+                    matches: int) -> np.ndarray:
+        """
+        Find, for a batch of queries, the rank at which the results reach
+        the required number of matching sources.
+
+        Args:
+            ranked_sources (list): For each query, the source filenames of
+                                   its results, best match first.
+            sources (list): For each query, the source filenames to match against.
+            matches (int): The desired number of filename matches.
+
+        Returns:
+            np.ndarray: For each query, the minimum number of results needed
+                        to get `matches` matches, or -1 when never reached.
+        """
+        ranks = np.full(len(ranked_sources), -1, dtype=np.int64)
+        # Code every given source name once; result names that are not
+        # given never match, so they are not coded
+        codes = dict()
+        for row in sources:
+            for name in row:
+                codes.setdefault(name, len(codes))
+        if len(codes) == 0:
+            return ranks
+        n_codes = len(codes)
+        given = np.array([idx * n_codes + codes[name]
+                          for idx, row in enumerate(sources) for name in row],
+                         dtype=np.int64)
+
+        # The results of every query, flattened, with the query of each
+        lengths = np.array([len(row) for row in ranked_sources], dtype=np.int64)
+        rows = np.repeat(np.arange(len(ranked_sources)), lengths)
+        ranked = np.fromiter((codes.get(name, -1) for row in ranked_sources for name in row),
+                             dtype=np.int64, count=int(lengths.sum()))
+        hits = (ranked >= 0) & np.isin(rows * n_codes + ranked, given)
+
+        # The number of hits of its query up to each result, then the first
+        # result of each query that reaches the matches
+        starts = np.cumsum(lengths) - lengths
+        counts = np.cumsum(hits)
+        counts -= np.concatenate([[0], counts])[starts][rows]
+        reached = np.flatnonzero(counts >= matches)
+        first_rows, first = np.unique(rows[reached], return_index=True)
+        ranks[first_rows] = reached[first] - starts[first_rows] + 1
+        return ranks
+
+    def rank_sources(self,
+                     query_texts: list[str],
+                     sources: list[list[str]],
+                     matches: int = 1) -> np.ndarray:
+        """
+        Find the rank of the given sources in the results of each query.
+
+        The search starts with `initial_n_results` results per query and
+        doubles it for the queries that have not reached their matches
+        yet, so the cost of a query grows with the rank of its answer
+        rather than with the size of the collection.
+
+        When a search cannot return the whole store (see `get_max_n`), a
+        query not resolved by the deepest search gets a censored rank, one
+        past the results it searched, and is counted in `truncated`.
+
+        A chunk stored once for several files (see `add_data`) counts as
+        one result per file it occurs in, so the ranks are those of a store
+        holding every copy. Repeated query texts are only embedded and
+        searched once.
+
+        The cost of each query is recorded in the 'query cost' latencies of
+        `timer` as the work spent on it alone: its share of the embedding
+        of the batch, plus, for every round it took part in, that round's
+        search time divided over the queries it served. Being amortized,
+        it is the same for the queries resolved in the same round. The
+        latency of a query on its own is recorded in the 'query' latencies
+        from a sample of at most `LATENCY_SAMPLE` distinct queries, each
+        embedded and searched alone to the depth its rank needed.
+
+        Args:
+            query_texts (list): The query texts.
+            sources (list): For each query, the source filenames to match against.
+            matches (int): The desired number of filename matches.
+
+        Returns:
+            np.ndarray: For each query, the minimum number of results needed
+                        to get `matches` matches, or -1 when never reached.
+        """
+        ranks = np.full(len(query_texts), -1, dtype=np.int64)
+        max_n = self.get_max_n()
+        truncates = max_n < self.get_size()
+        if len(query_texts) == 0 or max_n == 0:
+            return ranks
+
+        start = time.perf_counter()
+        position = dict()
+        inverse = np.array([position.setdefault(text, len(position))
+                            for text in query_texts])
+        query_embeddings = self.embed_texts(list(position))
+        # Seconds spent on each query, the embedding shared by all of them
+        costs = np.full(len(query_texts),
+                        (time.perf_counter() - start) / len(query_texts))
+        id_sources = self.manifest.id_sources() if self.manifest is not None else dict()
+        pending = np.arange(len(query_texts))
+        n_results = min(self.initial_n_results, max_n)
+        while True:
+            round_start = time.perf_counter()
+            searched = np.unique(inverse[pending])
+            output = self.search(query_embeddings=query_embeddings[searched],
+                                 n_results=n_results,
+                                 include=['metadatas'])
+            ranked_sources = [[os.path.basename(path)
+                               for chunk_id, metadata in zip(ids, metadatas)
+                               for path in id_sources.get(chunk_id, [metadata['source']])]
+                              for ids, metadatas in zip(output['ids'], output['metadatas'])]
+            rows = np.searchsorted(searched, inverse[pending])
+            found = BaseVectorstore.match_ranks(
+                ranked_sources=[ranked_sources[row] for row in rows],
+                sources=[sources[idx] for idx in pending],
+                matches=matches)
+            if truncates and n_results == max_n:
+                censored = found == -1
+                found[censored] = [len(ranked_sources[row]) + 1 for row in rows[censored]]
+                self.truncated += int(censored.sum())
+            ranks[pending] = found
+            resolved = (found != -1) | (n_results == max_n)
+            costs[pending] += (time.perf_counter() - round_start) / len(pending)
+            self.timer.add_latencies('query cost', costs[pending[resolved]].tolist())
+            pending = pending[~resolved]
+            if len(pending) == 0:
+                self.timer.add('query', seconds=time.perf_counter() - start,
+                               items=len(query_texts))
+                break
+            n_results = min(n_results * 2, max_n)
+
+        # Time a few queries alone, as a user would send them
+        sample = list(position)[:self.LATENCY_SAMPLE]
+        depths = dict(zip(query_texts, ranks.tolist()))
+        latencies = []
+        for text in sample:
+            n_results = min(max(depths[text], self.initial_n_results), max_n)
+            query_start = time.perf_counter()
+            self.search(query_embeddings=self.embedding.from_texts([text]),
+                        n_results=n_results,
+                        include=['metadatas'])
+            latencies.append(time.perf_counter() - query_start)
+        self.timer.add_latencies('query', latencies)
+        return ranks
+
+    def rank_of_source(self,
+                       query_text: str,
+                       source: str,
+                       matches: int = 1) -> int:
+        """
+        Find the exact rank of a target source in the results of a query.
+
+        Args:
+            query_text (str): The query text.
+            source (str): The source filename to look for.
+            matches (int): The number of chunks of the source to reach.
+
+        Returns:
+            int: The minimum number of results needed to get `matches`
+                 chunks of `source`, or -1 when never reached.
+        """
+        return int(self.rank_sources(query_texts=[query_text],
+                                     sources=[[source]],
+                                     matches=matches)[0])
+
+    def get_size(self) -> int:
+        """
+        Get the number of chunks in the store, more than `get_max_n` when
+        a search cannot return all of them.
+        """
+        return self.get_max_n()
+
+    def get_index_size(self) -> int | None:
+        """
+        Get the size of the persisted index, in bytes, or None when the
+        store does not know it (e.g. the index lives on a server).
+        """
+        return None
+
+    @staticmethod
+    def directory_size(directory: str) -> int:
+        """
+        Get the total size of the files under a directory, in bytes.
+        """
+        size = 0
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                size += os.path.getsize(os.path.join(root, file_name))
+        return size
+
     @abstractmethod
     def get_available_strategies(self) -> list[str]:
         pass
@@ -114,12 +912,18 @@ class Test(BaseVectorstore):
         super().__init__(embedding=embedding,
                          strategy=strategy)
 
-    def add_data(self, data_directory: str):
-        return super().add_data(data_directory)
+    def _insert(self, ids, embeddings, metadatas, documents):
+        return super()._insert(ids, embeddings, metadatas, documents)
+
+    def _delete(self, ids):
+        return super()._delete(ids)
     
     def query(self, query_text: str, n_results: int):
         return super().query(query_text, n_results)
     
+    def search(self, query_embeddings, n_results, include):
+        return super().search(query_embeddings, n_results, include)
+
     def get_available_strategies(self):
         return super().get_available_strategies()
     
@@ -0,0 +1,219 @@
+import csv
+import codecs
+import json
+import mmap
+import os
+from typing import Callable, Iterator
+
+
+# Files at least this large are decoded from a memory map of the file
+# rather than from a copy read into memory
+MMAP_FROM = 1 << 20
+
+ENCODING = 'utf-8'
+
+# The size of the blocks a file is checked to decode in
+BLOCK_SIZE = 1 << 20
+
+# The fields holding the text of a JSON lines record, first found first
+JSONL_TEXT_KEYS = ['text', 'content', 'page_content']
+
+
+class Document(object):
+    """
+    A piece of text and its metadata, with the same fields as langchain's
+    Document, so that loading does not need to import langchain.
+
+    Attributes:
+        page_content (str): The text.
+        metadata (dict): The metadata, at least the 'source' file path.
+    """
+
+    def __init__(self,
+                 page_content: str,
+                 metadata: dict | None = None) -> None:
+        self.page_content = page_content
+        self.metadata = metadata or dict()
+
+    def __repr__(self) -> str:
+        return f"Document(page_content={self.page_content!r}, metadata={self.metadata!r})"
+
+
+# The loader of every supported file extension
+LOADERS = dict()
+
+
+def register_loader(*extensions: str):
+    """
+    Register a loader for file extensions, as a decorator.
+
+    A loader takes the path of a file and an `encoding` keyword argument,
+    and yields the documents of the file as it reads them. It is only
+    called with an encoding the whole file decodes in (see `load`). Files are loaded in worker processes, so loaders must be registered
+    when their module is imported.
+
+    Args:
+        extensions (str): The extensions, e.g. '.txt', in any case.
+    """
+    def register(loader: Callable[..., Iterator[Document]]):
+        for extension in extensions:
+            LOADERS[extension.lower()] = loader
+        return loader
+    return register
+
+
+def get_loader(file_path: str,
+               loaders: dict = LOADERS) -> Callable[..., Iterator[Document]] | None:
+    """
+    Get the loader of a file from its extension, None if unsupported.
+    """
+    return loaders.get(os.path.splitext(file_path)[1].lower())
+
+
+def read_text(file_path: str,
+              encoding: str = ENCODING) -> str:
+    """
+    Read a whole text file, with its line endings translated to '\\n' as
+    in text mode. Large files are decoded straight from a memory map.
+    """
+    with open(file_path, 'rb') as fn:
+        size = os.fstat(fn.fileno()).st_size
+        if size >= MMAP_FROM:
+            with mmap.mmap(fn.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                text = str(mapped, encoding)
+        else:
+            text = fn.read().decode(encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def decodes(file_path: str,
+            encoding: str = ENCODING) -> bool:
+    """
+    Check that a whole file decodes in an encoding, reading it in blocks
+    so that it is never held in memory.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)()
+    except LookupError:
+        return False
+    try:
+        with open(file_path, 'rb') as fn:
+            for block in iter(lambda: fn.read(BLOCK_SIZE), b''):
+                decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+@register_loader('.txt', '.md')
+def load_text(file_path: str,
+              encoding: str = ENCODING) -> Iterator[Document]:
+    """
+    Load a text file as a single document.
+    """
+    yield Document(page_content=read_text(file_path=file_path, encoding=encoding),
+                   metadata={'source': file_path})
+
+
+@register_loader('.csv')
+def load_csv(file_path: str,
+             encoding: str = ENCODING) -> Iterator[Document]:
+    """
+    Load a CSV file with a header row, one document per row, holding a
+    "column: value" line per column.
+    """
+    with open(file_path, 'r', encoding=encoding, newline='') as fn:
+        reader = csv.reader(fn)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [column.lstrip('\ufeff').strip() for column in header]
+        for row_index, row in enumerate(reader):
+            content = "\n".join(f"{column}: {value.strip()}"
+                                for column, value in zip(header, row))
+            yield Document(page_content=content,
+                           metadata={'source': file_path, 'row': row_index})
+
+
+@register_loader('.jsonl')
+def load_jsonl(file_path: str,
+               encoding: str = ENCODING) -> Iterator[Document]:
+    """
+    Load a JSON lines file, one document per record: the first text field
+    of JSONL_TEXT_KEYS of a record, or the whole record if it has none.
+
+    Raises:
+        ValueError: If a line is not valid JSON.
+    """
+    with open(file_path, 'r', encoding=encoding) as fn:
+        for line_index, line in enumerate(fn):
+            if line.strip() == "":
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                error_msg = f"Invalid JSON on line {line_index + 1} of {file_path}: {error}"
+                raise ValueError(error_msg)
+            content = line.strip()
+            if isinstance(record, dict):
+                for key in JSONL_TEXT_KEYS:
+                    if isinstance(record.get(key), str):
+                        content = record[key]
+                        break
+            yield Document(page_content=content,
+                           metadata={'source': file_path, 'line': line_index})
+
+
+class UndecodableFileError(ValueError):
+    """
+    Raised when no detected encoding decodes a file.
+    """
+
+
+def load(file_path: str,
+         loaders: dict = LOADERS) -> Iterator[Document]:
+    """
+    Load the documents of a file with the loader of its extension.
+
+    The file is read as UTF-8 if it decodes in it, otherwise in the first
+    of the encodings detected from its content, the most likely first, as
+    langchain's TextLoader(autodetect_encoding=True) does. The encoding is
+    checked on the whole file before loading it, since another encoding
+    may split its rows or lines differently, so that the documents are
+    yielded as the loader reads them and never twice.
+
+    Args:
+        file_path (str): The path of the file.
+        loaders (dict): The loader of every supported extension.
+
+    Yields:
+        Document: The documents of the file.
+
+    Raises:
+        ValueError: If the extension is unsupported.
+        UndecodableFileError: If no detected encoding decodes the file.
+    """
+    loader = get_loader(file_path=file_path, loaders=loaders)
+    if loader is None:
+        error_msg = f'Unsupported file extension: {os.path.splitext(file_path)[1]}'
+        raise ValueError(error_msg)
+    if decodes(file_path=file_path):
+        yield from loader(file_path)
+        return
+
+    # langchain is slow to import, so it is only loaded for such files
+    from langchain.document_loaders.helpers import detect_file_encodings
+    try:
+        encodings = [detected.encoding for detected in detect_file_encodings(file_path)]
+    except RuntimeError:
+        # Raised when no encoding could be detected at all
+        encodings = []
+    for encoding in encodings:
+        if decodes(file_path=file_path, encoding=encoding):
+            yield from loader(file_path, encoding=encoding)
+            return
+    error_msg = f'Could not decode {file_path} with any detected encoding'
+    raise UndecodableFileError(error_msg)
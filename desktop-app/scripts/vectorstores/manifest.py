@@ -0,0 +1,196 @@
+import os
+import json
+import hashlib
+
+
+class IndexManifest(object):
+    """
+    A manifest of the files indexed by a vector store.
+
+    Every indexed file is recorded with its size, modification time and
+    content hash, together with the ids of the chunks it produced. Comparing
+    a directory against the manifest tells which files are new, changed or
+    removed, so a store only has to re-index the difference.
+
+    Chunks are deduplicated by content: `chunks` maps the content hash of
+    every stored chunk to its id, and a chunk found in several files (or
+    several times in a file) is stored once, its id listed under every
+    file, once per occurrence.
+
+    Attributes:
+        path (str): Path of the manifest JSON file.
+        config (dict): The index configuration the manifest belongs to.
+        reusable (bool): Whether an index built with the same configuration
+                         was found, so that its entries can be reused.
+        entries (dict): Mapping of file path to its recorded state.
+        chunks (dict): Mapping of the content hash of each stored chunk to its id.
+
+    Methods:
+        __init__: Load the manifest, discarding it if the configuration changed.
+        hash_file: Get the content hash of a file.
+        diff: Compare file paths against the manifest.
+        pop: Forget files and return the ids of the chunks only they used.
+        track: Record the current state and chunk ids of a file.
+        id_sources: Get the files each chunk occurs in.
+        clear: Forget every file.
+        save: Write the manifest to disk.
+    """
+
+    def __init__(self,
+                 path: str,
+                 config: dict
+                 ) -> None:
+        """
+        Load the manifest, discarding it if the configuration changed.
+
+        Args:
+            path (str): Path of the manifest JSON file.
+            config (dict): The index configuration (strategy, index
+                           parameters, ...) the manifest belongs to.
+        """
+        self.path = path
+        self.config = config
+        self.entries = dict()
+        self.chunks = dict()
+        self.reusable = False
+        self._id_sources = None
+        if os.path.exists(path):
+            with open(file=path, mode='r') as fn:
+                contents = json.load(fn)
+            if contents.get('config') == config:
+                self.entries = contents['files']
+                self.chunks = contents.get('chunks', dict())
+                self.reusable = True
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        """
+        Get the content hash of a file.
+
+        Args:
+            file_path (str): The path of the file.
+
+        Returns:
+            str: The hex sha256 digest of the file contents.
+        """
+        with open(file=file_path, mode='rb') as fn:
+            return hashlib.file_digest(fn, 'sha256').hexdigest()
+
+    def diff(self,
+             file_paths: list[str]
+             ) -> tuple[list[str], list[str], list[str]]:
+        """
+        Compare file paths against the manifest.
+
+        Files whose size and modification time are unchanged are considered
+        unchanged without being read. Otherwise the content hash decides, so
+        touching a file does not trigger re-indexing.
+
+        Args:
+            file_paths (list): The files currently in the data directory.
+
+        Returns:
+            tuple: The new, changed and removed file paths.
+        """
+        added, changed = [], []
+        for path in file_paths:
+            entry = self.entries.get(path)
+            if entry is None:
+                added.append(path)
+                continue
+            stat = os.stat(path)
+            if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                continue
+            if entry['hash'] == IndexManifest.hash_file(path):
+                entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime_ns
+                continue
+            changed.append(path)
+
+        current = set(file_paths)
+        removed = [path for path in self.entries if path not in current]
+        return added, changed, removed
+
+    def pop(self,
+            file_paths: list[str]
+            ) -> list[str]:
+        """
+        Forget files and return the ids of the chunks only they used.
+
+        Args:
+            file_paths (list): The files to forget.
+
+        Returns:
+            list: The ids of the chunks the files had produced that no
+                  remaining file produces, i.e. the chunks to delete.
+        """
+        ids = dict()
+        for path in file_paths:
+            entry = self.entries.pop(path, None)
+            if entry is not None:
+                ids.update(dict.fromkeys(entry['ids']))
+        if len(ids) == 0:
+            return []
+        self._id_sources = None
+        for entry in self.entries.values():
+            for chunk_id in entry['ids']:
+                ids.pop(chunk_id, None)
+        self.chunks = {key: chunk_id for key, chunk_id in self.chunks.items()
+                       if chunk_id not in ids}
+        return list(ids)
+
+    def track(self,
+              file_path: str,
+              ids: list[str]
+              ) -> None:
+        """
+        Record the current state and chunk ids of a file.
+
+        Args:
+            file_path (str): The indexed file.
+            ids (list): The ids of the chunks the file produced.
+        """
+        stat = os.stat(file_path)
+        self.entries[file_path] = {'size': stat.st_size,
+                                   'mtime': stat.st_mtime_ns,
+                                   'hash': IndexManifest.hash_file(file_path),
+                                   'ids': ids}
+        self._id_sources = None
+
+    def id_sources(self) -> dict[str, list[str]]:
+        """
+        Get the files each chunk occurs in.
+
+        Returns:
+            dict: Mapping of chunk id to the files it occurs in, each listed
+                  once per occurrence.
+        """
+        if self._id_sources is None:
+            id_sources = dict()
+            for path, entry in self.entries.items():
+                for chunk_id in entry['ids']:
+                    id_sources.setdefault(chunk_id, []).append(path)
+            self._id_sources = id_sources
+        return self._id_sources
+
+    def clear(self) -> None:
+        """
+        Forget every file.
+        """
+        self.entries = dict()
+        self.chunks = dict()
+        self._id_sources = None
+
+    def save(self) -> None:
+        """
+        Write the manifest to disk.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(file=tmp_path, mode='w') as fn:
+            json.dump({'config': self.config,
+                       'files': self.entries,
+                       'chunks': self.chunks}, fn)
+        # Replace atomically so an interrupted run never leaves a
+        # manifest that disagrees with the index
+        os.replace(tmp_path, self.path)
+        self.reusable = True
@@ -0,0 +1,240 @@
+import os
+import json
+import shutil
+import numpy as np
+
+
+def _open_array(path: str) -> np.ndarray:
+    # Empty arrays cannot be memory mapped
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        return np.load(path)
+
+
+class StringTable(object):
+    """
+    A read-only table of strings stored as one utf-8 blob plus offsets.
+
+    String i is blob[offsets[i]:offsets[i + 1]]. Both files are memory
+    mapped, so opening a table reads nothing and strings are only decoded
+    when accessed.
+
+    Methods:
+        __init__: Open a table.
+        write: Write a table.
+        __len__: Get the number of strings.
+        __getitem__: Get a string.
+        __iter__: Iterate over the strings.
+    """
+
+    def __init__(self,
+                 path: str
+                 ) -> None:
+        """
+        Open a table.
+
+        Args:
+            path (str): The path of the table, without extension.
+        """
+        self._offsets = _open_array(f"{path}.offsets.npy")
+        if os.path.getsize(f"{path}.bin") == 0:
+            self._blob = b''
+        else:
+            self._blob = np.memmap(f"{path}.bin", dtype=np.uint8, mode='r')
+
+    @staticmethod
+    def write(path: str,
+              strings) -> None:
+        """
+        Write a table.
+
+        Args:
+            path (str): The path of the table, without extension.
+            strings (Iterable): The strings to write.
+        """
+        offsets = [0]
+        with open(file=f"{path}.bin", mode='wb') as fn:
+            for string in strings:
+                encoded = string.encode('utf-8')
+                fn.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+        np.save(f"{path}.offsets.npy", np.array(offsets, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self,
+                    idx: int) -> str:
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class EmbeddingMatrix(object):
+    """
+    A compact on-disk format for the embeddings of a corpus.
+
+    A matrix is a directory holding:
+        - embeddings.npy: the (n, dimension) float32 or float16 matrix,
+        - ids.bin / ids.offsets.npy: the chunk ids as a string table,
+        - sources.bin / sources.offsets.npy: the distinct source paths,
+        - source_index.npy: the int32 index of each chunk's source path,
+        - documents.bin / documents.offsets.npy: the chunk texts,
+        - meta.json: the embedding model, dimension, dtype and count.
+
+    Opening a matrix memory-maps every file, so it takes milliseconds
+    whatever its size, and processes opening the same matrix share its
+    pages through the OS page cache instead of holding private copies.
+
+    Attributes:
+        VERSION (int): Version of the format.
+        directory (str): The directory of the matrix.
+        meta (dict): The contents of meta.json.
+        embeddings (np.ndarray): The memory-mapped embedding matrix.
+        ids (StringTable): The chunk ids.
+        sources (StringTable): The distinct source paths.
+        source_index (np.ndarray): The source of each chunk.
+        documents (StringTable): The chunk texts.
+        chunk_sources (Sequence): The source path of each chunk.
+
+    Methods:
+        __init__: Open a matrix.
+        exists: Check if a directory holds a matrix.
+        write: Write a matrix.
+        source: Get the source path of a chunk.
+        __len__: Get the number of chunks.
+    """
+
+    VERSION = 1
+
+    def __init__(self,
+                 directory: str
+                 ) -> None:
+        """
+        Open a matrix.
+
+        Args:
+            directory (str): The directory of the matrix.
+        """
+        self.directory = directory
+        with open(file=os.path.join(directory, 'meta.json'), mode='r') as fn:
+            self.meta = json.load(fn)
+        self.embeddings = _open_array(os.path.join(directory, 'embeddings.npy'))
+        self.ids = StringTable(os.path.join(directory, 'ids'))
+        self.sources = StringTable(os.path.join(directory, 'sources'))
+        self.source_index = _open_array(os.path.join(directory, 'source_index.npy'))
+        self.documents = StringTable(os.path.join(directory, 'documents'))
+        self.chunk_sources = _ChunkSources(self)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """
+        Check if a directory holds a matrix.
+
+        Args:
+            directory (str): The directory to check.
+
+        Returns:
+            bool: True if the directory holds a matrix, False otherwise.
+        """
+        return os.path.exists(os.path.join(directory, 'meta.json'))
+
+    @classmethod
+    def write(cls,
+              directory: str,
+              model_name: str,
+              ids: list[str],
+              embeddings: np.ndarray,
+              sources: list[str],
+              documents: list[str],
+              dtype: str = 'float32'
+              ) -> 'EmbeddingMatrix':
+        """
+        Write a matrix, replacing any matrix already in the directory.
+
+        Args:
+            directory (str): The directory of the matrix.
+            model_name (str): The name of the embedding model.
+            ids (list): The chunk ids.
+            embeddings (np.ndarray): The embeddings, one row per chunk.
+            sources (list): The source path of each chunk.
+            documents (list): The text of each chunk.
+            dtype (str): The dtype stored on disk, float32 or float16.
+
+        Returns:
+            EmbeddingMatrix: The written matrix, opened.
+        """
+        if dtype not in ('float32', 'float16'):
+            error_msg = f"{dtype} is not a supported matrix dtype"
+            raise ValueError(error_msg)
+
+        # Write next to the destination and swap it in at the end, so
+        # readers never see a half-written matrix
+        tmp_directory = f"{directory}.tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+
+        np.save(os.path.join(tmp_directory, 'embeddings.npy'),
+                np.ascontiguousarray(embeddings, dtype=dtype))
+        StringTable.write(os.path.join(tmp_directory, 'ids'), ids)
+        StringTable.write(os.path.join(tmp_directory, 'documents'), documents)
+
+        table = dict()
+        source_index = np.fromiter((table.setdefault(source, len(table))
+                                    for source in sources),
+                                   dtype=np.int32, count=len(sources))
+        StringTable.write(os.path.join(tmp_directory, 'sources'), table.keys())
+        np.save(os.path.join(tmp_directory, 'source_index.npy'), source_index)
+
+        with open(file=os.path.join(tmp_directory, 'meta.json'), mode='w') as fn:
+            json.dump({'version': cls.VERSION,
+                       'model': model_name,
+                       'dimension': int(embeddings.shape[1]),
+                       'dtype': dtype,
+                       'count': len(ids)}, fn)
+
+        old_directory = f"{directory}.old"
+        shutil.rmtree(old_directory, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory, ignore_errors=True)
+        return cls(directory)
+
+    def source(self,
+               idx: int) -> str:
+        """
+        Get the source path of a chunk.
+
+        Args:
+            idx (int): The row of the chunk.
+
+        Returns:
+            str: The source path of the chunk.
+        """
+        return self.sources[self.source_index[idx]]
+
+    def __len__(self) -> int:
+        return self.meta['count']
+
+
+class _ChunkSources(object):
+
+    def __init__(self,
+                 matrix: EmbeddingMatrix) -> None:
+        self._matrix = matrix
+
+    def __len__(self) -> int:
+        return len(self._matrix)
+
+    def __getitem__(self,
+                    idx: int) -> str:
+        return self._matrix.source(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
@@ -0,0 +1,104 @@
+import contextvars
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Iterable, Iterator
+
+
+def bounded_map(executor: Executor,
+                fn: Callable,
+                iterable: Iterable,
+                max_pending: int) -> Iterator:
+    """
+    Map `fn` over `iterable` on an executor with at most `max_pending`
+    tasks submitted but not yet consumed.
+
+    Unlike `Executor.map`, the input is consumed lazily, so neither the
+    inputs nor the finished results pile up in memory when the consumer
+    is slower than the workers. Results are yielded in input order.
+
+    Args:
+        executor (Executor): The executor running the tasks.
+        fn (Callable): The function to apply.
+        iterable (Iterable): The inputs.
+        max_pending (int): The maximum number of tasks in flight.
+
+    Yields:
+        The results of `fn`, in the order of `iterable`.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+
+class _Raised(object):
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable,
+             maxsize: int) -> Iterator:
+    """
+    Consume `iterable` on a background thread, keeping at most `maxsize`
+    items ready ahead of the consumer.
+
+    Chaining generators through `prefetch` turns them into pipeline stages
+    that run at the same time, connected by bounded queues: a stage blocks
+    once `maxsize` of its items wait for the next stage, so memory stays
+    flat whatever the size of the input. Exceptions raised by the
+    producer are re-raised in the consumer.
+
+    Args:
+        iterable (Iterable): The producing stage.
+        maxsize (int): The capacity of the queue between the two stages.
+
+    Yields:
+        The items of `iterable`, in order.
+    """
+    # The producer runs in a copy of the consumer's context, so that
+    # context variables (e.g. the progress context) reach the stage
+    context = contextvars.copy_context()
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        # Give up when the consumer went away instead of blocking forever
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as error:
+            put(_Raised(error))
+
+    producer = threading.Thread(target=context.run, args=(produce,), daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Raised):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        producer.join()
@@ -0,0 +1,154 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+from embeddings.pool import resident_bytes
+
+
+_context = contextvars.ContextVar('progress_context', default={})
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def set_sink(sink: Callable[[dict], None] | None) -> None:
+    """
+    Set where progress events are sent. Events are sent one at a time,
+    whatever the thread they come from.
+
+    Args:
+        sink (Callable): Called with every progress event, or None to drop
+                         the events.
+    """
+    global _sink
+    with _sink_lock:
+        _sink = sink
+
+
+@contextmanager
+def progress_context(**fields):
+    """
+    Add fields to the progress events sent from the current context, e.g.
+    the model, store and strategy of the running benchmark. Pipeline stages
+    started by `prefetch` inherit the fields.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class Progress(object):
+    """
+    Reports the progress of a stage as events of the form
+
+        {"event": "progress", "stage": ..., "done": ..., "total": ...,
+         "rate": ..., "eta": ..., "rss": ...}
+
+    where rate is in items per second since the stage started, eta in
+    seconds (None while the total is unknown) and rss the resident memory
+    of the process in bytes. The fields of `progress_context` are added.
+
+    Events are throttled to one per `interval` seconds; the first and the
+    last one are always sent. Nothing is done while no sink is set, and
+    the tqdm bars on stderr are left as they are.
+
+    Attributes:
+        INTERVAL (float): Default minimum time between two events.
+        stage (str): The name of the stage.
+        total (int): The number of items of the stage, None if unknown.
+        done (int): The number of items done.
+
+    Methods:
+        __init__: Start reporting a stage.
+        update: Add done items.
+        set_total: Set the number of items of the stage.
+        close: Send the last event of the stage.
+    """
+
+    INTERVAL = 0.5
+
+    def __init__(self,
+                 stage: str,
+                 total: int | None = None,
+                 interval: float = INTERVAL) -> None:
+        """
+        Start reporting a stage.
+
+        Args:
+            stage (str): The name of the stage, as in StageTimer.STAGES.
+            total (int): The number of items of the stage, None if unknown.
+            interval (float): Minimum time between two events.
+        """
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self._interval = interval
+        self._context = _context.get()
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._last = None
+        self._send(force=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def update(self,
+               n: int = 1) -> None:
+        """
+        Add done items.
+
+        Args:
+            n (int): The number of items just done.
+        """
+        with self._lock:
+            self.done += n
+        self._send(force=self.done == self.total)
+
+    def set_total(self,
+                  total: int) -> None:
+        """
+        Set the number of items of the stage, once it is known.
+
+        Args:
+            total (int): The number of items of the stage.
+        """
+        with self._lock:
+            self.total = total
+
+    def close(self) -> None:
+        """
+        Send the last event of the stage, unless it was already sent.
+        """
+        if self._last is None or self._last[1] != self.done:
+            self._send(force=True)
+
+    def _send(self,
+              force: bool = False) -> None:
+        sink = _sink
+        if sink is None:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if not force and self._last is not None and now - self._last[0] < self._interval:
+                return
+            self._last = (now, self.done)
+            elapsed = now - self._start
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if self.total is not None and rate > 0:
+                eta = round(max(0, self.total - self.done) / rate, 1)
+            event = {'event': 'progress',
+                     **self._context,
+                     'stage': self.stage,
+                     'done': self.done,
+                     'total': self.total,
+                     'rate': round(rate, 2),
+                     'eta': eta,
+                     'rss': resident_bytes()}
+        with _sink_lock:
+            sink(event)
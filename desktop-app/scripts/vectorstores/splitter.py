@@ -0,0 +1,213 @@
+import re
+from bisect import bisect_left, bisect_right
+import numpy as np
+
+
+class TextSplitter(object):
+    """
+    Splits texts into chunks of at most `chunk_size` characters that
+    overlap by up to `chunk_overlap` characters, on the same boundaries as
+    langchain's RecursiveCharacterTextSplitter (with its default, kept
+    separators).
+
+    The text is split on the first separator it contains, and the pieces
+    still longer than `chunk_size` on the next separators, recursively;
+    small pieces are then merged back into chunks. Instead of copying every
+    piece into a new string and rescanning it for separators, the positions
+    of each separator are found once per text with a single scan, pieces
+    are (start, end) ranges into the text, found by bisection, and a chunk
+    is a single slice of the text, since the pieces it joins are contiguous.
+
+    Attributes:
+        SEPARATORS (list): Default separators, most significant first.
+        chunk_size (int): Maximum number of characters of a chunk.
+        chunk_overlap (int): Maximum number of characters shared by two
+                             consecutive chunks.
+        separators (list): The separators, most significant first.
+
+    Methods:
+        __init__: Initialize the splitter.
+        split_text: Split a text into chunks.
+        split_documents: Split documents into chunk documents.
+    """
+
+    SEPARATORS = ["\n\n", "\n", " ", ""]
+
+    def __init__(self,
+                 chunk_size: int,
+                 chunk_overlap: int,
+                 separators: list[str] | None = None) -> None:
+        """
+        Initialize the splitter.
+
+        Args:
+            chunk_size (int): Maximum number of characters of a chunk.
+            chunk_overlap (int): Maximum number of characters shared by two
+                                 consecutive chunks.
+            separators (list): Literal separators, most significant first,
+                               where "" splits between characters.
+
+        Raises:
+            ValueError: If the overlap is larger than the chunk size.
+        """
+        if chunk_overlap > chunk_size:
+            error_msg = (f"Got a larger chunk overlap ({chunk_overlap}) than "
+                         f"chunk size ({chunk_size}), should be smaller.")
+            raise ValueError(error_msg)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or TextSplitter.SEPARATORS
+
+    def split_text(self,
+                   text: str) -> list[str]:
+        """
+        Split a text into chunks.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list: The chunks, in order.
+        """
+        # However it is split, a text shorter than a chunk merges back whole
+        if len(text) < self.chunk_size:
+            return [text.strip()] if text.strip() != "" else []
+        chunks = []
+        self._split(_Scanner(text), 0, len(text), 0, chunks)
+        return chunks
+
+    def _split(self,
+               scanner,
+               start: int,
+               end: int,
+               level: int,
+               chunks: list[str]) -> None:
+        # Split text[start:end] on the first separator from `level` it holds
+        separators = self.separators
+        separator, next_level = separators[-1], len(separators)
+        cuts = []
+        for idx in range(level, len(separators)):
+            if separators[idx] == "":
+                separator, next_level = "", len(separators)
+                break
+            found = scanner.matches(separators[idx], start, end)
+            if len(found) > 0:
+                separator, next_level, cuts = separators[idx], idx + 1, found
+                break
+
+        # The pieces start at each occurrence, keeping the separator, or
+        # are single characters; only the first one can be empty
+        if separator == "":
+            bounds = list(range(start, end + 1))
+        else:
+            bounds = [start, *cuts, end]
+        if len(bounds) > 1 and bounds[1] == bounds[0]:
+            bounds = bounds[1:]
+        # Pieces shorter than a chunk are merged in runs, the others split
+        # further (or kept whole once there is no separator left). numpy
+        # only pays off to find the long pieces among many pieces.
+        if len(bounds) > _Scanner.VECTORIZE_FROM:
+            long_pieces = np.flatnonzero(np.diff(np.array(bounds)) >= self.chunk_size).tolist()
+        else:
+            long_pieces = [piece for piece in range(len(bounds) - 1)
+                           if bounds[piece + 1] - bounds[piece] >= self.chunk_size]
+
+        text = scanner.text
+        run_start = 0
+        for piece in long_pieces:
+            if piece > run_start:
+                self._merge(text, bounds[run_start:piece + 1], chunks)
+            if next_level >= len(separators):
+                chunks.append(text[bounds[piece]:bounds[piece + 1]])
+            else:
+                self._split(scanner, bounds[piece], bounds[piece + 1], next_level, chunks)
+            run_start = piece + 1
+        if len(bounds) - 1 > run_start:
+            self._merge(text, bounds[run_start:], chunks)
+
+    def _merge(self,
+               text: str,
+               bounds: list[int],
+               chunks: list[str]) -> None:
+        # Merge contiguous pieces, given by their boundaries, into chunks of
+        # at most chunk_size, carrying up to chunk_overlap characters of
+        # trailing pieces over to the next chunk. Each chunk is found by
+        # bisection rather than by adding its pieces one by one.
+        last = len(bounds) - 1
+        first = 0
+        while True:
+            # The first piece that does not fit after `first`
+            stop = bisect_right(bounds, bounds[first] + self.chunk_size) - 1
+            if stop >= last:
+                break
+            chunk = text[bounds[first]:bounds[stop]].strip()
+            if chunk != "":
+                chunks.append(chunk)
+            # Drop leading pieces until at most chunk_overlap characters are
+            # left and the piece that did not fit now fits
+            first = max(first,
+                        bisect_left(bounds, bounds[stop] - self.chunk_overlap),
+                        bisect_left(bounds, bounds[stop + 1] - self.chunk_size))
+        chunk = text[bounds[first]:bounds[last]].strip()
+        if chunk != "":
+            chunks.append(chunk)
+
+    def split_documents(self,
+                        docs) -> list:
+        """
+        Split documents into chunk documents, consuming them one at a time.
+
+        Args:
+            docs (Iterable): Documents with `page_content` and `metadata`.
+
+        Returns:
+            list: Documents of the same type, one per chunk, each with a
+                  copy of the metadata of its document.
+        """
+        return [type(doc)(page_content=chunk, metadata=dict(doc.metadata))
+                for doc in docs
+                for chunk in self.split_text(doc.page_content)]
+
+
+class _Scanner(object):
+    # Finds the occurrences of separators in a text, scanning the text
+    # once per separator
+
+    VECTORIZE_FROM = 4096
+
+    def __init__(self,
+                 text: str) -> None:
+        self.text = text
+        self._codes = None
+        self._positions = dict()
+
+    def _scan(self,
+              separator: str,
+              start: int,
+              end: int) -> list[int]:
+        # The starts of the non-overlapping occurrences of a separator in
+        # text[start:end], leftmost first, as re.split would find them.
+        # str.count finds how many there are at C speed: a few are found
+        # by the regex engine, and many occurrences of a character by
+        # comparing the code points of the text at once.
+        count = self.text.count(separator, start, end)
+        if count < _Scanner.VECTORIZE_FROM or len(separator) > 1:
+            pattern = re.compile(re.escape(separator))
+            return [match.start() for match in pattern.finditer(self.text, start, end)]
+        if self._codes is None:
+            self._codes = np.frombuffer(self.text.encode('utf-32-le', 'surrogatepass'),
+                                        dtype=np.uint32)
+        return (np.flatnonzero(self._codes[start:end] == ord(separator)) + start).tolist()
+
+    def matches(self,
+                separator: str,
+                start: int,
+                end: int) -> list[int]:
+        # A scan of the whole text agrees with a scan of the range when
+        # occurrences cannot overlap, or when the range starts the text
+        if len(separator) > 1 and start != 0:
+            return self._scan(separator, start, end)
+        if separator not in self._positions:
+            self._positions[separator] = self._scan(separator, 0, len(self.text))
+        found = self._positions[separator]
+        return found[bisect_left(found, start):bisect_left(found, end - len(separator) + 1)]
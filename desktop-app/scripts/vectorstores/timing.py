@@ -0,0 +1,157 @@
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+
+class StageTimer(object):
+    """
+    Accumulates the time spent in, and the items processed by, each stage
+    of a benchmark, plus the latency of individual queries.
+
+    Stages may run concurrently (see pipeline.prefetch), so the time of
+    a stage is the time spent doing its work, and the stages of a run can
+    add up to more than its wall time.
+
+    Attributes:
+        STAGES (list): The stages of a benchmark, in pipeline order.
+        PERCENTILES (list): The reported latency percentiles.
+
+    Methods:
+        __init__: Initialize an empty timer.
+        stage: Time a block of code as part of a stage.
+        add: Add time and items to a stage.
+        add_latencies: Record the latencies of individual queries.
+        merge: Add the measurements of another timer.
+        summary: Get the measurements of every stage.
+        report_fields: Get the measurements as flat report fields.
+    """
+
+    STAGES = ['walk', 'load', 'split', 'embed', 'insert', 'persist', 'query']
+    PERCENTILES = [50, 95, 99]
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty timer.
+        """
+        self._lock = threading.Lock()
+        self._stages = dict()
+        self._latencies = dict()
+
+    @contextmanager
+    def stage(self,
+              name: str,
+              items: int = 0):
+        """
+        Time a block of code as part of a stage.
+
+        Args:
+            name (str): The name of the stage.
+            items (int): The number of items the block processes.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name=name,
+                     seconds=time.perf_counter() - start,
+                     items=items)
+
+    def add(self,
+            name: str,
+            seconds: float,
+            items: int = 0) -> None:
+        """
+        Add time and items to a stage.
+
+        Args:
+            name (str): The name of the stage.
+            seconds (float): The time spent.
+            items (int): The number of items processed.
+        """
+        with self._lock:
+            stage = self._stages.setdefault(name, {'seconds': 0.0, 'items': 0})
+            stage['seconds'] += seconds
+            stage['items'] += items
+
+    def add_latencies(self,
+                      name: str,
+                      seconds) -> None:
+        """
+        Record the latencies of individual queries.
+
+        Args:
+            name (str): The name of the stage.
+            seconds (Iterable): The latency of each query, in seconds.
+        """
+        with self._lock:
+            self._latencies.setdefault(name, []).extend(seconds)
+
+    def merge(self,
+              other: 'StageTimer') -> None:
+        """
+        Add the measurements of another timer.
+
+        Args:
+            other (StageTimer): The timer to merge.
+        """
+        for name, stage in other._stages.items():
+            self.add(name=name, seconds=stage['seconds'], items=stage['items'])
+        for name, latencies in other._latencies.items():
+            self.add_latencies(name=name, seconds=latencies)
+
+    def summary(self) -> dict:
+        """
+        Get the measurements of every stage.
+
+        Returns:
+            dict: For each stage, its time in seconds, its number of items,
+                  its items per second and, for stages with latencies,
+                  the p50/p95/p99 latency in milliseconds.
+        """
+        with self._lock:
+            names = sorted(set(self._stages) | set(self._latencies),
+                           key=lambda name: (StageTimer.STAGES.index(name)
+                                             if name in StageTimer.STAGES
+                                             else len(StageTimer.STAGES), name))
+            summary = dict()
+            for name in names:
+                stage = self._stages.get(name, {'seconds': 0.0, 'items': 0})
+                seconds = stage['seconds']
+                summary[name] = {'seconds': round(seconds, 3),
+                                 'items': stage['items'],
+                                 'items_per_second': (round(stage['items'] / seconds, 2)
+                                                      if seconds > 0 else 0.0)}
+                latencies = self._latencies.get(name)
+                if latencies:
+                    values = np.percentile(np.array(latencies) * 1000,
+                                           StageTimer.PERCENTILES)
+                    for percentile, value in zip(StageTimer.PERCENTILES, values):
+                        summary[name][f'p{percentile}_ms'] = round(float(value), 3)
+        return summary
+
+    def report_fields(self) -> dict[str, float]:
+        """
+        Get the measurements as flat report fields, e.g. 'Embed s',
+        'Embed items/s' and 'Query p95 ms'.
+
+        Returns:
+            dict: The report fields.
+        """
+        fields = dict()
+        with self._lock:
+            timed = set(self._stages)
+        for name, stage in self.summary().items():
+            title = name.capitalize()
+            if name not in timed:
+                # Only latencies were recorded, e.g. 'query cost'
+                for percentile in StageTimer.PERCENTILES:
+                    fields[f'{title} p{percentile} ms'] = stage[f'p{percentile}_ms']
+                continue
+            fields[f'{title} s'] = stage['seconds']
+            if stage['items'] > 0:
+                fields[f'{title} items/s'] = stage['items_per_second']
+            for percentile in StageTimer.PERCENTILES:
+                if f'p{percentile}_ms' in stage:
+                    fields[f'{title} p{percentile} ms'] = stage[f'p{percentile}_ms']
+        return fields
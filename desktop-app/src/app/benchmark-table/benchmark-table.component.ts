@@ -1,4 +1,4 @@
-import { Component, ChangeDetectorRef } from '@angular/core';
+import { Component, ChangeDetectorRef, OnInit, OnDestroy } from '@angular/core';
 import { ViewChild } from '@angular/core';
 import { MatTable } from '@angular/material/table';
 import { BenchmarkDisabledService } from '../benchmark-disabled.service';
@@ -10,7 +10,7 @@ declare var window: any;
   templateUrl: './benchmark-table.component.html',
   styleUrls: ['./benchmark-table.component.css'],
 })
-export class BenchmarkTableComponent {
+export class BenchmarkTableComponent implements OnInit, OnDestroy {
   //Columns to display in the table
   displayedColumns: string[] = [
     'Embedding Model',
@@ -39,6 +39,9 @@ export class BenchmarkTableComponent {
 
   benchmarkDisabled = false;
 
+  // Latest progress event of the running benchmark
+  progress: any = null;
+
   constructor(
     private cdr: ChangeDetectorRef,
     private benchmarkDisabledService: BenchmarkDisabledService
@@ -51,20 +54,90 @@ export class BenchmarkTableComponent {
     );
   }
   ngOnInit() {
-    // Receiving benchmark data from python script
-    window.electron.onBenchmarkData((message: any) => {
+    // Receiving live progress of the running benchmark
+    window.electron.onBenchmarkProgress((message: any) => {
+      this.progress = JSON.parse(message);
+      this.cdr.detectChanges();
+    });
+
+    // The benchmark failed: re-enable the form and show why
+    window.electron.onBenchmarkError((error: any) => {
       this.benchmarkDisabledService.setBenchmarkDisabled(false);
+      this.progress = null;
+      this.cdr.detectChanges();
+      new window.Notification('Benchmark Failed', {
+        body: `${error}`,
+      });
+    });
+
+    // Receiving benchmark data from python script, one row per
+    // combination as soon as it is done
+    window.electron.onBenchmarkData((message: any) => {
       let data = JSON.parse(message);
-      console.log(data[0]);
-      this.dataSource.push(data[0]);
+      console.log(data);
+      this.dataSource = [...this.dataSource, ...data];
+      this.addColumns(data);
+      this.cdr.detectChanges();
+      //Ensure table is updated
+      this.table?.renderRows();
+      this.cdr.detectChanges();
+    });
+
+    // Every combination of the benchmark is done
+    window.electron.onBenchmarkDone(() => {
+      this.benchmarkDisabledService.setBenchmarkDisabled(false);
+      this.progress = null;
       this.cdr.detectChanges();
-      console.log(this.dataSource);
       new window.Notification('Benchmark Finished', {
         body: `Benchmark results can now be seen in the app. `,
       });
-      //Ensure table is updated
-      this.table.renderRows();
-      this.cdr.detectChanges();
     });
   }
+
+  ngOnDestroy() {
+    window.electron.removeBenchmarkProgressListener();
+    window.electron.removeBenchmarkDoneListener();
+  }
+
+  // Show every field the reports carry beyond the default columns, e.g.
+  // 'Store Options', 'Chunk Size' or the stage timings, in the order they
+  // first appear, so that the rows of a matrix can be told apart
+  addColumns(rows: any[]) {
+    for (let row of rows) {
+      for (let column of Object.keys(row)) {
+        if (!this.displayedColumns.includes(column)) {
+          this.displayedColumns = [...this.displayedColumns, column];
+        }
+      }
+    }
+  }
+
+  formatCell(value: any): string {
+    if (value === undefined || value === null) {
+      return '';
+    }
+    return typeof value === 'object' ? JSON.stringify(value) : `${value}`;
+  }
+
+  formatProgress(progress: any): string {
+    let parts = [progress.stage];
+    if (progress.model) {
+      parts.unshift(
+        [progress.model, progress.store, progress.strategy]
+          .filter((field) => field)
+          .join(' / ')
+      );
+    }
+    parts.push(
+      progress.total === null
+        ? `${progress.done}`
+        : `${progress.done}/${progress.total}`
+    );
+    parts.push(`${progress.rate}/s`);
+    if (progress.eta !== null) {
+      parts.push(`ETA ${Math.round(progress.eta)}s`);
+    }
+    parts.push(`${Math.round(progress.rss / 1024 ** 2)} MB`);
+    return parts.join(' · ');
+  }
 }
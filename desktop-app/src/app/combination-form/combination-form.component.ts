@@ -22,14 +22,30 @@ export class DirSelectorComponent {
     // 'text-embedding-ada-002',
     'google/bert_uncased_L-12_H-768_A-12',
     'all-MiniLM-L6-v2',
+    'all-MiniLM-L6-v2@onnx',
+    'all-MiniLM-L6-v2@onnx-int8',
     'allenai/scibert_scivocab_uncased',
     'emilyalsentzer/Bio_ClinicalBERT',
   ];
-  strategies: string[] = ['l2', 'cosine', 'ip'];
-
-  selectedModel = '';
-  selectedStrategy = '';
-
+  stores: string[] = ['Chroma', 'Milvus', 'Numpy'];
+  // The SEARCH_STRATEGIES of each store
+  storeStrategies: { [store: string]: string[] } = {
+    Chroma: ['l2', 'cosine', 'ip'],
+    Milvus: ['l2', 'ip'],
+    Numpy: ['l2', 'cosine', 'ip'],
+  };
+
+  // Several models, strategies or stores benchmark every combination,
+  // each streamed back as its own row
+  selectedModels: string[] = [];
+  selectedStrategies: string[] = [];
+  selectedStores: string[] = ['Chroma'];
+
+  // Comma-separated values, every size combined with every smaller overlap
+  chunkSizes = '750';
+  chunkOverlaps = '100';
+  // Optional grid of store options, e.g. {"hnsw_m": [16, 32]}
+  storeSweep = '';
 
   selectedPath: string = '';
 
@@ -63,13 +79,85 @@ export class DirSelectorComponent {
     );
   }
 
+  // Only the strategies every selected store supports are offered
+  strategies() {
+    return this.selectedStores.reduce(
+      (strategies, store) =>
+        strategies.filter((strategy) =>
+          this.storeStrategies[store].includes(strategy)
+        ),
+      ['l2', 'cosine', 'ip']
+    );
+  }
+
+  selectStores(stores: string[]) {
+    this.selectedStores = stores;
+    let strategies = this.strategies();
+    this.selectedStrategies = this.selectedStrategies.filter((strategy) =>
+      strategies.includes(strategy)
+    );
+  }
+
+  parseNumbers(text: string): number[] {
+    return text
+      .split(',')
+      .map((value) => value.trim())
+      .filter((value) => value != '')
+      .map(Number);
+  }
+
+  parseSweep(): any {
+    try {
+      return this.storeSweep.trim() == '' ? null : JSON.parse(this.storeSweep);
+    } catch {
+      return undefined;
+    }
+  }
+
+  settingsAreValid() {
+    let sizes = this.parseNumbers(this.chunkSizes);
+    let overlaps = this.parseNumbers(this.chunkOverlaps);
+    return (
+      sizes.length > 0 &&
+      overlaps.length > 0 &&
+      sizes.every((size) => Number.isInteger(size) && size > 0) &&
+      overlaps.every((overlap) => Number.isInteger(overlap) && overlap >= 0) &&
+      overlaps.some((overlap) => sizes.some((size) => overlap < size)) &&
+      this.parseSweep() !== undefined
+    );
+  }
+
   formIsEmpty() {
     return (
-      this.selectedModel == '' ||
-      this.selectedStrategy == '' ||
+      this.selectedModels.length == 0 ||
+      this.selectedStrategies.length == 0 ||
+      this.selectedStores.length == 0 ||
+      !this.settingsAreValid() ||
       this.lines.some((line) => line.query == '' || line.source == '')
     );
   }
+
+  // A single value benchmarks one combination, a list every combination
+  scalarOrList(values: any[]) {
+    return values.length == 1 ? values[0] : values;
+  }
+
+  buildRequest() {
+    let request: any = {
+      selectedModel: this.scalarOrList(this.selectedModels),
+      selectedStrategy: this.scalarOrList(this.selectedStrategies),
+      selectedStore: this.scalarOrList(this.selectedStores),
+      selectedPath: this.selectedPath,
+      lines: this.lines,
+      chunkSize: this.scalarOrList(this.parseNumbers(this.chunkSizes)),
+      chunkOverlap: this.scalarOrList(this.parseNumbers(this.chunkOverlaps)),
+    };
+    let sweep = this.parseSweep();
+    if (sweep) {
+      request.storeSweep = sweep;
+    }
+    return request;
+  }
   openDirectory() {
     window.electron.openDirectory();
   }
@@ -81,15 +169,11 @@ export class DirSelectorComponent {
   startBenchmark() {
     new window.Notification('Benchmark Started', {
       body: `Path: "${this.selectedPath}"
-      Model: "${this.selectedModel}"
-      Strategy: "${this.selectedStrategy}"   `,
+      Models: "${this.selectedModels.join(', ')}"
+      Strategies: "${this.selectedStrategies.join(', ')}"
+      Stores: "${this.selectedStores.join(', ')}"   `,
     });
-    window.electron.startBenchmark(
-      this.selectedModel,
-      this.selectedStrategy,
-      this.selectedPath,
-      this.lines
-    );
+    window.electron.startBenchmark(this.buildRequest());
     this.benchmarkDisabledService.setBenchmarkDisabled(true);
     this.cdr.detectChanges();
     console.log('DISABLED TEST', this.benchmarkDisabled);
@@ -104,6 +188,20 @@ export class DirSelectorComponent {
     console.log('PATH', source, path, index);
   }
 
+  hasSources() {
+    return this.lines.some((line) => line.source != '');
+  }
+
+  //Send every line with a source to python script to generate queries at once
+  generateAllQueries() {
+    let indices = this.lines
+      .map((line, index) => index)
+      .filter((index) => this.lines[index].source != '');
+    let sources = indices.map((index) => this.lines[index].source);
+    window.electron.generateQueries(this.selectedPath, sources, indices);
+    indices.forEach((index) => (this.lines[index].queryDisabled = true));
+  }
+
   ngOnInit() {
     //Directory is selected
     window.electron.onDirectorySelected((path: any) => {
@@ -133,5 +231,6 @@ export class DirSelectorComponent {
     window.electron.removeDirectorySelectedListener();
     window.electron.removeDirectoryFilesListener();
     window.electron.removeBenchmarkDataListener();
+    window.electron.removeBenchmarkErrorListener();
   }
 }